@@ -24,11 +24,19 @@ Search a string for all occurrences::
 
 from __future__ import absolute_import
 
+import codecs
+import gc
+import mmap
+import os
+import struct
 import sys
+import threading
+from itertools import chain
 IS_PY3 = sys.version_info[0] >= 3
 
 if IS_PY3:
     unicode = str
+    unichr = chr
 
 FILE_BUFFER_SIZE = 32 * 1024
 
@@ -40,8 +48,18 @@ class PyAcora(object):
     search engine.
     """
     transitions = None
+    values = None
+    report = 'keyword'
+    encoding = None
+    offsets = 'bytes'
+    _match_objects = None  # maps the keywords to the reported objects unless reporting keywords
+    _character_lengths = None  # maps the keywords to their length in characters for character offsets
 
-    def __init__(self, machine, transitions=None):
+    def __init__(self, machine, transitions=None, layout=None, values=None, report='keyword',
+                 encoding=None, offsets='bytes'):
+        # 'layout' is accepted for compatibility with the C engines and ignored
+        _check_report(report)
+        encoding = _check_encoding(encoding, offsets)
         if transitions is not None:
             # old style format
             start_state = machine
@@ -55,13 +73,21 @@ class PyAcora(object):
             self.transitions = transitions = {}
 
             child_states = machine.child_states
+            # byte data only ignores the case of ASCII letters
+            ascii_case = False
+            if ignore_case:
+                for state in child_states:
+                    if state.matches:
+                        ascii_case = isinstance(state.matches[0], bytes)
+                        break
+
             child_targets = {}
             state_matches = {}
             needs_bytes_conversion = None
             for state in child_states:
                 state_id = state.id
                 child_targets[state_id], state_matches[state_id] = (
-                    _merge_targets(state, ignore_case))
+                    _merge_targets(state, ignore_case, ascii_case))
                 if needs_bytes_conversion is None and state_matches[state_id]:
                     if IS_PY3:
                         needs_bytes_conversion = any(
@@ -87,7 +113,7 @@ class PyAcora(object):
             get_matches = state_matches.get
 
             state_id = start_state.id
-            for ch, child in _merge_targets(start_state, ignore_case)[0].items():
+            for ch, child in _merge_targets(start_state, ignore_case, ascii_case)[0].items():
                 child_id = child.id
                 if convert is not None:
                     ch = convert(ch)
@@ -102,12 +128,111 @@ class PyAcora(object):
                     transitions[(state_id, ch)] = (child_id, get_matches(child_id))
 
         self.start_state = start_state.id
+        self.keywords = tuple(sorted(set(
+            keyword for _, matches in self.transitions.values() if matches
+            for keyword in matches)))
+        self._init_report(values, report, encoding, offsets)
+
+    def _init_report(self, values, report, encoding=None, offsets='bytes'):
+        # the keywords of the automaton are searched, the text keywords are reported
+        self.report = report
+        self.encoding = encoding
+        self.offsets = offsets
+        self._search_keywords = search_keywords = self.keywords
+        if encoding is not None:
+            self.keywords = tuple([keyword.decode(encoding) for keyword in search_keywords])
+            if offsets == 'characters':
+                self._character_lengths = dict(zip(
+                    search_keywords, [len(keyword) for keyword in self.keywords]))
+        if values is not None:
+            self.values = tuple([values.get(keyword) for keyword in self.keywords])
+        if report == 'id':
+            objects = range(len(self.keywords))
+        elif report == 'value':
+            objects = self.values or (None,) * len(self.keywords)
+        elif encoding is not None:
+            objects = self.keywords
+        else:
+            return
+        self._match_objects = dict(zip(search_keywords, objects))
+
+    def _to_character_offsets(self, matches, s):
+        if self._character_lengths is None:
+            return matches
+        return list(_character_offsets(matches, s, self._character_lengths))
+
+    def _report_matches(self, matches):
+        match_objects = self._match_objects
+        if match_objects is None:
+            return matches
+        return [(match_objects[keyword], pos) for keyword, pos in matches]
+
+    def stats(self):
+        """Return a dict with statistics about the automaton and its memory usage.
 
-    def finditer(self, s):
+        See ``UnicodeAcora.stats()``.  The ``python_size`` includes the
+        transition dict, the ``native_size`` is always 0.
+        """
+        state_fanout = {self.start_state: 0}
+        for (state_id, _), (target_id, _) in self.transitions.items():
+            state_fanout[state_id] = state_fanout.get(state_id, 0) + 1
+            state_fanout.setdefault(target_id, 0)
+        fanout = {}
+        for count in state_fanout.values():
+            fanout[count] = fanout.get(count, 0) + 1
+        keywords = self.keywords
+        return {
+            'state_count': len(state_fanout),
+            'transition_count': len(self.transitions),
+            'fanout': fanout,
+            'keyword_count': len(keywords),
+            'max_keyword_length': max([len(keyword) for keyword in keywords] or [0]),
+            'native_size': 0,
+            'python_size': self._transitions_size() + sys.getsizeof(keywords) + sum(
+                [sys.getsizeof(keyword) for keyword in keywords]),
+            'image_size': 0,
+        }
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._transitions_size()
+
+    def _transitions_size(self):
+        # the transition dict with its keys and values, counting shared match lists once
+        size = sys.getsizeof(self.transitions)
+        match_lists = {}
+        for key, value in self.transitions.items():
+            size += sys.getsizeof(key) + sys.getsizeof(value)
+            if value[1] is not None:
+                match_lists[id(value[1])] = value[1]
+        return size + sum([sys.getsizeof(matches) for matches in match_lists.values()])
+
+    def finditer(self, s, mode='overlapping'):
         """Iterate over all occurrences of any keyword in the string.
 
+        The ``mode`` selects the reported matches.  "overlapping" reports
+        all of them.  The other modes report non-overlapping matches and
+        continue searching behind each reported match: "leftmost_longest"
+        picks the longest keyword at the leftmost match position,
+        "leftmost_shortest" the shortest one, and
+        "non_overlapping" the longest keyword of the match that ends first.
+        These modes search the whole string up front.
+
         Returns (keyword, offset) pairs.
         """
+        if mode != 'overlapping':
+            return iter(self.findall(s, mode))
+        matches = self._finditer(s)
+        if self._character_lengths is not None:
+            matches = _character_offsets(matches, s, self._character_lengths)
+        if self._match_objects is not None:
+            match_objects = self._match_objects
+            return ((match_objects[keyword], pos) for keyword, pos in matches)
+        return matches
+
+    def _finditer(self, s):
+        if IS_PY3 and not isinstance(s, (bytes, unicode)):
+            # any buffer object, e.g. bytearray, memoryview or mmap
+            s = memoryview(s).cast('B')
         state = self.start_state
         start_state = (state, [])
         next_state = self.transitions.get
@@ -119,12 +244,130 @@ class PyAcora(object):
                 for match in matches:
                     yield (match, pos-len(match))
 
-    def findall(self, s):
+    def findall(self, s, mode='overlapping'):
         """Find all occurrences of any keyword in the string.
 
+        See ``finditer()`` for the available match modes.
+
         Returns a list of (keyword, offset) pairs.
         """
-        return list(self.finditer(s))
+        return self._report_matches(self._to_character_offsets(
+            _select_matches(list(self._finditer(s)), mode), s))
+
+    def findall_arrays(self, s, mode='overlapping'):
+        """Find all occurrences of any keyword in the string.
+
+        Returns a pair of arrays (keyword_ids, offsets) that list the
+        matches in the same order as ``findall()``.  The keyword ids
+        are indices into the ``keywords`` tuple.
+        """
+        from array import array
+        keyword_ids = dict((keyword, i) for i, keyword in enumerate(self._search_keywords))
+        ids, offsets = array('q'), array('q')
+        for keyword, offset in self._to_character_offsets(
+                _select_matches(list(self._finditer(s)), mode), s):
+            ids.append(keyword_ids[keyword])
+            offsets.append(offset)
+        return ids, offsets
+
+    def contains(self, s):
+        """Check if the string contains any of the keywords.
+        """
+        return self.find_first(s) is not None
+
+    def find_first(self, s):
+        """Find the first match in the string, i.e. the first one that
+        ``finditer()`` would return.
+
+        Returns a (keyword, offset) pair or None.
+        """
+        for match in self._finditer(s):
+            return self._report_matches(self._to_character_offsets([match], s))[0]
+        return None
+
+    def count(self, s):
+        """Count the occurrences of all keywords in the string.
+        """
+        count = 0
+        for _ in self._finditer(s):
+            count += 1
+        return count
+
+    def count_by_keyword(self, s):
+        """Count the occurrences of each keyword in the string.
+
+        Returns a dict that maps the keywords that were found to their
+        number of occurrences.
+        """
+        counts = {}
+        for keyword, _ in self._finditer(s):
+            counts[keyword] = counts.get(keyword, 0) + 1
+        match_objects = self._match_objects
+        if match_objects is not None:
+            # several keywords can report the same value
+            keyword_counts, counts = counts, {}
+            for keyword, count in keyword_counts.items():
+                obj = match_objects[keyword]
+                counts[obj] = counts.get(obj, 0) + count
+        return counts
+
+    def findall_parallel(self, s, workers=None):
+        """Find all occurrences of any keyword in the string.
+
+        The pure Python implementation cannot search in parallel and
+        ignores the number of ``workers``.
+
+        Returns the same list of (keyword, offset) pairs as ``findall()``.
+        """
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be a positive number, got %r" % (workers,))
+        return self.findall(s)
+
+    def findall_many(self, documents):
+        """Find all occurrences of any keyword in each string of an iterable.
+
+        Returns one list of (keyword, offset) pairs per string.
+        """
+        return [self.findall(s) for s in documents]
+
+    def search_many(self, documents):
+        """Find all occurrences of any keyword in each string of an iterable.
+
+        Returns three arrays (doc_indices, keyword_ids, offsets) that
+        list the matches of all strings, ordered by their index in the
+        iterable.  The keyword ids are indices into the ``keywords``
+        tuple.
+        """
+        from array import array
+        doc_indices = array('q')
+        keyword_ids, offsets = array('q'), array('q')
+        for doc_index, s in enumerate(documents):
+            ids, doc_offsets = self.findall_arrays(s)
+            doc_indices.extend([doc_index] * len(ids))
+            keyword_ids.extend(ids)
+            offsets.extend(doc_offsets)
+        return doc_indices, keyword_ids, offsets
+
+    def stream(self):
+        """Create a scanner for searching a sequence of string chunks.
+
+        The scanner's ``feed(chunk)`` method returns the matches that end
+        in the chunk, including those that started in preceding chunks,
+        with offsets relative to the start of the stream.
+        """
+        return _PyAcoraStream(self)
+
+    def afind(self, source):
+        """Asynchronously iterate over all occurrences of any keyword in a data source.
+
+        The source can be an ``asyncio.StreamReader`` (or any object with
+        an async ``read(size)`` method) or an async iterable of chunks.
+        Requires Python 3.6 or later.
+
+        Use as ``async for keyword, offset in engine.afind(source)``.
+        """
+        from acora._aio import afind
+        return afind(self, source)
 
     def filefind(self, f):
         """Iterate over all occurrences of any keyword in a file.
@@ -140,17 +383,26 @@ class PyAcora(object):
             state = self.start_state
             start_state = (state, ())
             next_state = self.transitions.get
-            pos = 0
+            match_objects = self._match_objects
+            character_lengths = self._character_lengths
+            pos = characters = 0
             while 1:
                 data = f.read(FILE_BUFFER_SIZE)
                 if not data:
                     break
+                found = []
                 for char in data:
                     pos += 1
                     state, matches = next_state((state, char), start_state)
                     if matches:
                         for match in matches:
-                            yield (match, pos-len(match))
+                            found.append((match, pos-len(match)))
+                if character_lengths is not None:
+                    found = _character_offsets(
+                        found, data, character_lengths, pos - len(data), characters)
+                    characters += _count_characters(data)
+                for match, offset in found:
+                    yield (match if match_objects is None else match_objects[match], offset)
         finally:
             if opened:
                 f.close()
@@ -162,19 +414,390 @@ class PyAcora(object):
         """
         return list(self.filefind(f))
 
+    def save(self, f):
+        """Write the search engine to a file in a compact binary format.
+
+        ``f`` can be a file name or a binary file object.  Use ``load()``
+        to restore the engine on the same platform.  The format is shared
+        with the C engines.
+        """
+        image = _build_py_image(self)
+        if hasattr(f, 'write'):
+            f.write(image)
+        else:
+            with open(f, 'wb') as out:
+                out.write(image)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a search engine that was written by ``save()``.
+
+        The ``mmap`` option is accepted for compatibility with the C
+        engines; the Python engine always reads the file into memory.
+        """
+        with open(path, 'rb') as f:
+            image = f.read()
+        return _py_engine_from_image(cls, image)
+
+    def to_shared_memory(self, name=None):
+        """Copy the search engine into a new ``multiprocessing.shared_memory``
+        segment, from which other processes can use it with
+        ``from_shared_memory(name)``.
+
+        Returns the ``SharedMemory`` object.  The caller owns the segment
+        and must ``close()`` and ``unlink()`` it when it is no longer needed.
+        Requires Python 3.8 or later.
+        """
+        from acora._shm import image_to_shared_memory
+        return image_to_shared_memory(_build_py_image(self), name)
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """Load a search engine from a shared memory segment that was
+        created by ``to_shared_memory()``.
+
+        The Python engine copies the data and does not keep the segment mapped.
+        """
+        from acora._shm import attach_shared_memory
+        data, owner = attach_shared_memory(name)
+        return _py_engine_from_image(cls, bytes(data))
+
+
+# binary engine images, see _build_image() in _cacora.pyx
+
+_IMAGE_MAGIC = b"\x89ACORA\r\n"
+_IMAGE_VERSION = 1
+_IMAGE_BYTE_ORDER = 0x01020304
+_IMAGE_FLAG_UNICODE = 1
+_IMAGE_FLAG_IGNORE_CASE = 2
+_IMAGE_FLAG_REPORT_IDS = 8
+_IMAGE_FLAG_UTF8 = 16
+_IMAGE_FLAG_CHARACTER_OFFSETS = 32
+_IMAGE_MATCH_END = 0xFFFFFFFF
+_IMAGE_NO_MATCHES = 0xFFFFFFFFFFFFFFFF
+_IMAGE_HEADER = struct.Struct('=8s4I11Q')
+_IMAGE_NODE = struct.Struct('=QQII')
+
+
+def _image_padding(size, alignment=8):
+    return b'\0' * (-size % alignment)
+
+
+def _build_py_image(acora):
+    if acora.report == 'value':
+        raise ValueError("Search engines that report keyword values cannot be saved")
+    keywords = acora._search_keywords
+    for_unicode = bool(keywords) and isinstance(keywords[0], unicode)
+    keyword_ids = dict((keyword, i) for i, keyword in enumerate(keywords))
+
+    # number the states with the start state first
+    state_transitions = {acora.start_state: []}
+    state_matches = {}
+    for (state_id, char), (target_id, matches) in acora.transitions.items():
+        state_transitions.setdefault(state_id, []).append((char, target_id))
+        state_transitions.setdefault(target_id, [])
+        if matches:
+            state_matches[target_id] = matches
+    state_ids = sorted(state_transitions)
+    state_ids.remove(acora.start_state)
+    state_ids.insert(0, acora.start_state)
+    node_ids = dict((state_id, i) for i, state_id in enumerate(state_ids))
+
+    # the transitions of each node are a block of its target node ids, followed by its characters
+    nodes, transition_blocks, match_ids = [], [], []
+    transitions_size = 0
+    for state_id in state_ids:
+        transitions = sorted(state_transitions[state_id])
+        matches = state_matches.get(state_id)
+        nodes.append(_IMAGE_NODE.pack(
+            transitions_size, len(match_ids) if matches else _IMAGE_NO_MATCHES, len(transitions), 0))
+        characters = [ord(char) if isinstance(char, (bytes, unicode)) else char
+                      for char, _ in transitions]
+        block = struct.pack('=%dI' % len(transitions), *[
+            node_ids[target_id] for _, target_id in transitions])
+        block += struct.pack('=%d%s' % (len(characters), 'I' if for_unicode else 'B'), *characters)
+        block += _image_padding(len(block), 4)
+        transition_blocks.append(block)
+        transitions_size += len(block)
+        if matches:
+            match_ids.extend(keyword_ids[keyword] for keyword in matches)
+            match_ids.append(_IMAGE_MATCH_END)
+
+    keyword_data = [
+        keyword.encode('utf-8', 'surrogatepass') if for_unicode else keyword
+        for keyword in keywords]
+    keyword_offsets = [0]
+    for data in keyword_data:
+        keyword_offsets.append(keyword_offsets[-1] + len(data))
+
+    sections = [
+        b''.join(nodes),
+        b''.join(transition_blocks),
+        struct.pack('=%dI' % len(match_ids), *match_ids),
+        struct.pack('=%dQ' % len(keyword_offsets), *keyword_offsets),
+        b''.join(keyword_data),
+    ]
+    offsets = []
+    size = _IMAGE_HEADER.size
+    for section in sections:
+        offsets.append(size)
+        size += len(section) + len(_image_padding(len(section)))
+
+    header = _IMAGE_HEADER.pack(
+        _IMAGE_MAGIC, _IMAGE_VERSION, _IMAGE_BYTE_ORDER,
+        (_IMAGE_FLAG_UNICODE if for_unicode else 0) |
+        (_IMAGE_FLAG_REPORT_IDS if acora.report == 'id' else 0) |
+        (_IMAGE_FLAG_UTF8 if acora.encoding is not None else 0) |
+        (_IMAGE_FLAG_CHARACTER_OFFSETS if acora.offsets == 'characters' else 0),
+        4 if for_unicode else 1,
+        len(nodes), transitions_size, len(match_ids), len(keywords), keyword_offsets[-1],
+        *(offsets + [size]))
+    return header + b''.join([
+        section + _image_padding(len(section)) for section in sections])
+
+
+def _image_case_folding(letters):
+    # same as _case_folding() in _cacora.pyx: case insensitive unicode images
+    # only store the lower case transitions of the unambiguous upper case letters
+    folding = {}
+    ambiguous = set()
+    for letter in letters:
+        uc = letter.upper()
+        if uc == letter or uc in letters or len(uc) != 1:
+            continue
+        if uc in folding:
+            ambiguous.add(uc)
+        else:
+            folding[uc] = letter
+    for uc in ambiguous:
+        del folding[uc]
+    return folding
+
+
+def _py_engine_from_image(cls, image):
+    if len(image) < _IMAGE_HEADER.size or not image.startswith(_IMAGE_MAGIC):
+        raise ValueError("Not an acora engine image")
+    (_, version, byte_order, flags, char_size,
+     node_count, transitions_size, match_id_count, keyword_count, keyword_data_size,
+     nodes_offset, transitions_offset, match_ids_offset,
+     keyword_offsets_offset, keyword_data_offset, size) = _IMAGE_HEADER.unpack_from(image)
+    if version != _IMAGE_VERSION:
+        raise ValueError("Unsupported acora engine image version %d" % version)
+    if byte_order != _IMAGE_BYTE_ORDER:
+        raise ValueError("Acora engine image was written on a platform with different byte order")
+    if size > len(image):
+        raise ValueError("Corrupted acora engine image")
+    for_unicode = bool(flags & _IMAGE_FLAG_UNICODE)
+
+    keyword_offsets = struct.unpack_from('=%dQ' % (keyword_count + 1), image, keyword_offsets_offset)
+    keywords = []
+    for start, end in zip(keyword_offsets, keyword_offsets[1:]):
+        keyword = image[keyword_data_offset + start:keyword_data_offset + end]
+        keywords.append(keyword.decode('utf-8', 'surrogatepass') if for_unicode else keyword)
+    keywords = tuple(keywords)
+
+    match_ids = struct.unpack_from('=%dI' % match_id_count, image, match_ids_offset)
+
+    node_matches = []
+    node_transitions = []
+    for node_id in range(node_count):
+        first_transition, first_match, char_count, _ = _IMAGE_NODE.unpack_from(
+            image, nodes_offset + node_id * _IMAGE_NODE.size)
+        node_transitions.append((first_transition, char_count))
+        matches = None
+        if first_match != _IMAGE_NO_MATCHES:
+            matches = []
+            while match_ids[first_match] != _IMAGE_MATCH_END:
+                matches.append(keywords[match_ids[first_match]])
+                first_match += 1
+        node_matches.append(matches)
+
+    transitions = {}
+    for node_id, (block_offset, char_count) in enumerate(node_transitions):
+        block_offset += transitions_offset
+        targets = struct.unpack_from('=%dI' % char_count, image, block_offset)
+        characters = struct.unpack_from(
+            '=%d%s' % (char_count, 'I' if for_unicode else 'B'), image, block_offset + 4 * char_count)
+        for char, target_id in zip(characters, targets):
+            if for_unicode:
+                char = unichr(char)
+            elif not IS_PY3:
+                char = chr(char)
+            transitions[(node_id, char)] = (target_id, node_matches[target_id])
+
+    if for_unicode and flags & _IMAGE_FLAG_IGNORE_CASE:
+        # restore the upper case transitions that the image folds away
+        case_folding = _image_case_folding(set(char for _, char in transitions))
+        upper_case = dict((letter, uc) for uc, letter in case_folding.items())
+        for (node_id, char), target in list(transitions.items()):
+            if char in upper_case:
+                transitions[(node_id, upper_case[char])] = target
+
+    acora = cls.__new__(cls)
+    acora.transitions = transitions
+    acora.start_state = 0
+    acora.keywords = keywords
+    acora._init_report(
+        None, 'id' if flags & _IMAGE_FLAG_REPORT_IDS else 'keyword',
+        'utf-8' if flags & _IMAGE_FLAG_UTF8 else None,
+        'characters' if flags & _IMAGE_FLAG_CHARACTER_OFFSETS else 'bytes')
+    return acora
+
+
+def _check_report(report):
+    if report not in ('keyword', 'id', 'value'):
+        raise ValueError("report must be one of 'keyword', 'id' or 'value', got %r" % (report,))
+
+
+def _check_encoding(encoding, offsets):
+    if offsets not in ('bytes', 'characters'):
+        raise ValueError("offsets must be one of 'bytes' or 'characters', got %r" % (offsets,))
+    if encoding is None:
+        if offsets == 'characters':
+            raise ValueError("Character offsets require an encoding")
+        return None
+    if codecs.lookup(encoding).name != 'utf-8':
+        raise ValueError("Text keywords can only be searched in UTF-8 encoded data, got %r" % (encoding,))
+    return 'utf-8'
+
+
+_UTF8_CONTINUATION_BYTES = bytes(bytearray(range(0x80, 0xC0)))
+
+
+def _count_characters(data):
+    """Count the UTF-8 encoded characters in the data, i.e. all bytes except continuation bytes.
+    """
+    return len(bytes(data).translate(None, _UTF8_CONTINUATION_BYTES))
+
+
+def _character_offsets(matches, data, character_lengths, byte_position=0, character_position=0):
+    """Convert the byte offsets of matches that end in the UTF-8 encoded data
+    into character offsets.
+
+    The matches must be given in the order of their end.  The data starts
+    at the given byte and character position of the input.
+    """
+    if IS_PY3 and not isinstance(data, bytes):
+        data = memoryview(data).cast('B')
+    counted = 0
+    for keyword, pos in matches:
+        end = pos + len(keyword) - byte_position
+        character_position += _count_characters(data[counted:end])
+        counted = end
+        yield keyword, character_position - character_lengths[keyword]
+
+
+def _select_matches(matches, mode):
+    """Select the matches of a match mode from the overlapping matches,
+    given in the order of their end position.
+    """
+    if mode == 'overlapping':
+        return matches
+    elif mode == 'leftmost_longest':
+        matches.sort(key=lambda match: (match[1], -len(match[0])))
+    elif mode == 'leftmost_shortest':
+        matches.sort(key=lambda match: (match[1], len(match[0])))
+    elif mode != 'non_overlapping':
+        raise ValueError(
+            "mode must be one of 'overlapping', 'leftmost_longest', 'leftmost_shortest' "
+            "or 'non_overlapping', got %r" % (mode,))
+
+    # greedily select matches, in order of their start or end position
+    selected = []
+    end = 0
+    for keyword, pos in matches:
+        if pos >= end:
+            selected.append((keyword, pos))
+            end = pos + len(keyword)
+    return selected
+
+
+class _PyAcoraStream(object):
+    """Incremental search over a sequence of string chunks.
+    """
+    def __init__(self, acora):
+        self._acora = acora
+        self.reset()
+
+    def reset(self):
+        """Restart the search at the beginning of a new stream.
+        """
+        self._state = self._acora.start_state
+        self.position = 0
+        self._character_position = 0
+
+    def feed(self, s):
+        """Search the next chunk of the stream.
+
+        Returns a list of (keyword, offset) pairs.
+        """
+        if IS_PY3 and not isinstance(s, (bytes, unicode)):
+            s = memoryview(s).cast('B')
+        state = self._state
+        start_state = (self._acora.start_state, ())
+        next_state = self._acora.transitions.get
+        pos = self.position
+        found = []
+        for char in s:
+            pos += 1
+            state, matches = next_state((state, char), start_state)
+            if matches:
+                for match in matches:
+                    found.append((match, pos-len(match)))
+        character_lengths = self._acora._character_lengths
+        if character_lengths is not None:
+            found = list(_character_offsets(
+                found, s, character_lengths, self.position, self._character_position))
+            self._character_position += _count_characters(s)
+        self._state = state
+        self.position = pos
+        return self._acora._report_matches(found)
+
 
 # import from shared Python/Cython module
 from acora._acora import (
     insert_bytes_keyword, insert_unicode_keyword,
     build_trie as _build_trie, build_MachineState as _MachineState, merge_targets as _merge_targets)
 
+def _insert_keywords(builder, keywords):
+    for_unicode = builder.for_unicode
+    ignore_case = builder.ignore_case
+    keyword_set = builder.keywords
+    insert_keyword = insert_unicode_keyword if for_unicode else insert_bytes_keyword
+    for keyword in keywords:
+        if for_unicode != isinstance(keyword, unicode):
+            raise TypeError(
+                "keywords must be either bytes or unicode, not mixed (got %s)" %
+                type(keyword))
+        builder.state_counter = insert_keyword(
+            builder.tree, keyword, builder.state_counter, ignore_case)
+        if keyword_set is not None:
+            keyword_set.add(keyword)
+
+
 # import from Cython module if available
 try:
     from acora._cacora import (
-        UnicodeAcora, BytesAcora, insert_bytes_keyword, insert_unicode_keyword)
+        UnicodeAcora, BytesAcora, SkipBytesAcora, insert_bytes_keyword, insert_unicode_keyword,
+        insert_keywords as _insert_keywords)
 except ImportError:
     # C module not there ...
-    UnicodeAcora = BytesAcora = PyAcora
+    UnicodeAcora = BytesAcora = SkipBytesAcora = PyAcora
+
+
+class _GCPaused(object):
+    """Context manager that disables the cyclic garbage collector while
+    creating large numbers of trie states, which would otherwise trigger
+    frequent useless collections.
+    """
+    def __enter__(self):
+        self.was_enabled = gc.isenabled()
+        gc.disable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.was_enabled:
+            gc.enable()
 
 
 class AcoraBuilder(object):
@@ -190,8 +813,10 @@ class AcoraBuilder(object):
     ignore_case = False
 
     def __init__(self, *keywords, **kwargs):
+        keep_keywords = True
         if kwargs:
             self.ignore_case = kwargs.pop('ignore_case', False)
+            keep_keywords = kwargs.pop('keep_keywords', True)
             if kwargs:
                 raise TypeError(
                     "%s() got unexpected keyword argument %s" % (
@@ -201,11 +826,32 @@ class AcoraBuilder(object):
             keywords = keywords[0]
         self.for_unicode = None
         self.state_counter = 1
-        self.keywords = set()
+        self.keywords = set() if keep_keywords else None
+        self.values = {}
         self.tree = _MachineState(0)
         if keywords:
             self.update(keywords)
 
+    @classmethod
+    def from_file(cls, path, encoding=None, delimiter=b"\n",
+                  ignore_case=False, keep_keywords=False):
+        """Create a builder from a wordlist file.
+
+        The file is memory mapped and split into keywords at the
+        ``delimiter``, which are inserted into the trie one at a time.
+        Empty entries are skipped, and trailing carriage returns are
+        removed when splitting at newlines.  The keywords are bytes
+        strings, unless an (ASCII compatible) ``encoding`` is passed
+        to decode them into unicode strings.
+
+        Unlike the constructor, this does not keep a separate set of
+        the keywords by default, which saves a lot of memory for large
+        wordlists.
+        """
+        builder = cls(ignore_case=ignore_case, keep_keywords=keep_keywords)
+        builder.add_iter(_read_keywords(path, encoding, delimiter))
+        return builder
+
     def __update(self, keywords):
         """Add more keywords to the search engine builder.
 
@@ -246,57 +892,368 @@ class AcoraBuilder(object):
                 "keywords must be either bytes or unicode, not mixed (got %s)" %
                 type(keyword))
 
-    def add(self, *keywords):
+    def add(self, *keywords, **kwargs):
         """Add more keywords to the search engine builder.
 
+        Pass ``value=...`` to attach a value to the keywords, which
+        search engines that are built with ``report="value"`` return
+        instead of the keyword.
+
         Adding keywords does not impact previously built search
         engines.
         """
+        marker = object()
+        value = kwargs.pop('value', marker)
+        if kwargs:
+            raise TypeError(
+                "add() got an unexpected keyword argument '%s'" % next(iter(kwargs)))
+        if value is not marker:
+            for keyword in keywords:
+                self.values[keyword] = value
         if keywords:
             self.update(keywords)
 
-    def build(self, ignore_case=None, acora=None):
+    def add_items(self, items):
+        """Add keywords with values from a mapping or an iterable of
+        (keyword, value) pairs.  See ``add()``.
+        """
+        if hasattr(items, 'items'):
+            items = items.items()
+        values = self.values
+
+        def keywords():
+            for keyword, value in items:
+                values[keyword] = value
+                yield keyword
+        self.add_iter(keywords())
+
+    def build(self, ignore_case=None, acora=None, layout=None, report='keyword',
+              encoding=None, offsets='bytes'):
         """Build a search engine from the aggregated keywords.
 
         Builds a case insensitive search engine when passing
         ``ignore_case=True``, and a case sensitive engine otherwise.
+
+        The ``layout`` option selects the automaton layout of byte
+        search engines and of the byte-width copy that unicode engines
+        use for 1-byte strings: "dense" uses a flat next-state table that
+        is faster to search but needs more memory, "sparse" uses
+        compact sorted transition arrays, and "auto" (the default)
+        selects the dense layout for small automata.
+
+        The ``report`` option selects what matches report instead of
+        the keyword: "id" reports its index in the ``keywords`` tuple
+        of the search engine, and "value" the value that was passed
+        to ``add()`` or ``add_items()``, or None.  ``count_by_keyword()``
+        adds up the counts of keywords that report the same value.
+
+        Passing an ``encoding`` for unicode keywords builds a byte search
+        engine for their encoded form, which searches encoded data without
+        decoding it and reports the unicode keywords.  Only UTF-8 is
+        supported, and case insensitive search only folds ASCII letters.
+        Match offsets count bytes, or characters for ``offsets="characters"``.
+
+        The ``acora`` option selects the engine class, e.g. ``SkipBytesAcora``
+        to search for byte keywords that are all at least 4 bytes long.
         """
+        options = {}
+        builder = self
+        if encoding is not None:
+            if self.for_unicode is False:
+                raise ValueError("An encoding can only be used with unicode keywords")
+            # build the trie of the encoded keywords, the engine decodes them for reporting
+            keywords = self.keywords
+            if keywords is None:
+                keywords = _trie_keywords(self.tree)
+            if ignore_case is None:
+                ignore_case = self.ignore_case
+            builder = type(self)(ignore_case=ignore_case, keep_keywords=False)
+            builder.add_iter(_encode_keywords(keywords, encoding, ignore_case))
+            options['encoding'] = encoding
+            options['offsets'] = offsets
+            if acora is None:
+                acora = BytesAcora
+        elif offsets != 'bytes':
+            raise ValueError("Character offsets require an encoding")
+
         if acora is None:
             if self.for_unicode:
                 acora = UnicodeAcora
             else:
                 acora = BytesAcora
 
-        if self.for_unicode == False and ignore_case:
-            import sys
-            if sys.version_info[0] >= 3:
-                raise ValueError(
-                    "Case insensitive search is not supported for byte strings in Python 3")
-
-        if ignore_case is not None and ignore_case != self.ignore_case:
+        if builder is self and ignore_case is not None and ignore_case != self.ignore_case:
             # must rebuild tree
-            builder = type(self)(ignore_case=ignore_case)
-            builder.update(self.keywords)
-            return builder.build(acora=acora)
+            keywords = self.keywords
+            if keywords is None:
+                keywords = _trie_keywords(self.tree)
+            builder = type(self)(ignore_case=ignore_case, keep_keywords=False)
+            builder.add_iter(keywords)
+            builder.values = self.values
+            return builder.build(acora=acora, layout=layout, report=report)
 
-        return acora(_build_trie(self.tree, ignore_case=self.ignore_case))
+        if layout is not None:
+            options['layout'] = layout
+        if self.values:
+            options['values'] = self.values
+        if report != 'keyword':
+            options['report'] = report
+        with _GCPaused():
+            machine = _build_trie(builder.tree, ignore_case=builder.ignore_case)
+            return acora(machine, **options)
 
     def update(self, keywords):
-        for_unicode = self.for_unicode
-        ignore_case = self.ignore_case
-        insert_keyword = insert_unicode_keyword if for_unicode else insert_bytes_keyword
-        for keyword in keywords:
-            if for_unicode is None:
-                for_unicode = self.for_unicode = isinstance(keyword, unicode)
-                insert_keyword = (
-                    insert_unicode_keyword if for_unicode else insert_bytes_keyword)
-            elif for_unicode != isinstance(keyword, unicode):
-                raise TypeError(
-                    "keywords must be either bytes or unicode, not mixed (got %s)" %
-                    type(keyword))
-            self.state_counter = insert_keyword(
-                self.tree, keyword, self.state_counter, ignore_case)
-        self.keywords.update(keywords)
+        """Add more keywords to the search engine builder.
+
+        Adding keywords does not impact previously built search
+        engines.
+        """
+        self.add_iter(keywords)
+
+    def add_iter(self, keywords):
+        """Add the keywords of an iterable to the search engine builder.
+
+        The keywords are inserted into the trie one by one while
+        iterating, so this can consume large generators without
+        collecting the keywords first.
+        """
+        keywords = iter(keywords)
+        if self.for_unicode is None:
+            # the first keyword determines the string type of the builder
+            for keyword in keywords:
+                if not isinstance(keyword, (bytes, unicode)):
+                    raise TypeError(
+                        "keywords must be either bytes or unicode, not %s" %
+                        type(keyword))
+                self.for_unicode = isinstance(keyword, unicode)
+                keywords = chain((keyword,), keywords)
+                break
+            else:
+                return
+        with _GCPaused():
+            _insert_keywords(self, keywords)
+
+
+def _match_order(match):
+    # order by end position, longest keyword first, like the trie reports
+    # the keywords of a node, with the case variants of a keyword sorted
+    keyword, position = match
+    return position + len(keyword), -len(keyword), keyword
+
+
+class UpdatableAcora(object):
+    """A search engine whose keywords can be added and removed after
+    building it, without rebuilding the automaton of all keywords.
+
+    Searches run on a base engine and a small delta engine that holds
+    the keywords that were added since building the base engine.
+    Matches of removed keywords are filtered out.  When more than
+    ``max_delta`` keywords were added or removed, a new base engine is
+    built from the current keywords in a background thread.  Pass
+    ``max_delta=None`` to only rebuild it when calling ``merge()``.
+
+    Updates replace the engines in a single step, so that searches
+    which are running in other threads continue on the previous ones.
+    """
+    def __init__(self, keywords=(), ignore_case=False, acora=None, layout=None, max_delta=1000):
+        self.ignore_case = ignore_case
+        self.max_delta = max_delta
+        self._acora = acora
+        self._layout = layout
+        self._lock = threading.Lock()
+        self._merge_thread = None
+        self._keywords = set(keywords)
+        self._base_keywords = frozenset(self._keywords)
+        # (base engine, removed keywords, delta engine), engines are None without keywords
+        self._engines = (self._build(self._base_keywords), frozenset(), None)
+
+    @property
+    def keywords(self):
+        """The sorted tuple of all current keywords.
+        """
+        return tuple(sorted(self._keywords))
+
+    def add(self, *keywords):
+        """Add keywords to the search engine.
+        """
+        with self._lock:
+            self._keywords.update(keywords)
+            self._update_delta(self._engines[0])
+
+    def remove(self, *keywords):
+        """Remove keywords from the search engine.  Keywords that are not
+        in the search engine are ignored.
+        """
+        with self._lock:
+            self._keywords.difference_update(keywords)
+            self._update_delta(self._engines[0])
+
+    def merge(self):
+        """Rebuild the base engine from all current keywords and wait for it.
+        """
+        with self._lock:
+            keywords = frozenset(self._keywords)
+        base = self._build(keywords)
+        with self._lock:
+            self._base_keywords = keywords
+            self._update_delta(base)
+
+    def _merge_in_background(self):
+        try:
+            self.merge()
+        finally:
+            self._merge_thread = None
+
+    def _build(self, keywords):
+        if not keywords:
+            return None
+        builder = AcoraBuilder(list(keywords), ignore_case=self.ignore_case, keep_keywords=False)
+        return builder.build(acora=self._acora, layout=self._layout)
+
+    def _update_delta(self, base):
+        # must be called with the lock held
+        added = self._keywords - self._base_keywords
+        removed = self._base_keywords - self._keywords
+        old_base, _, delta = self._engines
+        if base is not old_base or added != set(delta.keywords if delta is not None else ()):
+            delta = self._build(added)
+        self._engines = (base, removed, delta)
+        if (self.max_delta is not None and len(added) + len(removed) > self.max_delta
+                and self._merge_thread is None):
+            self._merge_thread = threading.Thread(target=self._merge_in_background)
+            self._merge_thread.daemon = True
+            self._merge_thread.start()
+
+    def finditer(self, s, mode='overlapping'):
+        """Iterate over all occurrences of any keyword in the string.
+
+        See ``PyAcora.finditer()`` for the available match modes.
+        The whole string is searched up front.
+
+        Returns (keyword, offset) pairs.
+        """
+        return iter(self.findall(s, mode))
+
+    def findall(self, s, mode='overlapping'):
+        """Find all occurrences of any keyword in the string.
+
+        Returns a list of (keyword, offset) pairs, in the same order as
+        an engine that is built from all current keywords.
+        """
+        base, removed, delta = self._engines
+        matches = base.findall(s) if base is not None else []
+        if removed:
+            matches = [match for match in matches if match[0] not in removed]
+        if delta is not None:
+            matches.extend(delta.findall(s))
+            matches.sort(key=_match_order)
+        return _select_matches(matches, mode)
+
+    def contains(self, s):
+        """Check if the string contains any of the keywords.
+        """
+        base, removed, delta = self._engines
+        if delta is not None and delta.contains(s):
+            return True
+        if base is None:
+            return False
+        if not removed:
+            return base.contains(s)
+        for keyword, _ in base.finditer(s):
+            if keyword not in removed:
+                return True
+        return False
+
+    def find_first(self, s):
+        """Find the first match in the string, i.e. the first one that
+        ``finditer()`` would return.
+
+        Returns a (keyword, offset) pair or None.
+        """
+        base, removed, delta = self._engines
+        first = None
+        if base is not None:
+            for match in base.finditer(s):
+                if match[0] not in removed:
+                    first = match
+                    break
+        if delta is not None:
+            match = delta.find_first(s)
+            if match is not None and (first is None or _match_order(match) < _match_order(first)):
+                first = match
+        return first
+
+    def count(self, s):
+        """Count the occurrences of all keywords in the string.
+        """
+        return sum(self.count_by_keyword(s).values())
+
+    def count_by_keyword(self, s):
+        """Count the occurrences of each keyword in the string.
+
+        Returns a dict that maps the keywords that were found to their
+        number of occurrences.
+        """
+        base, removed, delta = self._engines
+        counts = base.count_by_keyword(s) if base is not None else {}
+        for keyword in removed:
+            counts.pop(keyword, None)
+        if delta is not None:
+            counts.update(delta.count_by_keyword(s))
+        return counts
+
+
+def _read_keywords(path, encoding, delimiter):
+    """Generate the keywords of a wordlist file by splitting its memory mapped content.
+    """
+    if not isinstance(delimiter, bytes):
+        delimiter = delimiter.encode(encoding or 'ascii')
+    if not delimiter:
+        raise ValueError("delimiter must not be empty")
+    strip_cr = delimiter == b"\n"
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return  # empty files cannot be mapped
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = len(data)
+            start = 0
+            while start < end:
+                pos = data.find(delimiter, start)
+                if pos == -1:
+                    pos = end
+                keyword = data[start:pos]
+                start = pos + len(delimiter)
+                if strip_cr and keyword.endswith(b"\r"):
+                    keyword = keyword[:-1]
+                if keyword:
+                    yield keyword.decode(encoding) if encoding else keyword
+        finally:
+            data.close()
+
+
+def _encode_keywords(keywords, encoding, ignore_case):
+    """Generate the encoded keywords for a byte search engine.
+    """
+    for keyword in keywords:
+        if ignore_case and any(
+                char > '\x7f' and char.lower() != char.upper() for char in keyword):
+            raise ValueError(
+                "Case insensitive search in encoded data only supports ASCII letters, got %r" % (keyword,))
+        yield keyword.encode(encoding)
+
+
+def _trie_keywords(tree):
+    """Generate the keywords that were inserted into a trie.
+    """
+    states = [tree]
+    while states:
+        state = states.pop()
+        if state.matches:
+            for keyword in state.matches:
+                yield keyword
+        if state.children:
+            states.extend(state.children)
 
 
 ### convenience functions
@@ -43,20 +43,25 @@ cdef class _Machine:
 cpdef _MachineState build_MachineState(state_id, list matches=*)
 
 
-@cython.locals(child=_MachineState)
+@cython.locals(low=Py_ssize_t, high=Py_ssize_t, middle=Py_ssize_t, child=_MachineState)
+cdef Py_ssize_t _find_child_index(list children, Py_UCS4 ch) except -1
+
+
+@cython.locals(child=_MachineState, i=Py_ssize_t, children=list)
 cdef _MachineState _find_child(_MachineState state, Py_UCS4 ch)
 
 
-@cython.locals(child=_MachineState, ch=Py_UCS4, ukeyword=unicode)
+@cython.locals(child=_MachineState, ch=Py_UCS4, ukeyword=unicode, i=Py_ssize_t)
 cpdef insert_unicode_keyword(_MachineState tree, keyword, long state_id, bint ignore_case=*)
 
 
-@cython.locals(state=_MachineState, child=_MachineState, ch=Py_UCS4, uc=Py_UCS4)
+@cython.locals(state=_MachineState, child=_MachineState, fail_state=_MachineState,
+               fail_child=_MachineState, ch=Py_UCS4)
 cpdef build_trie(_MachineState start_state, bint ignore_case=*)
 
 
 @cython.locals(letter=object, uc=Py_UCS4, child=_MachineState)
-cpdef tuple merge_targets(_MachineState state, bint ignore_case)
+cpdef tuple merge_targets(_MachineState state, bint ignore_case, bint ascii_case=*)
 
 
 @cython.locals(ch=Py_UCS4, lower=Py_UCS4, upper=Py_UCS4)
@@ -71,4 +76,6 @@ cdef unicode _make_printable(s)
 
 
 cpdef _sort_by_character(_MachineState s)
-cpdef _sort_by_lc_character(_MachineState s)
+
+@cython.locals(i=Py_ssize_t, previous=_MachineState, child=_MachineState)
+cdef _sort_children(list children)
@@ -85,8 +85,24 @@ def build_MachineState(state_id, matches=None):
     return state
 
 
+def _find_child_index(children, ch):
+    # binary search for the insertion point of a character in the sorted children
+    low, high = 0, len(children)
+    while low < high:
+        middle = (low + high) // 2
+        child = children[middle]
+        if child.letter < ch:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
 def _find_child(state, ch):
-    for child in state.children:
+    children = state.children
+    i = _find_child_index(children, ch)
+    if i < len(children):
+        child = children[i]
         if child.letter == ch:
             return child
     return None
@@ -101,14 +117,15 @@ def insert_unicode_keyword(tree, keyword, state_id, ignore_case=False):
             ch = ch.lower()
         if tree.children is None:
             tree.children = []
-            child = None
+        # keep the children sorted by character
+        i = _find_child_index(tree.children, ch)
+        if i < len(tree.children) and tree.children[i].letter == ch:
+            child = tree.children[i]
         else:
-            child = _find_child(tree, ch)
-        if child is None:
             child = build_MachineState(state_id)
             child.letter = ch
             state_id += 1
-            tree.children.append(child)
+            tree.children.insert(i, child)
         tree = child
     if ignore_case and tree.matches:
         if keyword not in tree.matches:
@@ -119,22 +136,22 @@ def insert_unicode_keyword(tree, keyword, state_id, ignore_case=False):
 
 
 def insert_bytes_keyword(tree, keyword, state_id, ignore_case=False):
-    # keep in sync with insert_bytes_keyword()
+    # keep in sync with insert_unicode_keyword()
     if not keyword:
         raise ValueError("cannot search for the empty string")
-    for ch in keyword:
-        if ignore_case:
-            ch = ch.lower()
+    # bytes.lower() only changes ASCII letters
+    for ch in (keyword.lower() if ignore_case else keyword):
         if tree.children is None:
             tree.children = []
-            child = None
+        # keep the children sorted by character
+        i = _find_child_index(tree.children, ch)
+        if i < len(tree.children) and tree.children[i].letter == ch:
+            child = tree.children[i]
         else:
-            child = _find_child(tree, ch)
-        if child is None:
             child = build_MachineState(state_id)
             child.letter = ch
             state_id += 1
-            tree.children.append(child)
+            tree.children.insert(i, child)
         tree = child
     if ignore_case and tree.matches:
         if keyword not in tree.matches:
@@ -148,8 +165,13 @@ def _sort_by_character(s):
     return s.letter
 
 
-def _sort_by_lc_character(s):
-    return s.letter.lower()
+def _sort_children(children):
+    # children are inserted in order, so sorting is rarely needed
+    for i in range(1, len(children)):
+        previous, child = children[i-1], children[i]
+        if previous.letter > child.letter:
+            children.sort(key=_sort_by_character)
+            break
 
 
 def build_trie(start_state, ignore_case=False):
@@ -166,31 +188,28 @@ def build_trie(start_state, ignore_case=False):
         return _Machine(start_state, child_states)
 
     # set up failure links for start states
-    start_state.children.sort(key=_sort_by_character)
+    _sort_children(start_state.children)
     child_states.extend(start_state.children)
     for child in start_state.children:
         child.fail = start_state
 
     # set up failure links for all states
-    seen_targets = {}
     for state in child_states:
         if ignore_case and state.matches and len(state.matches) > 1:
             state.matches.sort()  # sort case-insensitive equivalents alphabetically
         if not state.children:
             state.children = []
             continue
-        state.children.sort(key=_sort_by_lc_character if ignore_case else _sort_by_character)
+        _sort_children(state.children)
         child_states.extend(state.children)
         for child in state.children:
             ch = child.letter
             # find best continue state for this letter
             fail_state = state.fail
             while True:
+                # keywords are lower cased when ignoring case, so looking up
+                # the lower case letter is enough
                 fail_child = _find_child(fail_state, ch)
-                if fail_child is None and ignore_case:
-                    uc = ch.upper()
-                    if uc != ch:
-                        fail_child = _find_child(fail_state, uc)
                 if fail_child is not None:
                     child.fail = fail_child
                     break
@@ -268,15 +287,23 @@ def _make_printable(s):
     return b.decode('ascii')
 
 
-def merge_targets(state, ignore_case):
+def _ascii_upper(letter):
+    # bytes letters are integers in Python 3 when this module is not compiled
+    if isinstance(letter, int):
+        return letter - 32 if 97 <= letter <= 122 else letter
+    return letter.upper() if u'a' <= letter <= u'z' else letter
+
+
+def merge_targets(state, ignore_case, ascii_case=False):
     # merge children failure states and matches to avoid deep failure state traversal
+    # byte data only ignores the case of ASCII letters
     targets = {}
     if state.children:
         for child in state.children:
             letter = child.letter
             targets[letter] = child
             if ignore_case:
-                uc = child.letter.upper()
+                uc = _ascii_upper(child.letter) if ascii_case else child.letter.upper()
                 if uc != child.letter:
                     targets[uc] = child
 
@@ -295,7 +322,7 @@ def merge_targets(state, ignore_case):
                 if letter not in targets:
                     targets[letter] = child
                 if ignore_case:
-                    uc = child.letter.upper()
+                    uc = _ascii_upper(child.letter) if ascii_case else child.letter.upper()
                     if uc != child.letter:
                         letter = uc
                         if letter not in targets:
@@ -0,0 +1,49 @@
+"""
+Asyncio support for searching asynchronous data sources with acora.
+
+Requires Python 3.6 or later.
+"""
+
+import asyncio
+
+# amount of data requested from stream readers at a time
+READ_SIZE = 64 * 1024
+
+# chunks of at least this size are searched in a worker thread to keep the event loop responsive
+THREAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _read_chunks(source, read_size):
+    if hasattr(source, 'read'):
+        # asyncio.StreamReader or similar
+        while True:
+            chunk = await source.read(read_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        async for chunk in source:
+            yield chunk
+
+
+async def afind(engine, source, read_size=READ_SIZE, thread_chunk_size=THREAD_CHUNK_SIZE):
+    """Asynchronously iterate over all occurrences of any keyword in a data source.
+
+    The source can be an object with an async ``read(size)`` method,
+    e.g. an ``asyncio.StreamReader``, or an async iterable of chunks.
+    Matches that span chunk boundaries are found as well.
+
+    Chunks of ``thread_chunk_size`` or more are searched in the default
+    executor of the event loop.
+
+    Yields (keyword, offset) pairs.
+    """
+    scanner = engine.stream()
+    loop = asyncio.get_event_loop()
+    async for chunk in _read_chunks(source, read_size):
+        if len(chunk) >= thread_chunk_size:
+            matches = await loop.run_in_executor(None, scanner.feed, chunk)
+        else:
+            matches = scanner.feed(chunk)
+        for match in matches:
+            yield match
@@ -5,21 +5,33 @@
 """A fast C implementation of the Acora search engine.
 
 There are two main classes, UnicodeAcora and BytesAcora, that handle
-byte data and unicode data respectively.
+byte data and unicode data respectively.  SkipBytesAcora is a BytesAcora
+that skips over the input faster if all keywords are long.
 """
 
-__all__ = ['BytesAcora', 'UnicodeAcora']
+__all__ = ['BytesAcora', 'SkipBytesAcora', 'UnicodeAcora']
+
+import codecs
+import os
+import stat
+import sys
+import threading
 
 cimport cython
 cimport cpython.exc
 cimport cpython.mem
 cimport cpython.bytes
-from cpython.ref cimport PyObject
+cimport cpython.buffer
+from cpython cimport array
+from cpython.pyport cimport PY_SSIZE_T_MAX
 from cpython.unicode cimport PyUnicode_AS_UNICODE, PyUnicode_GET_SIZE
+from libc.limits cimport INT_MAX
+from libc.stdint cimport int32_t, uint8_t, uint16_t, uint32_t, uint64_t, uintptr_t, UINT32_MAX, UINT64_MAX
+from libc.string cimport memchr, memcmp, memcpy, memset
 
 from ._acora cimport (
-    _Machine, _MachineState, build_MachineState, _find_child,
-    _convert_old_format, merge_targets, _make_printable)
+    _Machine, _MachineState, build_MachineState, _find_child_index,
+    _convert_old_format, _make_printable)
 
 cdef extern from * nogil:
     ssize_t read(int fd, void *buf, size_t count)
@@ -52,26 +64,162 @@ cdef extern from *:
 
 
 DEF FILE_BUFFER_SIZE = 32 * 1024
+DEF MATCH_COLLECTOR_INITIAL_SIZE = 64
+# match modes
+DEF MODE_OVERLAPPING = 0
+DEF MODE_LEFTMOST_LONGEST = 1
+DEF MODE_LEFTMOST_SHORTEST = 2
+DEF MODE_NON_OVERLAPPING = 3
+
+# parallel searches do not split the data into chunks smaller than this
+DEF PARALLEL_MIN_CHUNK_SIZE = 64 * 1024
+
+# the "auto" layout uses a dense transition table up to this table size (in bytes)
+DEF DENSE_LAYOUT_MAX_SIZE = 1024 * 1024
+# the first byte prefilter is used for up to this number of bytes that can start a match
+DEF PREFILTER_MAX_FIRST_BYTES = 32
+# the prefilter is disabled for the rest of a search run when it skips less
+# than PREFILTER_BREAK_EVEN_SKIP bytes on average, within the credit limits
+DEF PREFILTER_BREAK_EVEN_SKIP = 16
+DEF PREFILTER_INITIAL_CREDIT = 1024
+DEF PREFILTER_MAX_CREDIT = 64 * 1024
+
+# the shift table of SkipBytesAcora has one entry per (hashed) block of 2 to 4 bytes,
+# it is only used if the shortest keyword has at least SHIFT_MIN_WINDOW bytes
+DEF SHIFT_MIN_WINDOW = 4
+DEF SHIFT_MAX_WINDOW = 255
+# longer blocks are used for keyword sets with more blocks, in a table with
+# SHIFT_TABLE_LOAD entries per block, of 2**16 up to 2**SHIFT_MAX_TABLE_BITS entries
+DEF SHIFT_MAX_2_BYTE_BLOCKS = 256
+DEF SHIFT_MAX_3_BYTE_BLOCKS = 4096
+DEF SHIFT_TABLE_LOAD = 16
+DEF SHIFT_MAX_TABLE_BITS = 20
+# the shift table is disabled for the rest of a search run when it skips less
+# than SHIFT_BREAK_EVEN_SKIP bytes on average, see PREFILTER_BREAK_EVEN_SKIP
+DEF SHIFT_BREAK_EVEN_SKIP = 4
+
+# binary engine image format, see _build_image()
+DEF IMAGE_VERSION = 1
+DEF IMAGE_BYTE_ORDER = 0x01020304
+DEF IMAGE_FLAG_UNICODE = 1
+DEF IMAGE_FLAG_IGNORE_CASE = 2
+DEF IMAGE_FLAG_DENSE = 4
+DEF IMAGE_FLAG_REPORT_IDS = 8
+DEF IMAGE_FLAG_UTF8 = 16
+DEF IMAGE_FLAG_CHARACTER_OFFSETS = 32
+
+cdef extern from *:
+    """
+    /* dense table entries store the row offset of the target state, flagged if it has matches */
+    #define __ACORA_DENSE_MATCH_FLAG  ((uint32_t) 0x80000000U)
+    /* terminates the keyword id lists of the matches of a node */
+    #define __ACORA_MATCH_END  ((uint32_t) 0xFFFFFFFFU)
+    """
+    const uint32_t DENSE_MATCH_FLAG "__ACORA_DENSE_MATCH_FLAG"
+    const uint32_t MATCH_END "__ACORA_MATCH_END"
 
 ctypedef struct _AcoraUnicodeNodeStruct:
     Py_UCS4* characters
-    _AcoraUnicodeNodeStruct** targets
-    PyObject** matches
+    uint32_t* targets  # node indices
+    uint32_t* match_ids  # terminated by MATCH_END, NULL if there are no matches
     int char_count
 
 ctypedef struct _AcoraBytesNodeStruct:
     unsigned char* characters
-    _AcoraBytesNodeStruct** targets
-    PyObject** matches
+    uint32_t* targets  # node indices
+    uint32_t* match_ids  # terminated by MATCH_END, NULL if there are no matches
     int char_count
 
+ctypedef fused _AcoraNodeStruct:
+    _AcoraBytesNodeStruct
+    _AcoraUnicodeNodeStruct
+
+ctypedef fused _inputCharType:
+    unsigned char
+    Py_UCS4
+
+# the data of 2-byte and 4-byte kind strings
+ctypedef fused _wideCharType:
+    uint16_t
+    Py_UCS4
+
+
+ctypedef struct _UnicodeDocument:
+    void* data
+    Py_ssize_t length
+    int kind
+
+ctypedef struct _AcoraBytesEngine:
+    _AcoraBytesNodeStruct* start_node
+    # dense layout: one next-state entry per byte class and node, NULL for the sparse layout
+    uint32_t* transitions
+    uint32_t class_count
+    # maps each byte value to its equivalence class, i.e. its column in the dense table
+    unsigned char byte_classes[256]
+    # prefilter for skipping over input that cannot start a match, disabled if 0
+    int first_byte_count
+    unsigned char first_bytes[3]
+    uint64_t first_byte_map[4]
+    # shift table for skipping ahead (SkipBytesAcora), NULL if not used,
+    # indexed by the block of shift_block bytes at the end of a window of
+    # shift_window bytes, i.e. the length of the shortest keyword
+    uint8_t* shifts
+    int shift_window
+    int shift_block
+    int shift_bits  # the table has 2**shift_bits entries
+    # the depth of each node (up to 255) and of the target of each dense table entry
+    uint8_t* node_depths
+    uint8_t* transition_depths
+
+ctypedef struct _AcoraUnicodeEngine:
+    _AcoraUnicodeNodeStruct* start_node
+    # case insensitive search folds the input characters below fold_limit
+    # (0 if none are folded) by adding their fold_deltas entry, which are
+    # stored in blocks of 256 characters that fold_blocks points to
+    uint32_t fold_limit
+    uint32_t* fold_blocks
+    int32_t* fold_deltas
+    # byte-width copy of the automaton for searching 1-byte kind strings,
+    # whose nodes share the match lists of the nodes with the same index
+    _AcoraBytesEngine latin1
+
+ctypedef struct _ImageHeader:
+    char magic[8]
+    uint32_t version
+    uint32_t byte_order
+    uint32_t flags
+    uint32_t char_size
+    uint64_t node_count
+    uint64_t transitions_size
+    uint64_t match_id_count
+    uint64_t keyword_count
+    uint64_t keyword_data_size
+    # byte offsets of the 8-byte aligned sections
+    uint64_t nodes_offset
+    uint64_t transitions_offset
+    uint64_t match_ids_offset
+    uint64_t keyword_offsets_offset
+    uint64_t keyword_data_offset
+    uint64_t size
+
+ctypedef struct _ImageNode:
+    # byte offset of the transition block in the transitions section,
+    # i.e. the target node indices, followed by the characters
+    uint64_t transitions
+    # index of the first match id in the match id section, or UINT64_MAX if there are no matches
+    uint64_t matches
+    uint32_t char_count
+    uint32_t reserved
+
 
 # state machine building support
 
-def insert_bytes_keyword(_MachineState tree, keyword, long state_id, bint ignore_case=False):
+cpdef long insert_bytes_keyword(_MachineState tree, keyword, long state_id,
+                                bint ignore_case=False) except -1:
     # keep in sync with insert_unicode_keyword()
     cdef _MachineState child
     cdef unsigned char ch
+    cdef Py_ssize_t i
     if not isinstance(keyword, bytes):
         raise TypeError("expected bytes object, got %s" % type(keyword).__name__)
     if not <bytes>keyword:
@@ -84,14 +232,15 @@ def insert_bytes_keyword(_MachineState tree, keyword, long state_id, bint ignore
         #print(ch)
         if tree.children is None:
             tree.children = []
-            child = None
+        # keep the children sorted by character
+        i = _find_child_index(tree.children, ch)
+        if i < len(tree.children) and (<_MachineState>tree.children[i]).letter == ch:
+            child = tree.children[i]
         else:
-            child = _find_child(tree, ch)
-        if child is None:
             child = build_MachineState(state_id)
             child.letter = ch
             state_id += 1
-            tree.children.append(child)
+            tree.children.insert(i, child)
         tree = child
     if ignore_case and tree.matches:
         if keyword not in tree.matches:
@@ -101,10 +250,12 @@ def insert_bytes_keyword(_MachineState tree, keyword, long state_id, bint ignore
     return state_id
 
 
-def insert_unicode_keyword(_MachineState tree, keyword, long state_id, bint ignore_case=False):
+cpdef long insert_unicode_keyword(_MachineState tree, keyword, long state_id,
+                                  bint ignore_case=False) except -1:
     # keep in sync with insert_bytes_keyword()
     cdef _MachineState child
     cdef Py_UCS4 ch
+    cdef Py_ssize_t i
     if not isinstance(keyword, unicode):
         raise TypeError("expected Unicode string, got %s" % type(keyword).__name__)
     if not <unicode>keyword:
@@ -114,14 +265,15 @@ def insert_unicode_keyword(_MachineState tree, keyword, long state_id, bint igno
             ch = ch.lower()
         if tree.children is None:
             tree.children = []
-            child = None
+        # keep the children sorted by character
+        i = _find_child_index(tree.children, ch)
+        if i < len(tree.children) and (<_MachineState>tree.children[i]).letter == ch:
+            child = tree.children[i]
         else:
-            child = _find_child(tree, ch)
-        if child is None:
             child = build_MachineState(state_id)
             child.letter = ch
             state_id += 1
-            tree.children.append(child)
+            tree.children.insert(i, child)
         tree = child
     if ignore_case and tree.matches:
         if keyword not in tree.matches:
@@ -131,22 +283,48 @@ def insert_unicode_keyword(_MachineState tree, keyword, long state_id, bint igno
     return state_id
 
 
+def insert_keywords(builder, keywords):
+    """Insert the keywords of an iterable into the trie of an AcoraBuilder.
+
+    Updates the state counter of the builder and, if it keeps one,
+    its keyword set.
+    """
+    cdef _MachineState tree = builder.tree
+    cdef long state_id = builder.state_counter
+    cdef bint for_unicode = builder.for_unicode
+    cdef bint ignore_case = builder.ignore_case
+    cdef set keyword_set = builder.keywords
+    try:
+        for keyword in keywords:
+            if for_unicode:
+                state_id = insert_unicode_keyword(tree, keyword, state_id, ignore_case)
+            else:
+                state_id = insert_bytes_keyword(tree, keyword, state_id, ignore_case)
+            if keyword_set is not None:
+                keyword_set.add(keyword)
+    finally:
+        # keep the builder consistent with the trie if a keyword was rejected
+        builder.state_counter = state_id
+
+
 def machine_to_dot(machine, out=None):
     cdef _AcoraUnicodeNodeStruct* unode
     cdef _AcoraUnicodeNodeStruct* unodes = NULL
     cdef _AcoraBytesNodeStruct* bnode
     cdef _AcoraBytesNodeStruct* bnodes = NULL
     cdef Py_ssize_t node_count, node_id
-    cdef PyObject **cmatches
+    cdef uint32_t* match_ids
     cdef Py_UCS4 ch
     cdef unsigned char bch
 
     if isinstance(machine, UnicodeAcora):
-        unodes = (<UnicodeAcora>machine).start_node
+        unodes = (<UnicodeAcora>machine).engine.start_node
         node_count = (<UnicodeAcora>machine).node_count
+        keywords = (<UnicodeAcora>machine)._keywords
     elif isinstance(machine, BytesAcora):
-        bnodes = (<BytesAcora>machine).start_node
+        bnodes = (<BytesAcora>machine).engine.start_node
         node_count = (<BytesAcora>machine).node_count
+        keywords = (<BytesAcora>machine)._keywords
     else:
         raise TypeError(
             "Expected UnicodeAcora or BytesAcora instance, got %s" % machine.__class__.__name__)
@@ -162,19 +340,19 @@ def machine_to_dot(machine, out=None):
         if unodes:
             unode = unodes + node_id
             characters = [ch for ch in unode.characters[:unode.char_count]]
-            child_ids = [<size_t>(child - unodes) for child in unode.targets[:unode.char_count]]
-            cmatches = unode.matches
+            child_ids = [child_id for child_id in unode.targets[:unode.char_count]]
+            match_ids = unode.match_ids
         else:
             bnode = bnodes + node_id
             characters = [<bytes>bch for bch in bnode.characters[:bnode.char_count]]
-            child_ids = [<size_t>(child - bnodes) for child in bnode.targets[:bnode.char_count]]
-            cmatches = bnode.matches
+            child_ids = [child_id for child_id in bnode.targets[:bnode.char_count]]
+            match_ids = bnode.match_ids
 
-        if cmatches is not NULL:
+        if match_ids is not NULL:
             matches = []
-            while cmatches[0]:
-                matches.append(_make_printable(<object>cmatches[0]))
-                cmatches += 1
+            while match_ids[0] != MATCH_END:
+                matches.append(_make_printable(keywords[match_ids[0]]))
+                match_ids += 1
             if matches:
                 write('M%s [label="%s", shape=note];\n' % (
                     node_id, '\\n'.join(_make_printable(s) for s in matches)))
@@ -191,111 +369,465 @@ def machine_to_dot(machine, out=None):
 
 # Unicode machine
 
-cdef int _init_unicode_node(
-        _AcoraUnicodeNodeStruct* c_node, _MachineState state,
-        _AcoraUnicodeNodeStruct* all_nodes,
-        dict node_offsets, dict pyrefs, bint ignore_case) except -1:
-    cdef _MachineState child, fail_state
-    cdef size_t mem_size
+cdef dict _case_folding(set letters):
+    """Map the upper case characters of the letters to their lower case
+    letter, for folding the input of case insensitive unicode search.
+
+    Upper case characters that are letters themselves, or the upper case
+    of more than one letter, are not folded and keep their own transitions.
+    """
+    cdef Py_UCS4 letter, uc
+    folding = {}
+    ambiguous = set()
+    for letter in letters:
+        uc = letter.upper()
+        if uc == letter or uc in letters:
+            continue
+        if uc in folding:
+            ambiguous.add(uc)
+        else:
+            folding[uc] = letter
+    for uc in ambiguous:
+        del folding[uc]
+    return folding
+
+
+cdef Py_ssize_t _collect_own_targets(_MachineState state, bint ignore_case, bint ascii_case,
+                                     dict case_folding, const Py_ssize_t* node_offsets,
+                                     Py_UCS4* letters, Py_ssize_t* offsets) except -1:
+    """Store the transitions to the children of a state, sorted by character.
+    Returns their number.  The arrays need space for twice the number of
+    children to include the upper case transitions when ignoring case.
+    Byte data only ignores the case of ASCII letters (``ascii_case``).
+    Unicode data folds the upper case characters in ``case_folding``
+    instead of adding transitions for them.
+    """
+    cdef _MachineState child
+    cdef Py_ssize_t count = 0
+    cdef Py_UCS4 uc
+    if not ignore_case or case_folding is not None:
+        # the children of trie states are already sorted
+        for child in state.children:
+            if count and child.letter <= letters[count - 1]:
+                break
+            if ignore_case:
+                uc = child.letter.upper()
+                if uc != child.letter and uc not in case_folding:
+                    break
+            letters[count] = child.letter
+            offsets[count] = node_offsets[child.id]
+            count += 1
+        else:
+            return count
+
+    targets = {}
+    for child in state.children:
+        targets[child.letter] = child
+        if ignore_case:
+            if not ascii_case:
+                uc = child.letter.upper()
+                if uc in case_folding:
+                    continue
+            elif c'a' <= child.letter <= c'z':
+                uc = <Py_UCS4> (<uint32_t> child.letter - (c'a' - c'A'))
+            else:
+                continue
+            if uc != child.letter:
+                targets[uc] = child
+    count = 0
+    for letter in sorted(targets):
+        letters[count] = letter
+        offsets[count] = node_offsets[(<_MachineState> targets[letter]).id]
+        count += 1
+    return count
+
+
+cdef dict _shared_letter_targets(_MachineState state, bint ascii_case, dict case_folding,
+                                 const Py_ssize_t* node_offsets):
+    """Find the letters to which several children of a case insensitive state
+    lead, e.g. the upper case 'S' of 's' and the long s.
+
+    The state itself goes to the last of these children, but the states that
+    fail over to it go to the first one, as in ``merge_targets()``.  Returns
+    a dict that maps these letters to the node offset of the first child,
+    or None if there are none.
+    """
+    cdef _MachineState child
+    cdef Py_UCS4 uc
+    first = {}
+    last = {}
+    for child in state.children:
+        first.setdefault(child.letter, child)
+        last[child.letter] = child
+        if ascii_case:
+            if not c'a' <= child.letter <= c'z':
+                continue
+            uc = <Py_UCS4> (<uint32_t> child.letter - (c'a' - c'A'))
+        else:
+            uc = child.letter.upper()
+            if uc == child.letter or uc in case_folding:
+                continue
+        first.setdefault(uc, child)
+        last[uc] = child
+    shared = None
+    for letter, child in first.items():
+        if last[letter] is not child:
+            if shared is None:
+                shared = {}
+            shared[letter] = node_offsets[child.id]
+    return shared
+
+
+cdef Py_ssize_t* _init_node_offsets(_Machine machine) except NULL:
+    """Map the state ids to the offsets of their nodes, in breadth-first order.
+    """
+    cdef _MachineState state
+    cdef unsigned long max_id = machine.start_state.id
     cdef Py_ssize_t i
-    cdef unicode letter
-    cdef dict targets
-
-    # merge children failure states and matches to avoid deep failure state traversal
-    targets, matches = merge_targets(state, ignore_case)
-    cdef size_t child_count = len(targets)
-
-    # use a single malloc for targets and match-string pointers
-    mem_size = sizeof(_AcoraUnicodeNodeStruct**) * child_count
-    if matches:
-        mem_size += sizeof(PyObject*) * (len(matches) + 1)  # NULL terminated
-    mem_size += sizeof(Py_UCS4) * child_count
-    c_node.targets = <_AcoraUnicodeNodeStruct**> cpython.mem.PyMem_Malloc(mem_size)
-    if c_node.targets is NULL:
+    for state in machine.child_states:
+        if state.id > max_id:
+            max_id = state.id
+    cdef Py_ssize_t* node_offsets = <Py_ssize_t*> cpython.mem.PyMem_Malloc(
+        sizeof(Py_ssize_t) * (max_id + 1))
+    if node_offsets is NULL:
         raise MemoryError()
+    node_offsets[machine.start_state.id] = 0
+    for i, state in enumerate(machine.child_states, 1):
+        node_offsets[state.id] = i
+    return node_offsets
 
-    if not matches:
-        c_node.matches = NULL
-        c_characters = <Py_UCS4*> (c_node.targets + child_count)
-    else:
-        c_node.matches = <PyObject**> (c_node.targets + child_count)
-        matches = _intern(pyrefs, tuple(matches))
-        i = 0
-        for match in matches:
-            c_node.matches[i] = <PyObject*>match
+
+cdef Py_ssize_t _fail_node_offset(_MachineState state, const Py_ssize_t* node_offsets) except -2:
+    """Look up the node offset of the failure state, or return -1 if there is none.
+    """
+    if state.fail is None or state.fail is state:
+        return -1
+    cdef Py_ssize_t offset = node_offsets[state.fail.id]
+    if offset >= node_offsets[state.id]:
+        raise ValueError("states must be ordered after their failure states")
+    return offset
+
+
+cdef inline size_t _pointer_aligned(size_t size) noexcept:
+    return (size + sizeof(void*) - 1) & ~(sizeof(void*) - 1)
+
+
+cdef Py_ssize_t _count_merged_transitions(const Py_UCS4* own_letters, Py_ssize_t own_count,
+                                          const Py_UCS4* fail_letters, Py_ssize_t fail_count) noexcept:
+    cdef Py_ssize_t i = 0, j = 0, count = 0
+    while i < own_count and j < fail_count:
+        if own_letters[i] <= fail_letters[j]:
+            if own_letters[i] == fail_letters[j]:
+                j += 1
             i += 1
-        c_node.matches[i] = NULL
-        c_characters = <Py_UCS4*> (c_node.matches + i + 1)
+        else:
+            j += 1
+        count += 1
+    return count + (own_count - i) + (fail_count - j)
+
+
+ctypedef struct _NodeLayout:
+    # the merged transitions and matches of a node while building the node arenas
+    Py_ssize_t transitions  # byte offset of the transition block
+    Py_ssize_t matches  # index of the first match id, -1 if the node has no matches
+    Py_ssize_t char_count
+
+
+cdef inline size_t _transition_block_size(Py_ssize_t char_count, size_t char_size) noexcept:
+    # the target node indices, followed by the characters, padded to keep the next block aligned
+    return sizeof(uint32_t) * char_count + ((char_size * char_count + 3) & ~(<size_t> 3))
+
+
+@cython.final
+cdef class _NodeArenaBuilder:
+    """Collects the merged transitions and match id lists of all states in
+    breadth-first order, in the memory blocks that the nodes of an engine
+    point into.
+
+    The transitions and matches of each node are merged with those of the
+    already collected node of its failure state.  This avoids deep failure
+    state traversal during the search.
+    """
+    cdef _NodeLayout* layouts
+    cdef char* transitions
+    cdef uint32_t* match_ids
+    cdef size_t char_size
+    cdef dict case_folding  # see _case_folding(), None for case sensitive or byte data
+    cdef Py_ssize_t node_count, transitions_size, match_id_count
+    cdef Py_ssize_t transitions_capacity, match_id_capacity
+
+    def __cinit__(self, _Machine machine not None, tuple keywords not None, size_t char_size):
+        cdef Py_ssize_t i
+        cdef Py_ssize_t* node_offsets
+        self.char_size = char_size
+        self.node_count = len(machine.child_states) + 1
+        if self.node_count > UINT32_MAX:
+            raise ValueError("Too many states: %d" % self.node_count)
+        self.layouts = <_NodeLayout*> cpython.mem.PyMem_Malloc(
+            sizeof(_NodeLayout) * self.node_count)
+        if self.layouts is NULL:
+            raise MemoryError()
 
-    if state.children and len(targets) == len(state.children):
-        for i, child in enumerate(state.children):
-            c_node.targets[i] = all_nodes + <size_t>node_offsets[child]
-            c_characters[i] = child.letter
+        if machine.ignore_case and char_size != 1:
+            self.case_folding = _case_folding(
+                {(<_MachineState> state).letter for state in machine.child_states})
+
+        keyword_ids = {keyword: i for i, keyword in enumerate(keywords)}
+        node_offsets = _init_node_offsets(machine)
+        try:
+            self._add_node(0, machine.start_state, -1, node_offsets,
+                           machine.ignore_case, keywords, keyword_ids)
+            for i, state in enumerate(machine.child_states, 1):
+                # failure states come first in breadth-first order and are already collected
+                self._add_node(i, state, _fail_node_offset(state, node_offsets), node_offsets,
+                               machine.ignore_case, keywords, keyword_ids)
+        finally:
+            cpython.mem.PyMem_Free(node_offsets)
+
+    def __dealloc__(self):
+        cpython.mem.PyMem_Free(self.layouts)
+        cpython.mem.PyMem_Free(self.transitions)
+        cpython.mem.PyMem_Free(self.match_ids)
+
+    cdef int _reserve_transitions(self, size_t size) except -1:
+        cdef Py_ssize_t capacity = self.transitions_capacity or 1024
+        cdef void* transitions
+        if self.transitions_size + size <= self.transitions_capacity:
+            return 0
+        while capacity < self.transitions_size + size:
+            capacity = capacity * 3 // 2
+        transitions = cpython.mem.PyMem_Realloc(self.transitions, capacity)
+        if transitions is NULL:
+            raise MemoryError()
+        self.transitions = <char*> transitions
+        self.transitions_capacity = capacity
+
+    cdef int _reserve_match_ids(self, Py_ssize_t count) except -1:
+        cdef Py_ssize_t capacity = self.match_id_capacity or 64
+        cdef void* match_ids
+        if self.match_id_count + count <= self.match_id_capacity:
+            return 0
+        while capacity < self.match_id_count + count:
+            capacity = capacity * 3 // 2
+        match_ids = cpython.mem.PyMem_Realloc(self.match_ids, sizeof(uint32_t) * capacity)
+        if match_ids is NULL:
+            raise MemoryError()
+        self.match_ids = <uint32_t*> match_ids
+        self.match_id_capacity = capacity
+
+    cdef int _add_node(self, Py_ssize_t node_index, _MachineState state, Py_ssize_t fail_index,
+                       const Py_ssize_t* node_offsets, bint ignore_case,
+                       tuple keywords, dict keyword_ids) except -1:
+        cdef _NodeLayout* layout = self.layouts + node_index
+        cdef _NodeLayout* fail_layout = self.layouts + fail_index if fail_index >= 0 else NULL
+        cdef Py_ssize_t i, j, k, own_count = 0, fail_count = 0, child_count = 0
+        cdef Py_ssize_t child_capacity = 2 * len(state.children or ())
+        cdef Py_UCS4* own_letters = NULL
+        cdef Py_ssize_t* own_offsets = NULL
+        cdef Py_UCS4* fail_letters = NULL
+        cdef uint32_t* fail_targets = NULL
+        cdef uint32_t* c_targets
+        cdef char* c_characters
+        cdef list matches
+        cdef dict shared_letters = None
+
+        if fail_layout is not NULL:
+            fail_count = fail_layout.char_count
+        if child_capacity or fail_count:
+            own_letters = <Py_UCS4*> cpython.mem.PyMem_Malloc(
+                (sizeof(Py_UCS4) + sizeof(Py_ssize_t)) * child_capacity +
+                (sizeof(Py_UCS4) + sizeof(uint32_t)) * fail_count)
+            if own_letters is NULL:
+                raise MemoryError()
+            own_offsets = <Py_ssize_t*> (own_letters + child_capacity)
+            fail_letters = <Py_UCS4*> (own_offsets + child_capacity)
+            fail_targets = <uint32_t*> (fail_letters + fail_count)
+        try:
+            if state.children:
+                own_count = _collect_own_targets(
+                    state, ignore_case, self.char_size == 1, self.case_folding,
+                    node_offsets, own_letters, own_offsets)
+            # merging can only add transitions to those of the failure node
+            self._reserve_transitions(_transition_block_size(own_count + fail_count, self.char_size))
+            if fail_count:
+                if ignore_case and state.fail.children:
+                    shared_letters = _shared_letter_targets(
+                        state.fail, self.char_size == 1, self.case_folding, node_offsets)
+                c_targets = <uint32_t*> (self.transitions + fail_layout.transitions)
+                for j in range(fail_count):
+                    if self.char_size == 1:
+                        fail_letters[j] = (<unsigned char*> (c_targets + fail_count))[j]
+                    else:
+                        fail_letters[j] = (<Py_UCS4*> (c_targets + fail_count))[j]
+                    fail_targets[j] = c_targets[j]
+                    if shared_letters is not None and fail_letters[j] in shared_letters:
+                        # the failure node goes to the last child for this letter
+                        fail_targets[j] = <uint32_t> shared_letters[fail_letters[j]]
+            child_count = _count_merged_transitions(own_letters, own_count, fail_letters, fail_count)
+
+            c_targets = <uint32_t*> (self.transitions + self.transitions_size)
+            c_characters = <char*> (c_targets + child_count)
+            # merge the sorted transitions, giving precedence to the own children
+            i = j = 0
+            for k in range(child_count):
+                if j >= fail_count or (i < own_count and own_letters[i] <= fail_letters[j]):
+                    if j < fail_count and own_letters[i] == fail_letters[j]:
+                        j += 1
+                    c_targets[k] = <uint32_t> own_offsets[i]
+                    _set_character(c_characters, k, own_letters[i], self.char_size)
+                    i += 1
+                else:
+                    c_targets[k] = fail_targets[j]
+                    _set_character(c_characters, k, fail_letters[j], self.char_size)
+                    j += 1
+        finally:
+            cpython.mem.PyMem_Free(own_letters)
+
+        layout.transitions = self.transitions_size
+        layout.char_count = child_count
+        self.transitions_size += _transition_block_size(child_count, self.char_size)
+
+        if not state.matches:
+            # share the matches of the failure state
+            layout.matches = fail_layout.matches if fail_layout is not NULL else -1
+            return 0
+
+        matches = list(state.matches)
+        if fail_layout is not NULL and fail_layout.matches >= 0:
+            j = fail_layout.matches
+            while self.match_ids[j] != MATCH_END:
+                matches.append(keywords[self.match_ids[j]])
+                j += 1
+        if len(matches) > 1:
+            matches.sort(key=len, reverse=True)
+        self._reserve_match_ids(len(matches) + 1)
+        layout.matches = self.match_id_count
+        for match in matches:
+            self.match_ids[self.match_id_count] = keyword_ids[match]
+            self.match_id_count += 1
+        self.match_ids[self.match_id_count] = MATCH_END
+        self.match_id_count += 1
+
+
+cdef inline void _set_character(char* characters, Py_ssize_t i, Py_UCS4 ch, size_t char_size) noexcept:
+    if char_size == 1:
+        (<unsigned char*> characters)[i] = <unsigned char> ch
     else:
-        # dict[key] is much faster than creating and sorting item tuples
-        for i, character in enumerate(sorted(targets)):
-            c_node.targets[i] = all_nodes + <size_t>node_offsets[targets[character]]
-            c_characters[i] = character
+        (<Py_UCS4*> characters)[i] = ch
 
-    c_node.characters = c_characters
-    c_node.char_count = child_count
+
+cdef int _init_nodes_from_arenas(_NodeArenaBuilder builder, _AcoraNodeStruct** nodes_out,
+                                 void** transitions_out, uint32_t** match_ids_out) except -1:
+    """Set up the node array and take over the transition and match id
+    blocks of the builder, shrunk to their final size.
+    """
+    cdef _NodeLayout* layout
+    cdef Py_ssize_t i
+    cdef void* block
+    cdef _AcoraNodeStruct* nodes = <_AcoraNodeStruct*> cpython.mem.PyMem_Malloc(
+        sizeof(_AcoraNodeStruct) * builder.node_count)
+    if nodes is NULL:
+        raise MemoryError()
+    nodes_out[0] = nodes
+
+    if builder.transitions_size:
+        block = cpython.mem.PyMem_Realloc(builder.transitions, builder.transitions_size)
+        if block is not NULL:
+            builder.transitions = <char*> block
+    transitions_out[0], builder.transitions = builder.transitions, NULL
+    if builder.match_id_count:
+        block = cpython.mem.PyMem_Realloc(builder.match_ids, sizeof(uint32_t) * builder.match_id_count)
+        if block is not NULL:
+            builder.match_ids = <uint32_t*> block
+    match_ids_out[0], builder.match_ids = builder.match_ids, NULL
+
+    for i in range(builder.node_count):
+        layout = builder.layouts + i
+        nodes[i].char_count = layout.char_count
+        nodes[i].targets = <uint32_t*> (<char*> transitions_out[0] + layout.transitions)
+        nodes[i].match_ids = match_ids_out[0] + layout.matches if layout.matches >= 0 else NULL
+        if _AcoraNodeStruct is _AcoraUnicodeNodeStruct:
+            nodes[i].characters = <Py_UCS4*> (nodes[i].targets + layout.char_count)
+        else:
+            nodes[i].characters = <unsigned char*> (nodes[i].targets + layout.char_count)
 
 
-cdef int _init_bytes_node(
-        _AcoraBytesNodeStruct* c_node, state,
-        _AcoraBytesNodeStruct* all_nodes,
-        dict node_offsets, dict pyrefs, bint ignore_case) except -1:
-    cdef _MachineState child, fail_state
-    cdef size_t mem_size
+cdef tuple _collect_keywords(_Machine machine):
+    """Build the keyword table of a machine, indexed by keyword id.
+    """
+    keywords = set()
+    for state in machine.child_states:
+        if (<_MachineState>state).matches:
+            keywords.update((<_MachineState>state).matches)
+    return tuple(sorted(keywords))
+
+
+cdef Py_ssize_t _max_keyword_length(tuple keywords):
+    cdef Py_ssize_t max_length = 0
+    for keyword in keywords:
+        if len(keyword) > max_length:
+            max_length = len(keyword)
+    return max_length
+
+
+cdef Py_ssize_t* _init_keyword_lengths(tuple keywords) except NULL:
     cdef Py_ssize_t i
-    cdef unicode letter
-    cdef dict targets
-
-    # merge children failure states and matches to avoid deep failure state traversal
-    targets, matches = merge_targets(state, ignore_case)
-    cdef size_t child_count = len(targets)
-
-    # use a single malloc for targets and match-string pointers
-    mem_size = targets_mem_size = sizeof(_AcoraBytesNodeStruct**) * len(targets)
-    if matches:
-        mem_size += sizeof(PyObject*) * (len(matches) + 1) # NULL terminated
-    c_node.targets = <_AcoraBytesNodeStruct**> cpython.mem.PyMem_Malloc(mem_size)
-    if c_node.targets is NULL:
+    # allocate at least one entry to distinguish an empty table from a memory error
+    cdef Py_ssize_t* lengths = <Py_ssize_t*> cpython.mem.PyMem_Malloc(
+        sizeof(Py_ssize_t) * (len(keywords) or 1))
+    if lengths is NULL:
         raise MemoryError()
+    for i, keyword in enumerate(keywords):
+        lengths[i] = len(keyword)
+    return lengths
 
-    if mem_size == targets_mem_size:  # no matches
-        c_node.matches = NULL
-    else:
-        c_node.matches = <PyObject**> (c_node.targets + len(targets))
-        matches = _intern(pyrefs, tuple(matches))
-        i = 0
-        for match in matches:
-            c_node.matches[i] = <PyObject*>match
-            i += 1
-        c_node.matches[i] = NULL
-
-    characters = cpython.bytes.PyBytes_FromStringAndSize(NULL, len(targets))
-    cdef unsigned char *c_characters = characters
-    if len(targets) == len(state.children):
-        for i, child in enumerate(state.children):
-            c_node.targets[i] = all_nodes + <size_t>node_offsets[child]
-            c_characters[i] = child.letter
-    else:
-        # dict[key] is much faster than creating and sorting item tuples
-        for i, character in enumerate(sorted(targets)):
-            c_node.targets[i] = all_nodes + <size_t>node_offsets[targets[character]]
-            c_characters[i] = <Py_UCS4>character
-    characters = _intern(pyrefs, characters)
 
-    c_node.characters = characters
-    c_node.char_count = len(characters)
+cdef int _check_report(report) except -1:
+    if report not in ('keyword', 'id', 'value'):
+        raise ValueError("report must be one of 'keyword', 'id' or 'value', got %r" % (report,))
 
 
-cdef inline _intern(dict d, obj):
-    if obj in d:
-        return d[obj]
-    d[obj] = obj
-    return obj
+cdef tuple _keyword_values(tuple keywords, dict values):
+    if values is None:
+        return None
+    return tuple([values.get(keyword) for keyword in keywords])
+
+
+cdef tuple _report_objects(tuple keywords, tuple values, str report):
+    if report == 'id':
+        return tuple(range(len(keywords)))
+    elif report == 'value':
+        return values if values is not None else (None,) * len(keywords)
+    return keywords
+
+
+cdef dict _counts_by_object(tuple objects, const Py_ssize_t* keyword_counts):
+    # several keywords can report the same value
+    cdef Py_ssize_t i
+    counts = {}
+    for i, obj in enumerate(objects):
+        if keyword_counts[i]:
+            counts[obj] = counts.get(obj, 0) + keyword_counts[i]
+    return counts
+
+
+cdef dict _engine_stats(_AcoraNodeStruct* nodes, Py_ssize_t node_count, tuple keywords,
+                        Py_ssize_t max_keyword_length, size_t native_size, Py_ssize_t image_size):
+    cdef Py_ssize_t i, transition_count = 0
+    fanout = {}
+    for i in range(node_count):
+        transition_count += nodes[i].char_count
+        fanout[nodes[i].char_count] = fanout.get(nodes[i].char_count, 0) + 1
+    return {
+        'state_count': node_count,
+        'transition_count': transition_count,
+        'fanout': fanout,
+        'keyword_count': len(keywords),
+        'max_keyword_length': max_keyword_length,
+        'native_size': native_size,
+        'python_size': sys.getsizeof(keywords) + sum([sys.getsizeof(keyword) for keyword in keywords]),
+        'image_size': image_size,
+    }
 
 
 cdef dict group_transitions_by_state(dict transitions):
@@ -308,61 +840,526 @@ cdef dict group_transitions_by_state(dict transitions):
     return transitions_by_state
 
 
+# match result collection
+
+cdef array.array _index_array_template = None
+
+cdef array.array _new_index_array(Py_ssize_t size):
+    global _index_array_template
+    if _index_array_template is None:
+        _index_array_template = array.array('q')
+    return array.clone(_index_array_template, size, zero=False)
+
+
+@cython.final
+cdef class _MatchCollector:
+    """Collects (keyword id, offset) pairs into growing arrays, without requiring the GIL.
+    """
+    cdef array.array keyword_ids
+    cdef array.array offsets
+    cdef Py_ssize_t count
+
+    def __cinit__(self):
+        self.keyword_ids = _new_index_array(MATCH_COLLECTOR_INITIAL_SIZE)
+        self.offsets = _new_index_array(MATCH_COLLECTOR_INITIAL_SIZE)
+        self.count = 0
+
+    cdef int append(self, Py_ssize_t keyword_id, Py_ssize_t offset) except -1 nogil:
+        if self.count >= self.keyword_ids.ob_size:
+            with gil:
+                self._grow()
+        self.keyword_ids.data.as_longlongs[self.count] = keyword_id
+        self.offsets.data.as_longlongs[self.count] = offset
+        self.count += 1
+
+    cdef int _grow(self) except -1:
+        array.resize_smart(self.keyword_ids, self.count * 2)
+        array.resize_smart(self.offsets, self.count * 2)
+
+    cdef void to_character_offsets(self, Py_ssize_t first, const unsigned char* data_start,
+                                   Py_ssize_t byte_position, Py_ssize_t character_position,
+                                   const Py_ssize_t* keyword_lengths,
+                                   const Py_ssize_t* character_lengths) noexcept nogil:
+        """Convert the byte offsets of the matches from index 'first' on into character offsets.
+
+        The matches must end in the UTF-8 encoded data in the order of their end.
+        The data starts at the given byte and character position of the input.
+        """
+        cdef const unsigned char* counted_char = data_start
+        cdef const unsigned char* match_end
+        cdef Py_ssize_t i, keyword_id
+        for i in range(first, self.count):
+            keyword_id = self.keyword_ids.data.as_longlongs[i]
+            match_end = data_start + (
+                self.offsets.data.as_longlongs[i] + keyword_lengths[keyword_id] - byte_position)
+            character_position += _count_characters(counted_char, match_end)
+            counted_char = match_end
+            self.offsets.data.as_longlongs[i] = character_position - character_lengths[keyword_id]
+
+    cdef tuple finish(self):
+        array.resize(self.keyword_ids, self.count)
+        array.resize(self.offsets, self.count)
+        return self.keyword_ids, self.offsets
+
+
+cdef int _match_mode(mode) except -1:
+    if mode == 'overlapping':
+        return MODE_OVERLAPPING
+    elif mode == 'leftmost_longest':
+        return MODE_LEFTMOST_LONGEST
+    elif mode == 'leftmost_shortest':
+        return MODE_LEFTMOST_SHORTEST
+    elif mode == 'non_overlapping':
+        return MODE_NON_OVERLAPPING
+    raise ValueError(
+        "mode must be one of 'overlapping', 'leftmost_longest', 'leftmost_shortest' "
+        "or 'non_overlapping', got %r" % (mode,))
+
+
+# parallel search support
+
+cdef list _split_into_chunks(Py_ssize_t data_len, Py_ssize_t overlap, workers):
+    """Split the data into one (start, report_start, end) range per worker.
+
+    Each chunk reports the matches that end within data[report_start:end]
+    and starts scanning ``overlap`` characters earlier to find them.
+    """
+    if workers is None:
+        try:
+            workers = os.cpu_count() or 1
+        except AttributeError:
+            # Py2
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+    elif workers < 1:
+        raise ValueError("workers must be a positive number, got %r" % (workers,))
+    cdef Py_ssize_t chunk_count = min(workers, data_len // PARALLEL_MIN_CHUNK_SIZE) or 1
+    cdef Py_ssize_t report_start, end = 0
+    chunks = []
+    for i in range(1, chunk_count + 1):
+        report_start, end = end, data_len * i // chunk_count
+        chunks.append((max(0, report_start - overlap), report_start, end))
+    return chunks
+
+
+def _run_in_threads(function, list arguments):
+    """Call the function once per argument tuple, each in its own thread.
+
+    Returns the list of results in the order of the arguments.
+    """
+    results = [None] * len(arguments)
+    errors = []
+
+    def run(i, args):
+        try:
+            results[i] = function(*args)
+        except BaseException as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(i, args))
+               for i, args in enumerate(arguments[1:], 1)]
+    for thread in threads:
+        thread.start()
+    # use the current thread for the first chunk
+    run(0, arguments[0])
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+cdef list _matches_from_arrays(tuple keywords, list match_arrays):
+    cdef array.array keyword_ids, offsets
+    cdef Py_ssize_t i
+    matches = []
+    for keyword_ids, offsets in match_arrays:
+        for i in range(len(keyword_ids)):
+            matches.append((keywords[keyword_ids.data.as_longlongs[i]], offsets.data.as_longlongs[i]))
+    return matches
+
+
+# batch search support
+
+cdef list _split_matches_by_document(tuple keywords, tuple matches, array.array match_ends):
+    cdef array.array keyword_ids, offsets
+    cdef Py_ssize_t i, start = 0, end
+    keyword_ids, offsets = matches
+    results = []
+    for end in match_ends:
+        results.append([
+            (keywords[keyword_ids.data.as_longlongs[i]], offsets.data.as_longlongs[i])
+            for i in range(start, end)])
+        start = end
+    return results
+
+
+cdef tuple _add_document_indices(tuple matches, array.array match_ends):
+    cdef array.array keyword_ids, offsets
+    keyword_ids, offsets = matches
+    cdef array.array doc_indices = _new_index_array(len(keyword_ids))
+    cdef Py_ssize_t doc_index, i = 0, end
+    for doc_index, end in enumerate(match_ends):
+        while i < end:
+            doc_indices.data.as_longlongs[i] = doc_index
+            i += 1
+    return doc_indices, keyword_ids, offsets
+
+
 # unicode data handling
 
+cdef Py_ssize_t _init_fold_table(_AcoraUnicodeEngine* engine, dict case_folding) except -1:
+    """Set up the lookup table that folds the input characters of a case
+    insensitive search, see _case_folding().  Returns its size in bytes.
+    """
+    cdef Py_UCS4 uc, letter
+    cdef uint32_t code, limit = 0
+    cdef Py_ssize_t i, block_count, size
+    if not case_folding:
+        return 0
+    blocks = set()
+    for uc in case_folding:
+        code = uc
+        if code >= limit:
+            limit = code + 1
+        blocks.add(code >> 8)
+    # the first block of deltas is shared by all blocks without folded characters
+    block_count = ((limit - 1) >> 8) + 1
+    size = sizeof(uint32_t) * block_count + sizeof(int32_t) * 256 * (len(blocks) + 1)
+    engine.fold_blocks = <uint32_t*> cpython.mem.PyMem_Malloc(size)
+    if engine.fold_blocks is NULL:
+        raise MemoryError()
+    engine.fold_deltas = <int32_t*> (engine.fold_blocks + block_count)
+    memset(engine.fold_blocks, 0, size)
+    for i, block in enumerate(sorted(blocks), 1):
+        engine.fold_blocks[block] = 256 * i
+    for uc, letter in case_folding.items():
+        code = uc
+        engine.fold_deltas[engine.fold_blocks[code >> 8] + (code & 0xFF)] = <int32_t> letter - <int32_t> code
+    engine.fold_limit = limit
+    return size
+
+
+cdef inline Py_UCS4 _fold_case(const _AcoraUnicodeEngine* engine, Py_UCS4 ch) noexcept nogil:
+    cdef uint32_t code = ch
+    if code < engine.fold_limit:
+        return <Py_UCS4> (<int32_t> code + engine.fold_deltas[engine.fold_blocks[code >> 8] + (code & 0xFF)])
+    return ch
+
+
+cdef Py_ssize_t _init_latin1_engine(_AcoraUnicodeEngine* engine, Py_ssize_t node_count,
+                                    layout) except -1:
+    """Build the byte-width copy of the automaton that searches 1-byte kind strings.
+
+    Each node keeps the transitions of its characters below 256, and of the
+    characters below 256 that case folding maps to its characters, so that
+    the bytes engine can search the string data directly.  The node array
+    and the transitions are allocated in one block.
+
+    Returns the size of the block.
+    """
+    cdef _AcoraUnicodeNodeStruct* u_node
+    cdef _AcoraBytesNodeStruct* b_node
+    cdef _AcoraBytesNodeStruct* nodes
+    cdef Py_ssize_t i, transitions_size = 0, size
+    cdef char* block
+    # the transitions of a node, at most one per byte value
+    cdef unsigned char characters[256]
+    cdef uint32_t targets[256]
+    # the characters below 256 that case folding changes, ordered by their folded character
+    cdef unsigned char folded_chars[256]
+    cdef Py_UCS4 folded_to[256]
+    cdef int folded_count = 0, j
+    cdef Py_UCS4 ch, folded
+
+    for ch in range(256):
+        folded = _fold_case(engine, ch)
+        if folded == ch:
+            continue
+        j = folded_count
+        while j > 0 and folded_to[j-1] > folded:
+            folded_chars[j], folded_to[j] = folded_chars[j-1], folded_to[j-1]
+            j -= 1
+        folded_chars[j], folded_to[j] = <unsigned char> ch, folded
+        folded_count += 1
+
+    for i in range(node_count):
+        transitions_size += _transition_block_size(_collect_latin1_transitions(
+            engine, engine.start_node + i, folded_chars, folded_to, folded_count,
+            characters, targets), 1)
+    size = sizeof(_AcoraBytesNodeStruct) * node_count + transitions_size
+    nodes = <_AcoraBytesNodeStruct*> cpython.mem.PyMem_Malloc(size)
+    if nodes is NULL:
+        raise MemoryError()
+    engine.latin1.start_node = nodes
+
+    block = <char*> (nodes + node_count)
+    for i in range(node_count):
+        u_node = engine.start_node + i
+        b_node = nodes + i
+        b_node.match_ids = u_node.match_ids
+        b_node.char_count = _collect_latin1_transitions(
+            engine, u_node, folded_chars, folded_to, folded_count, characters, targets)
+        b_node.targets = <uint32_t*> block
+        b_node.characters = <unsigned char*> (b_node.targets + b_node.char_count)
+        memcpy(b_node.targets, targets, sizeof(uint32_t) * b_node.char_count)
+        memcpy(b_node.characters, characters, b_node.char_count)
+        block += _transition_block_size(b_node.char_count, 1)
+
+    _init_layout(&engine.latin1, node_count, layout)
+    return size
+
+
+cdef int _collect_latin1_transitions(const _AcoraUnicodeEngine* engine,
+                                     const _AcoraUnicodeNodeStruct* u_node,
+                                     const unsigned char* folded_chars, const Py_UCS4* folded_to,
+                                     int folded_count, unsigned char* characters,
+                                     uint32_t* targets) noexcept:
+    """Collect the transitions of a node for the input characters below 256,
+    sorted by character.
+    """
+    cdef int i, j = 0, k, count = 0
+    cdef Py_UCS4 ch
+    cdef unsigned char byte_value
+    cdef uint32_t target
+    for i in range(u_node.char_count):
+        ch = u_node.characters[i]
+        if ch >= 256 and j == folded_count:
+            break
+        if ch < 256 and _fold_case(engine, ch) == ch:
+            characters[count], targets[count] = <unsigned char> ch, u_node.targets[i]
+            count += 1
+        while j < folded_count and folded_to[j] < ch:
+            j += 1
+        while j < folded_count and folded_to[j] == ch:
+            characters[count], targets[count] = folded_chars[j], u_node.targets[i]
+            count += 1
+            j += 1
+
+    if folded_count:
+        # insertion sort the characters that are folded into other ones
+        for i in range(1, count):
+            byte_value, target = characters[i], targets[i]
+            k = i
+            while k > 0 and characters[k-1] > byte_value:
+                characters[k], targets[k] = characters[k-1], targets[k-1]
+                k -= 1
+            characters[k], targets[k] = byte_value, target
+    return count
+
+
 cdef class UnicodeAcora:
     """Acora search engine for unicode data.
+
+    Strings of the 1-byte kind, i.e. Latin-1 text, are searched with
+    a byte-width copy of the automaton, whose ``layout`` is selected
+    as for ``BytesAcora``.
     """
-    cdef _AcoraUnicodeNodeStruct* start_node
+    cdef _AcoraUnicodeEngine engine
     cdef Py_ssize_t node_count
-    cdef tuple _pyrefs
+    # the node data of built engines, nodes point into it
+    cdef void* _transition_arena
+    cdef uint32_t* _match_id_arena
+    cdef size_t _arena_size  # the allocated size of the node array and arenas
+    cdef size_t _fold_table_size
+    cdef size_t _latin1_size  # the allocated size of the nodes of the byte-width automaton
+    cdef tuple _keywords
+    cdef tuple _values  # indexed by keyword id, None if the keywords have no values
+    cdef tuple _match_objects  # the reported object of each keyword id
+    cdef str _report
+    cdef Py_ssize_t* _keyword_lengths
+    cdef Py_ssize_t _max_keyword_length
     cdef bint _ignore_case
+    # engines loaded from an image point into its buffer instead of owning their node data
+    cdef Py_buffer _image_view
+    cdef bint _has_image
+    cdef object _image_owner  # keeps e.g. a shared memory segment attached
 
-    def __cinit__(self, start_state, dict transitions=None):
+    def __cinit__(self, start_state, dict transitions=None, layout='auto',
+                  dict values=None, report='keyword'):
         cdef _Machine machine
-        cdef _AcoraUnicodeNodeStruct* c_nodes
-        cdef _AcoraUnicodeNodeStruct* c_node
-        cdef Py_ssize_t i
+
+        if start_state is _FROM_IMAGE:
+            return  # initialised by _init_from_image()
+
+        if layout not in ('auto', 'dense', 'sparse'):
+            raise ValueError(
+                "layout must be one of 'auto', 'dense' or 'sparse', got %r" % (layout,))
+        _check_report(report)
 
         if transitions is not None:
             # old pickle format => rebuild trie
             machine = _convert_old_format(transitions)
         else:
             machine = start_state
-        ignore_case = self._ignore_case = machine.ignore_case
-        self.node_count = len(machine.child_states) + 1
+        self._ignore_case = machine.ignore_case
+
+        keywords = self._keywords = _collect_keywords(machine)
+        self._values = _keyword_values(keywords, values)
+        self._report = report
+        self._match_objects = _report_objects(keywords, self._values, report)
+        self._keyword_lengths = _init_keyword_lengths(keywords)
+        self._max_keyword_length = _max_keyword_length(keywords)
+
+        builder = _NodeArenaBuilder(machine, keywords, sizeof(Py_UCS4))
+        _init_nodes_from_arenas(builder, &self.engine.start_node, &self._transition_arena, &self._match_id_arena)
+        self.node_count = builder.node_count
+        self._arena_size = (sizeof(_AcoraUnicodeNodeStruct) * builder.node_count + builder.transitions_size
+                            + sizeof(uint32_t) * builder.match_id_count)
+        self._fold_table_size = _init_fold_table(&self.engine, builder.case_folding)
+        self._latin1_size = _init_latin1_engine(&self.engine, self.node_count, layout)
 
-        c_nodes = self.start_node = <_AcoraUnicodeNodeStruct*> cpython.mem.PyMem_Malloc(
-            sizeof(_AcoraUnicodeNodeStruct) * self.node_count)
-        if c_nodes is NULL:
-            raise MemoryError()
+    def __dealloc__(self):
+        cpython.mem.PyMem_Free(self.engine.start_node)
+        cpython.mem.PyMem_Free(self.engine.fold_blocks)
+        cpython.mem.PyMem_Free(self.engine.latin1.start_node)
+        cpython.mem.PyMem_Free(self.engine.latin1.transitions)
+        cpython.mem.PyMem_Free(self._transition_arena)
+        cpython.mem.PyMem_Free(self._match_id_arena)
+        cpython.mem.PyMem_Free(self._keyword_lengths)
+        if self._has_image:
+            cpython.buffer.PyBuffer_Release(&self._image_view)
+
+    @property
+    def keywords(self):
+        """The tuple of all keywords, indexed by their keyword id.
+        """
+        return self._keywords
+
+    @property
+    def values(self):
+        """The tuple of the keyword values, indexed by their keyword id,
+        or None if no values were passed.
+        """
+        return self._values
 
-        for c_node in c_nodes[:self.node_count]:
-            # required by __dealloc__ in case of subsequent errors
-            c_node.targets = NULL
+    @property
+    def report(self):
+        """What matches report instead of the keyword, "keyword", "id" or "value".
+        """
+        return self._report
 
-        node_offsets = {state: i for i, state in enumerate(machine.child_states, 1)}
-        node_offsets[machine.start_state] = 0
-        pyrefs = {}  # used to keep Python references alive (and intern them)
+    @property
+    def layout(self):
+        """The layout of the automaton for 1-byte kind strings, either "dense" or "sparse".
+        """
+        return 'sparse' if self.engine.latin1.transitions is NULL else 'dense'
+
+    def stats(self):
+        """Return a dict with statistics about the automaton and its memory usage.
+
+        It contains the ``state_count``, the ``transition_count`` of all
+        states, including those inherited from their failure states, the
+        ``fanout`` distribution that maps transition counts to the number
+        of states that have them, the ``keyword_count`` and the
+        ``max_keyword_length``.  ``native_size`` is the number of bytes
+        allocated outside of Python objects, ``python_size`` that of the
+        keyword objects and ``image_size`` that of the data that a loaded
+        engine was mapped from.
+        """
+        return _engine_stats(self.engine.start_node, self.node_count, self._keywords, self._max_keyword_length,
+                             self._native_size(), self._image_view.len if self._has_image else 0)
 
-        _init_unicode_node(c_nodes, machine.start_state, c_nodes, node_offsets, pyrefs, ignore_case)
-        for i, state in enumerate(machine.child_states, 1):
-            _init_unicode_node(c_nodes + i, state, c_nodes, node_offsets, pyrefs, ignore_case)
-        self._pyrefs = tuple(pyrefs)
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._native_size()
 
-    def __dealloc__(self):
-        cdef Py_ssize_t i
-        if self.start_node is not NULL:
+    cdef size_t _native_size(self):
+        cdef size_t size = (self._arena_size + self._fold_table_size + self._latin1_size
+                            + sizeof(Py_ssize_t) * len(self._keywords))
+        if self.engine.latin1.transitions is not NULL:
+            size += sizeof(uint32_t) * self.node_count * self.engine.latin1.class_count
+        return size
+
+    def save(self, f):
+        """Write the search engine to a file in a compact binary format.
+
+        ``f`` can be a file name or a binary file object.  Use ``load()``
+        to restore the engine on the same platform.
+        """
+        _write_image(f, self._image())
+
+    cdef bytearray _image(self):
+        return _build_image(
+            self.engine.start_node, self.node_count, self._keywords,
+            IMAGE_FLAG_UNICODE | (IMAGE_FLAG_IGNORE_CASE if self._ignore_case else 0) |
+            (IMAGE_FLAG_DENSE if self.engine.latin1.transitions is not NULL else 0) |
+            _image_report_flag(self._report))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a search engine that was written by ``save()``.
+
+        By default, the file is memory mapped and the engine searches the
+        mapped data directly, without rebuilding its automaton, so that
+        all processes that load the same file share its memory in the
+        page cache.  A mapped file must not be modified while it is in use,
+        so replace it by writing a new file and renaming it.  Pass
+        ``mmap=False`` to read the file into private memory instead.
+        """
+        return _engine_from_image(cls, _read_image(path, mmap))
+
+    def to_shared_memory(self, name=None):
+        """Copy the search engine into a new ``multiprocessing.shared_memory``
+        segment, from which other processes can use it with
+        ``from_shared_memory(name)``.
+
+        Returns the ``SharedMemory`` object.  The caller owns the segment
+        and must ``close()`` and ``unlink()`` it when it is no longer needed.
+        Requires Python 3.8 or later.
+        """
+        from acora._shm import image_to_shared_memory
+        return image_to_shared_memory(self._image(), name)
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """Attach to a search engine in a shared memory segment that was
+        created by ``to_shared_memory()``.
+
+        The engine maps the segment read-only and searches the shared data
+        directly, without copying it or rebuilding its automaton.  The
+        segment stays mapped as long as the engine is alive.
+        """
+        from acora._shm import attach_shared_memory
+        data, owner = attach_shared_memory(name)
+        return _engine_from_image(cls, data, owner)
+
+    cdef int _init_from_image(self, data) except -1:
+        # keep in sync with BytesAcora._init_from_image()
+        cdef const unsigned char* image
+        cdef const _ImageHeader* header
+        cdef _AcoraUnicodeNodeStruct* c_node
+        cdef Py_ssize_t i, j
+        cpython.buffer.PyObject_GetBuffer(data, &self._image_view, cpython.buffer.PyBUF_SIMPLE)
+        self._has_image = True
+        image = <const unsigned char*> self._image_view.buf
+        header = _check_image(image, self._image_view.len, IMAGE_FLAG_UNICODE)
+        self._ignore_case = header.flags & IMAGE_FLAG_IGNORE_CASE
+        keywords = self._keywords = _image_keywords(image, header)
+        self._report = 'id' if header.flags & IMAGE_FLAG_REPORT_IDS else 'keyword'
+        self._match_objects = _report_objects(keywords, None, self._report)
+        self._keyword_lengths = _init_keyword_lengths(keywords)
+        self._max_keyword_length = _max_keyword_length(keywords)
+        self.node_count = header.node_count
+        self._arena_size = sizeof(_AcoraUnicodeNodeStruct) * self.node_count
+        self.engine.start_node = <_AcoraUnicodeNodeStruct*> cpython.mem.PyMem_Malloc(self._arena_size)
+        if self.engine.start_node is NULL:
+            raise MemoryError()
+        _init_nodes_from_image(self.engine.start_node, image, header)
+        if self._ignore_case:
+            # the characters of the transitions lead to the same case folding as the keywords
+            letters = set()
             for i in range(self.node_count):
-                if self.start_node[i].targets is not NULL:
-                    cpython.mem.PyMem_Free(self.start_node[i].targets)
-            cpython.mem.PyMem_Free(self.start_node)
+                c_node = self.engine.start_node + i
+                for j in range(c_node.char_count):
+                    letters.add(c_node.characters[j])
+            self._fold_table_size = _init_fold_table(&self.engine, _case_folding(letters))
+        self._latin1_size = _init_latin1_engine(
+            &self.engine, self.node_count, 'dense' if header.flags & IMAGE_FLAG_DENSE else 'sparse')
 
     def __reduce__(self):
         """pickle"""
         cdef _AcoraUnicodeNodeStruct* c_node
-        cdef _AcoraUnicodeNodeStruct* c_child
-        cdef _AcoraUnicodeNodeStruct* c_start_node = self.start_node
+        cdef _AcoraUnicodeNodeStruct* c_start_node = self.engine.start_node
         cdef Py_ssize_t state_id, i
         cdef bint ignore_case
         states = {}
@@ -371,12 +1368,12 @@ cdef class UnicodeAcora:
             state = states[state_id] = {'id': state_id}
             states_list.append(state)
             c_node = c_start_node + state_id
-            if c_node.matches:
+            if c_node.match_ids is not NULL:
                 state['m'] = matches = []
-                match = c_node.matches
-                while match[0]:
-                    matches.append(<unicode>match[0])
-                    match += 1
+                i = 0
+                while c_node.match_ids[i] != MATCH_END:
+                    matches.append(self._keywords[c_node.match_ids[i]])
+                    i += 1
 
         # create child links
         ignore_case = self._ignore_case
@@ -391,30 +1388,294 @@ cdef class UnicodeAcora:
                 if ignore_case and ch.isupper():
                     # ignore upper case characters, assuming that lower case exists as well
                     continue
-                c_child = c_node.targets[i]
-                child_id = c_child - c_start_node
-                children.append((ch, child_id))
+                children.append((ch, c_node.targets[i]))
 
-        return _unpickle, (self.__class__, states_list, self._ignore_case,)
+        return _unpickle, (self.__class__, states_list, self._ignore_case, self.layout,
+                           self._values_dict(), self._report)
 
-    cpdef finditer(self, unicode data):
+    cdef dict _values_dict(self):
+        return dict(zip(self._keywords, self._values)) if self._values is not None else None
+
+    cpdef finditer(self, unicode data, mode='overlapping'):
         """Iterate over all occurrences of any keyword in the string.
 
+        The ``mode`` selects the reported matches.  "overlapping" reports
+        all of them.  The other modes report non-overlapping matches and
+        continue searching behind each reported match: "leftmost_longest"
+        picks the longest keyword at the leftmost match position,
+        "leftmost_shortest" the shortest one, and
+        "non_overlapping" the longest keyword of the match that ends first.
+        These modes search the whole string up front.
+
         Returns (keyword, offset) pairs.
         """
-        if self.start_node.char_count == 0:
+        if _match_mode(mode) != MODE_OVERLAPPING:
+            return iter(self.findall(data, mode))
+        if self.engine.start_node.char_count == 0:
             return iter(())
         return _UnicodeAcoraIter(self, data)
 
-    def findall(self, unicode data):
+    def findall(self, unicode data, mode='overlapping'):
         """Find all occurrences of any keyword in the string.
 
+        See ``finditer()`` for the available match modes.
+
         Returns a list of (keyword, offset) pairs.
         """
+        cdef int match_mode = _match_mode(mode)
+        if match_mode != MODE_OVERLAPPING:
+            return _matches_from_arrays(
+                self._match_objects, [self._find_without_overlaps(data, match_mode)])
         return list(self.finditer(data))
 
+    def findall_arrays(self, unicode data not None, mode='overlapping'):
+        """Find all occurrences of any keyword in the string.
 
-def _unpickle(type cls not None, list states_list not None, bint ignore_case):
+        Returns a pair of arrays (keyword_ids, offsets) of type 'q' that
+        list the matches in the same order as ``findall()``.  The keyword
+        ids are indices into the ``keywords`` tuple.
+        """
+        cdef int match_mode = _match_mode(mode)
+        if match_mode != MODE_OVERLAPPING:
+            return self._find_without_overlaps(data, match_mode)
+        return self._find_matches(data, 0, 0, PY_SSIZE_T_MAX)
+
+    cdef tuple _find_without_overlaps(self, unicode data, int mode):
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef Py_ssize_t data_len
+        cdef void* data_start
+        cdef int kind
+        if data is None:
+            raise TypeError("expected unicode string, got None")
+        if self.engine.start_node.char_count == 0:
+            return collector.finish()
+        data_start = _unicode_data(data, &data_len, &kind)
+        with nogil:
+            _find_unicode_without_overlaps(
+                &self.engine, kind, data_start, data_len,
+                self._keyword_lengths, self._max_keyword_length, mode, collector)
+        return collector.finish()
+
+    def contains(self, unicode data not None):
+        """Check if the string contains any of the keywords.
+        """
+        return self.find_first(data) is not None
+
+    def find_first(self, unicode data not None):
+        """Find the first match in the string, i.e. the first one that
+        ``finditer()`` would return.
+
+        Returns a (keyword, offset) pair or None.
+        """
+        cdef _AcoraUnicodeNodeStruct* current_node = self.engine.start_node
+        cdef Py_ssize_t data_pos = 0, data_len
+        cdef void* data_start
+        cdef int kind, found
+        if self.engine.start_node.char_count == 0:
+            return None
+        data_start = _unicode_data(data, &data_len, &kind)
+        with nogil:
+            found = _search_in_unicode(&self.engine, kind, data_start, data_len,
+                                       &data_pos, &current_node)
+        if not found:
+            return None
+        keyword_id = current_node.match_ids[0]
+        return self._match_objects[keyword_id], data_pos - self._keyword_lengths[keyword_id]
+
+    def count(self, unicode data not None):
+        """Count the occurrences of all keywords in the string.
+        """
+        return self._count_matches(data, NULL)
+
+    def count_by_keyword(self, unicode data not None):
+        """Count the occurrences of each keyword in the string.
+
+        Returns a dict that maps the keywords that were found to their
+        number of occurrences.
+        """
+        cdef Py_ssize_t i
+        cdef Py_ssize_t* keyword_counts = <Py_ssize_t*> cpython.mem.PyMem_Malloc(
+            sizeof(Py_ssize_t) * (len(self._keywords) or 1))
+        if keyword_counts is NULL:
+            raise MemoryError()
+        try:
+            memset(keyword_counts, 0, sizeof(Py_ssize_t) * len(self._keywords))
+            self._count_matches(data, keyword_counts)
+            return _counts_by_object(self._match_objects, keyword_counts)
+        finally:
+            cpython.mem.PyMem_Free(keyword_counts)
+
+    cdef Py_ssize_t _count_matches(self, unicode data, Py_ssize_t* keyword_counts) except -1:
+        cdef _AcoraUnicodeNodeStruct* current_node = self.engine.start_node
+        cdef Py_ssize_t data_pos = 0, data_len, count = 0
+        cdef void* data_start
+        cdef int kind
+        cdef Py_ssize_t i
+        if self.engine.start_node.char_count == 0:
+            return 0
+        data_start = _unicode_data(data, &data_len, &kind)
+        with nogil:
+            while _search_in_unicode(&self.engine, kind, data_start, data_len,
+                                     &data_pos, &current_node):
+                i = 0
+                while current_node.match_ids[i] != MATCH_END:
+                    if keyword_counts is not NULL:
+                        keyword_counts[current_node.match_ids[i]] += 1
+                    i += 1
+                count += i
+        return count
+
+    def findall_parallel(self, unicode data not None, workers=None):
+        """Find all occurrences of any keyword in the string, using multiple threads.
+
+        Splits the string into one chunk per worker thread (by default,
+        one per CPU core) and searches the chunks in parallel without
+        holding the GIL.  Neighbouring chunks overlap by the length of
+        the longest keyword minus one so that no match is lost.
+
+        Returns the same list of (keyword, offset) pairs as ``findall()``.
+        """
+        if self.engine.start_node.char_count == 0:
+            return []
+        overlap = self._max_keyword_length - 1
+        chunks = _split_into_chunks(len(data), overlap, workers)
+        return _matches_from_arrays(self._match_objects, _run_in_threads(
+            self._find_matches, [(data,) + chunk for chunk in chunks]))
+
+    cpdef tuple _find_matches(self, unicode data, Py_ssize_t start, Py_ssize_t report_start,
+                              Py_ssize_t end):
+        """Collect the (keyword_ids, offsets) arrays of the matches in data[start:end]
+        that end behind the report_start offset.
+        """
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef _AcoraUnicodeNodeStruct* current_node = self.engine.start_node
+        cdef Py_ssize_t data_pos = start, data_len
+        cdef void* data_start
+        cdef uint32_t keyword_id
+        cdef int kind
+        cdef Py_ssize_t i
+        if self.engine.start_node.char_count == 0:
+            return collector.finish()
+
+        data_start = _unicode_data(data, &data_len, &kind)
+        if end < data_len:
+            data_len = end
+        with nogil:
+            while _search_in_unicode(&self.engine, kind, data_start, data_len,
+                                     &data_pos, &current_node):
+                if data_pos <= report_start:
+                    continue
+                i = 0
+                while current_node.match_ids[i] != MATCH_END:
+                    keyword_id = current_node.match_ids[i]
+                    collector.append(keyword_id, data_pos - self._keyword_lengths[keyword_id])
+                    i += 1
+        return collector.finish()
+
+    def stream(self):
+        """Create a scanner for searching a sequence of string chunks.
+
+        The scanner's ``feed(chunk)`` method returns the matches that end
+        in the chunk, including those that started in preceding chunks,
+        with offsets relative to the start of the stream.
+        """
+        return _UnicodeAcoraStream(self)
+
+    def afind(self, source):
+        """Asynchronously iterate over all occurrences of any keyword in a data source.
+
+        The source can be an ``asyncio.StreamReader`` (or any object with
+        an async ``read(size)`` method) or an async iterable of chunks.
+        Requires Python 3.6 or later.
+
+        Use as ``async for keyword, offset in engine.afind(source)``.
+        """
+        from acora._aio import afind
+        return afind(self, source)
+
+    def findall_many(self, documents):
+        """Find all occurrences of any keyword in each string of an iterable.
+
+        Searches all strings in a single run without holding the GIL.
+
+        Returns one list of (keyword, offset) pairs per string.
+        """
+        cdef list docs = list(documents)
+        cdef array.array match_ends = _new_index_array(len(docs))
+        matches = self._find_many(docs, match_ends)
+        return _split_matches_by_document(self._match_objects, matches, match_ends)
+
+    def search_many(self, documents):
+        """Find all occurrences of any keyword in each string of an iterable.
+
+        Searches all strings in a single run without holding the GIL.
+
+        Returns three arrays (doc_indices, keyword_ids, offsets) of type 'q'
+        that list the matches of all strings, ordered by their index in
+        the iterable.  The keyword ids are indices into the ``keywords``
+        tuple.
+        """
+        cdef list docs = list(documents)
+        cdef array.array match_ends = _new_index_array(len(docs))
+        matches = self._find_many(docs, match_ends)
+        return _add_document_indices(matches, match_ends)
+
+    cdef tuple _find_many(self, list documents, array.array match_ends):
+        """Collect the matches of all documents and store the number of
+        matches up to the end of each document in match_ends.
+        """
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef _AcoraUnicodeNodeStruct* current_node
+        cdef _UnicodeDocument* c_docs
+        cdef _UnicodeDocument* c_doc
+        cdef Py_ssize_t doc_count = len(documents), doc_index, data_pos
+        cdef uint32_t keyword_id
+        cdef Py_ssize_t i
+
+        c_docs = <_UnicodeDocument*> cpython.mem.PyMem_Malloc(
+            sizeof(_UnicodeDocument) * (doc_count or 1))
+        if c_docs is NULL:
+            raise MemoryError()
+        try:
+            for doc_index, document in enumerate(documents):
+                if not isinstance(document, unicode):
+                    raise TypeError(
+                        "expected unicode strings, got %s" % type(document).__name__)
+                c_doc = c_docs + doc_index
+                c_doc.data = _unicode_data(document, &c_doc.length, &c_doc.kind)
+
+            with nogil:
+                for doc_index in range(doc_count):
+                    c_doc = c_docs + doc_index
+                    current_node = self.engine.start_node
+                    data_pos = 0
+                    while self.engine.start_node.char_count and _search_in_unicode(
+                            &self.engine, c_doc.kind, c_doc.data, c_doc.length,
+                            &data_pos, &current_node):
+                        i = 0
+                        while current_node.match_ids[i] != MATCH_END:
+                            keyword_id = current_node.match_ids[i]
+                            collector.append(keyword_id, data_pos - self._keyword_lengths[keyword_id])
+                            i += 1
+                    match_ends.data.as_longlongs[doc_index] = collector.count
+        finally:
+            cpython.mem.PyMem_Free(c_docs)
+        return collector.finish()
+
+
+cdef _engine_from_image(type cls, data, owner=None):
+    engine = cls.__new__(cls, _FROM_IMAGE)
+    if isinstance(engine, UnicodeAcora):
+        (<UnicodeAcora> engine)._image_owner = owner
+        (<UnicodeAcora> engine)._init_from_image(data)
+    else:
+        (<BytesAcora> engine)._image_owner = owner
+        (<BytesAcora> engine)._init_from_image(data)
+    return engine
+
+
+def _unpickle(type cls not None, list states_list not None, bint ignore_case, layout=None,
+              dict values=None, report='keyword', encoding=None, offsets='bytes'):
     if not issubclass(cls, (UnicodeAcora, BytesAcora)):
         raise ValueError(
             "Invalid machine class, expected UnicodeAcora or BytesAcora, got %s" % cls.__name__)
@@ -431,12 +1692,19 @@ def _unpickle(type cls not None, list states_list not None, bint ignore_case):
             child.letter = character
             children.append(child)
 
-    return cls(_Machine(start_state, ignore_case=ignore_case))
+    machine = _Machine(start_state, ignore_case=ignore_case)
+    options = {}
+    if layout is not None:
+        options['layout'] = layout
+    if encoding is not None:
+        options['encoding'] = encoding
+        options['offsets'] = offsets
+    return cls(machine, values=values, report=report, **options)
 
 
 cdef class _UnicodeAcoraIter:
     cdef _AcoraUnicodeNodeStruct* current_node
-    cdef _AcoraUnicodeNodeStruct* start_node
+    cdef const _AcoraUnicodeEngine* engine
     cdef Py_ssize_t data_pos, data_len, match_index
     cdef unicode data
     cdef UnicodeAcora acora
@@ -444,121 +1712,481 @@ cdef class _UnicodeAcoraIter:
     cdef int unicode_kind
 
     def __cinit__(self, UnicodeAcora acora not None, unicode data not None):
-        assert acora.start_node is not NULL
-        assert acora.start_node.matches is NULL
+        assert acora.engine.start_node is not NULL
+        assert acora.engine.start_node.match_ids is NULL
         self.acora = acora
-        self.start_node = self.current_node = acora.start_node
+        self.engine = &acora.engine
+        self.current_node = acora.engine.start_node
         self.match_index = 0
         self.data = data
         self.data_pos = 0
-        if PyUnicode_IS_READY(data):
-            # PEP393 Unicode string
-            self.data_start = PyUnicode_DATA(data)
-            self.data_len = PyUnicode_GET_LENGTH(data)
-            self.unicode_kind = PyUnicode_KIND(data)
-        else:
-            # pre-/non-PEP393 Unicode string
-            self.data_start = PyUnicode_AS_UNICODE(data)
-            self.data_len = PyUnicode_GET_SIZE(data)
-            self.unicode_kind = 0
+        self.data_start = _unicode_data(data, &self.data_len, &self.unicode_kind)
 
-        if not acora.start_node.char_count:
+        if not acora.engine.start_node.char_count:
             raise ValueError("Non-empty engine required")
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        cdef void* data_start = self.data_start
-        cdef Py_UCS4* test_chars
-        cdef Py_UCS4 current_char
-        cdef int i, found = 0, start, mid, end
-        cdef Py_ssize_t data_len = self.data_len, data_pos = self.data_pos
-        cdef _AcoraUnicodeNodeStruct* start_node = self.start_node
-        cdef _AcoraUnicodeNodeStruct* current_node = self.current_node
+        cdef int found = 0
 
-        if current_node.matches is not NULL:
-            if current_node.matches[self.match_index] is not NULL:
+        if self.current_node.match_ids is not NULL:
+            if self.current_node.match_ids[self.match_index] != MATCH_END:
                 return self._build_next_match()
             self.match_index = 0
 
-        kind = self.unicode_kind
         with nogil:
-            while data_pos < data_len:
-                current_char = PyUnicode_READ(kind, data_start, data_pos)
-                data_pos += 1
-                current_node = _step_to_next_node(start_node, current_node, current_char)
-                if current_node.matches is not NULL:
-                    found = 1
-                    break
-        self.data_pos = data_pos
-        self.current_node = current_node
+            found = _search_in_unicode(
+                self.engine, self.unicode_kind, self.data_start, self.data_len,
+                &self.data_pos, &self.current_node)
         if found:
             return self._build_next_match()
         raise StopIteration
 
     cdef _build_next_match(self):
-        match = <unicode> self.current_node.matches[self.match_index]
+        keyword_id = self.current_node.match_ids[self.match_index]
         self.match_index += 1
-        return match, self.data_pos - len(match)
+        return self.acora._match_objects[keyword_id], self.data_pos - self.acora._keyword_lengths[keyword_id]
+
+
+cdef class _UnicodeAcoraStream:
+    """Incremental search over a sequence of string chunks.
+    """
+    cdef UnicodeAcora acora
+    cdef _AcoraUnicodeNodeStruct* current_node
+    cdef Py_ssize_t _position
+
+    def __cinit__(self, UnicodeAcora acora not None):
+        self.acora = acora
+        self.reset()
+
+    @property
+    def position(self):
+        """The number of characters fed into the scanner since the last reset.
+        """
+        return self._position
+
+    def reset(self):
+        """Restart the search at the beginning of a new stream.
+        """
+        self.current_node = self.acora.engine.start_node
+        self._position = 0
+
+    def feed(self, unicode data not None):
+        """Search the next chunk of the stream.
+
+        Returns a list of (keyword, offset) pairs.
+        """
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef const _AcoraUnicodeEngine* engine = &self.acora.engine
+        cdef _AcoraUnicodeNodeStruct* current_node = self.current_node
+        cdef Py_ssize_t* keyword_lengths = self.acora._keyword_lengths
+        cdef Py_ssize_t data_pos = 0, data_len, position = self._position
+        cdef void* data_start
+        cdef uint32_t keyword_id
+        cdef int kind
+        cdef Py_ssize_t i
+
+        data_start = _unicode_data(data, &data_len, &kind)
+        if engine.start_node.char_count:
+            with nogil:
+                while _search_in_unicode(engine, kind, data_start, data_len,
+                                         &data_pos, &current_node):
+                    i = 0
+                    while current_node.match_ids[i] != MATCH_END:
+                        keyword_id = current_node.match_ids[i]
+                        collector.append(keyword_id, position + data_pos - keyword_lengths[keyword_id])
+                        i += 1
+        self.current_node = current_node
+        self._position += data_len
+        return _matches_from_arrays(self.acora._match_objects, [collector.finish()])
+
+
+cdef void* _unicode_data(unicode data, Py_ssize_t* data_len, int* unicode_kind) except? NULL:
+    if PyUnicode_IS_READY(data):
+        # PEP393 Unicode string
+        data_len[0] = PyUnicode_GET_LENGTH(data)
+        unicode_kind[0] = PyUnicode_KIND(data)
+        return PyUnicode_DATA(data)
+    else:
+        # pre-/non-PEP393 Unicode string
+        data_len[0] = PyUnicode_GET_SIZE(data)
+        unicode_kind[0] = 0
+        return PyUnicode_AS_UNICODE(data)
+
+
+cdef int _search_in_unicode(const _AcoraUnicodeEngine* engine,
+                            int kind, void* data_start, Py_ssize_t data_len,
+                            Py_ssize_t* _data_pos,
+                            _AcoraUnicodeNodeStruct** _current_node) noexcept nogil:
+    """Search the string data up to the next node that has matches.
+
+    Selects the search loop for the character width of the string once per call.
+    1-byte kind strings are searched with the byte-width copy of the automaton.
+    """
+    cdef unsigned char* data_char
+    cdef _AcoraBytesNodeStruct* byte_node
+    cdef int found
+
+    if kind == 1:
+        data_char = <unsigned char*> data_start + _data_pos[0]
+        byte_node = engine.latin1.start_node + (_current_node[0] - engine.start_node)
+        found = _search_in_bytes(
+            &engine.latin1, <unsigned char*> data_start + data_len, &data_char, &byte_node)
+        _data_pos[0] = data_char - <unsigned char*> data_start
+        _current_node[0] = engine.start_node + (byte_node - engine.latin1.start_node)
+        return found
+    elif kind == 2 or (kind == 0 and sizeof(Py_UNICODE) == 2):
+        # pre-PEP393 strings have the width of Py_UNICODE
+        return _search_in_wide_chars(
+            engine, <uint16_t*> data_start, data_len, _data_pos, _current_node)
+    else:
+        return _search_in_wide_chars(
+            engine, <Py_UCS4*> data_start, data_len, _data_pos, _current_node)
+
+
+cdef int _search_in_wide_chars(const _AcoraUnicodeEngine* engine,
+                               const _wideCharType* data, Py_ssize_t data_len,
+                               Py_ssize_t* _data_pos,
+                               _AcoraUnicodeNodeStruct** _current_node) noexcept nogil:
+    cdef _AcoraUnicodeNodeStruct* start_node = engine.start_node
+    cdef Py_ssize_t data_pos = _data_pos[0]
+    cdef _AcoraUnicodeNodeStruct* current_node = _current_node[0]
+    cdef Py_UCS4 current_char
+    cdef int found = 0
+
+    while data_pos < data_len:
+        current_char = _fold_case(engine, data[data_pos])
+        data_pos += 1
+        current_node = _step_to_next_node(start_node, current_node, current_char)
+        if current_node.match_ids is not NULL:
+            found = 1
+            break
+    _data_pos[0] = data_pos
+    _current_node[0] = current_node
+    return found
+
+
+cdef int _find_unicode_without_overlaps(
+        const _AcoraUnicodeEngine* engine, int kind, void* data_start, Py_ssize_t data_len,
+        const Py_ssize_t* keyword_lengths, Py_ssize_t max_keyword_length, int mode,
+        _MatchCollector collector) except -1 nogil:
+    # keep in sync with _find_bytes_without_overlaps()
+    cdef _AcoraUnicodeNodeStruct* start_node = engine.start_node
+    cdef _AcoraUnicodeNodeStruct* current_node = start_node
+    cdef Py_ssize_t data_pos = 0, search_end = data_len
+    cdef Py_ssize_t keyword_id, start, candidate_id = -1, candidate_start = 0
+
+    while True:
+        if _search_in_unicode(engine, kind, data_start, search_end, &data_pos, &current_node):
+            # the longest match comes first and starts furthest left
+            keyword_id = current_node.match_ids[0]
+            start = data_pos - keyword_lengths[keyword_id]
+            if mode == MODE_NON_OVERLAPPING:
+                collector.append(keyword_id, start)
+                current_node = start_node
+            elif candidate_id == -1 or start < candidate_start or (
+                    start == candidate_start and mode == MODE_LEFTMOST_LONGEST):
+                candidate_id, candidate_start = keyword_id, start
+                # no match that starts at or before the candidate can end after this point
+                search_end = min(data_len, start + max_keyword_length)
+        elif candidate_id == -1:
+            break
+        else:
+            # report the candidate and continue from its end
+            collector.append(candidate_id, candidate_start)
+            data_pos = candidate_start + keyword_lengths[candidate_id]
+            current_node = start_node
+            candidate_id = -1
+            search_end = data_len
+    return 0
+
+
+# UTF-8 data handling
+
+cdef str _check_encoding(encoding, offsets):
+    """Validate the encoding and offsets options of byte engines with text keywords.
+
+    Returns the normalised encoding name.
+    """
+    if offsets not in ('bytes', 'characters'):
+        raise ValueError("offsets must be one of 'bytes' or 'characters', got %r" % (offsets,))
+    if encoding is None:
+        if offsets == 'characters':
+            raise ValueError("Character offsets require an encoding")
+        return None
+    if codecs.lookup(encoding).name != 'utf-8':
+        raise ValueError("Text keywords can only be searched in UTF-8 encoded data, got %r" % (encoding,))
+    return 'utf-8'
+
+
+cdef Py_ssize_t _count_characters(const unsigned char* data_char,
+                                  const unsigned char* data_end) noexcept nogil:
+    """Count the UTF-8 encoded characters in the data, i.e. all bytes except continuation bytes.
+    """
+    cdef Py_ssize_t count = data_end - data_char
+    cdef uint64_t word
+    while data_end - data_char >= 8:
+        # count the bytes of a machine word that match 0b10xxxxxx
+        memcpy(&word, data_char, 8)
+        word = word & ~(word << 1) & 0x8080808080808080ULL
+        count -= <Py_ssize_t> (((word >> 7) * 0x0101010101010101ULL) >> 56)
+        data_char += 8
+    while data_char < data_end:
+        count -= (data_char[0] & 0xC0) == 0x80
+        data_char += 1
+    return count
 
 
 # bytes data handling
 
 cdef class BytesAcora:
     """Acora search engine for byte data.
+
+    The ``layout`` of the automaton can be "sparse" (sorted per-state
+    transition arrays), "dense" (a flat next-state table with one entry
+    per state and class of equivalent input bytes) or "auto", which selects
+    the dense layout if its table stays reasonably small.
+
+    Engines that are built from text keywords with an ``encoding`` search
+    the encoded data and report the text keywords.  Their ``offsets`` are
+    either "bytes" or "characters", which counts the characters of the
+    UTF-8 encoded data.
     """
-    cdef _AcoraBytesNodeStruct* start_node
+    cdef _AcoraBytesEngine engine
     cdef Py_ssize_t node_count
-    cdef tuple _pyrefs
+    # the node data of built engines, nodes point into it
+    cdef void* _transition_arena
+    cdef uint32_t* _match_id_arena
+    cdef size_t _arena_size  # the allocated size of the node array and arenas
+    cdef tuple _keywords  # the searched byte strings
+    cdef tuple _text_keywords  # the decoded keywords if an encoding is used, else the same as _keywords
+    cdef str _encoding
+    cdef tuple _values  # indexed by keyword id, None if the keywords have no values
+    cdef tuple _match_objects  # the reported object of each keyword id
+    cdef str _report
+    cdef Py_ssize_t* _keyword_lengths
+    cdef Py_ssize_t* _character_lengths  # NULL unless reporting character offsets
+    cdef Py_ssize_t _max_keyword_length
     cdef bint _ignore_case
+    # engines loaded from an image point into its buffer instead of owning their node data
+    cdef Py_buffer _image_view
+    cdef bint _has_image
+    cdef object _image_owner  # keeps e.g. a shared memory segment attached
 
-    def __cinit__(self, start_state, dict transitions=None):
+    def __cinit__(self, start_state, dict transitions=None, layout='auto',
+                  dict values=None, report='keyword', encoding=None, offsets='bytes'):
         cdef _Machine machine
-        cdef _AcoraBytesNodeStruct* c_nodes
-        cdef _AcoraBytesNodeStruct* c_node
-        cdef Py_ssize_t i
+
+        if start_state is _FROM_IMAGE:
+            return  # initialised by _init_from_image()
+
+        if layout not in ('auto', 'dense', 'sparse'):
+            raise ValueError(
+                "layout must be one of 'auto', 'dense' or 'sparse', got %r" % (layout,))
+        _check_report(report)
+        encoding = _check_encoding(encoding, offsets)
 
         if transitions is not None:
             # old pickle format => rebuild trie
             machine = _convert_old_format(transitions)
         else:
             machine = start_state
-        ignore_case = self._ignore_case = machine.ignore_case
-        self.node_count = len(machine.child_states) + 1
+        self._ignore_case = machine.ignore_case
+
+        keywords = self._keywords = _collect_keywords(machine)
+        self._init_text_keywords(encoding, offsets)
+        self._values = _keyword_values(self._text_keywords, values)
+        self._report = report
+        self._match_objects = _report_objects(self._text_keywords, self._values, report)
+        self._keyword_lengths = _init_keyword_lengths(keywords)
+        self._max_keyword_length = _max_keyword_length(keywords)
+
+        builder = _NodeArenaBuilder(machine, keywords, 1)
+        _init_nodes_from_arenas(builder, &self.engine.start_node, &self._transition_arena, &self._match_id_arena)
+        self.node_count = builder.node_count
+        self._arena_size = (sizeof(_AcoraBytesNodeStruct) * builder.node_count + builder.transitions_size
+                            + sizeof(uint32_t) * builder.match_id_count)
+        _init_layout(&self.engine, self.node_count, layout)
+
+    cdef int _init_text_keywords(self, str encoding, offsets) except -1:
+        self._encoding = encoding
+        if encoding is None:
+            self._text_keywords = self._keywords
+            return 0
+        self._text_keywords = tuple([keyword.decode(encoding) for keyword in self._keywords])
+        if offsets == 'characters':
+            self._character_lengths = _init_keyword_lengths(self._text_keywords)
 
-        c_nodes = self.start_node = <_AcoraBytesNodeStruct*> cpython.mem.PyMem_Malloc(
-            sizeof(_AcoraBytesNodeStruct) * self.node_count)
-        if c_nodes is NULL:
-            raise MemoryError()
+    def __dealloc__(self):
+        cpython.mem.PyMem_Free(self.engine.start_node)
+        cpython.mem.PyMem_Free(self._transition_arena)
+        cpython.mem.PyMem_Free(self._match_id_arena)
+        cpython.mem.PyMem_Free(self.engine.transitions)
+        cpython.mem.PyMem_Free(self.engine.shifts)
+        cpython.mem.PyMem_Free(self.engine.node_depths)
+        cpython.mem.PyMem_Free(self.engine.transition_depths)
+        cpython.mem.PyMem_Free(self._keyword_lengths)
+        cpython.mem.PyMem_Free(self._character_lengths)
+        if self._has_image:
+            cpython.buffer.PyBuffer_Release(&self._image_view)
+
+    @property
+    def keywords(self):
+        """The tuple of all keywords, indexed by their keyword id.
+
+        These are the text keywords for engines that search encoded data.
+        """
+        return self._text_keywords
 
-        for c_node in c_nodes[:self.node_count]:
-            # required by __dealloc__ in case of subsequent errors
-            c_node.targets = NULL
+    @property
+    def encoding(self):
+        """The encoding of the searched data for engines that are built
+        from text keywords, else None.
+        """
+        return self._encoding
 
-        node_offsets = {state: i for i, state in enumerate(machine.child_states, 1)}
-        node_offsets[machine.start_state] = 0
-        pyrefs = {}  # used to keep Python references alive (and intern them)
+    @property
+    def offsets(self):
+        """Whether match offsets count "bytes" or "characters".
+        """
+        return 'characters' if self._character_lengths is not NULL else 'bytes'
 
-        _init_bytes_node(c_nodes, machine.start_state, c_nodes, node_offsets, pyrefs, ignore_case)
-        for i, state in enumerate(machine.child_states, 1):
-            _init_bytes_node(c_nodes + i, state, c_nodes, node_offsets, pyrefs, ignore_case)
-        self._pyrefs = tuple(pyrefs)
+    @property
+    def values(self):
+        """The tuple of the keyword values, indexed by their keyword id,
+        or None if no values were passed.
+        """
+        return self._values
 
-    def __dealloc__(self):
-        cdef Py_ssize_t i
-        if self.start_node is not NULL:
-            for i in range(self.node_count):
-                if self.start_node[i].targets is not NULL:
-                    cpython.mem.PyMem_Free(self.start_node[i].targets)
-            cpython.mem.PyMem_Free(self.start_node)
+    @property
+    def report(self):
+        """What matches report instead of the keyword, "keyword", "id" or "value".
+        """
+        return self._report
+
+    @property
+    def layout(self):
+        """The layout of the automaton, either "dense" or "sparse".
+        """
+        return 'sparse' if self.engine.transitions is NULL else 'dense'
+
+    def stats(self):
+        """Return a dict with statistics about the automaton and its memory usage.
+
+        See ``UnicodeAcora.stats()``.  The ``native_size`` includes the
+        next-state table of the dense layout.
+        """
+        return _engine_stats(self.engine.start_node, self.node_count, self._keywords,
+                             self._max_keyword_length, self._native_size(),
+                             self._image_view.len if self._has_image else 0)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self._native_size()
+
+    cdef size_t _native_size(self):
+        cdef size_t size = self._arena_size + sizeof(Py_ssize_t) * len(self._keywords)
+        if self._character_lengths is not NULL:
+            size += sizeof(Py_ssize_t) * len(self._keywords)
+        if self.engine.transitions is not NULL:
+            size += sizeof(uint32_t) * self.node_count * self.engine.class_count
+        if self.engine.shifts is not NULL:
+            size += ((<size_t> 1) << self.engine.shift_bits) + self.node_count
+            if self.engine.transition_depths is not NULL:
+                size += self.node_count * self.engine.class_count
+        return size
+
+    def save(self, f):
+        """Write the search engine to a file in a compact binary format.
+
+        ``f`` can be a file name or a binary file object.  Use ``load()``
+        to restore the engine on the same platform.
+        """
+        _write_image(f, self._image())
+
+    cdef bytearray _image(self):
+        return _build_image(
+            self.engine.start_node, self.node_count, self._keywords,
+            (IMAGE_FLAG_IGNORE_CASE if self._ignore_case else 0) |
+            (IMAGE_FLAG_DENSE if self.engine.transitions is not NULL else 0) |
+            (IMAGE_FLAG_UTF8 if self._encoding is not None else 0) |
+            (IMAGE_FLAG_CHARACTER_OFFSETS if self._character_lengths is not NULL else 0) |
+            _image_report_flag(self._report))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a search engine that was written by ``save()``.
+
+        By default, the file is memory mapped and the engine searches the
+        mapped data directly, without rebuilding its automaton, so that
+        all processes that load the same file share its memory in the
+        page cache.  A mapped file must not be modified while it is in use,
+        so replace it by writing a new file and renaming it.  Pass
+        ``mmap=False`` to read the file into private memory instead.
+        """
+        return _engine_from_image(cls, _read_image(path, mmap))
+
+    def to_shared_memory(self, name=None):
+        """Copy the search engine into a new ``multiprocessing.shared_memory``
+        segment, from which other processes can use it with
+        ``from_shared_memory(name)``.
+
+        Returns the ``SharedMemory`` object.  The caller owns the segment
+        and must ``close()`` and ``unlink()`` it when it is no longer needed.
+        Requires Python 3.8 or later.
+        """
+        from acora._shm import image_to_shared_memory
+        return image_to_shared_memory(self._image(), name)
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        """Attach to a search engine in a shared memory segment that was
+        created by ``to_shared_memory()``.
+
+        The engine maps the segment read-only and searches the shared data
+        directly, without copying it or rebuilding its automaton.  The
+        segment stays mapped as long as the engine is alive.
+        """
+        from acora._shm import attach_shared_memory
+        data, owner = attach_shared_memory(name)
+        return _engine_from_image(cls, data, owner)
+
+    cdef int _init_from_image(self, data) except -1:
+        # keep in sync with UnicodeAcora._init_from_image()
+        cdef const unsigned char* image
+        cdef const _ImageHeader* header
+        cpython.buffer.PyObject_GetBuffer(data, &self._image_view, cpython.buffer.PyBUF_SIMPLE)
+        self._has_image = True
+        image = <const unsigned char*> self._image_view.buf
+        header = _check_image(image, self._image_view.len, 0)
+        self._ignore_case = header.flags & IMAGE_FLAG_IGNORE_CASE
+        keywords = self._keywords = _image_keywords(image, header)
+        self._init_text_keywords(
+            'utf-8' if header.flags & IMAGE_FLAG_UTF8 else None,
+            'characters' if header.flags & IMAGE_FLAG_CHARACTER_OFFSETS else 'bytes')
+        self._report = 'id' if header.flags & IMAGE_FLAG_REPORT_IDS else 'keyword'
+        self._match_objects = _report_objects(self._text_keywords, None, self._report)
+        self._keyword_lengths = _init_keyword_lengths(keywords)
+        self._max_keyword_length = _max_keyword_length(keywords)
+        self.node_count = header.node_count
+        self._arena_size = sizeof(_AcoraBytesNodeStruct) * self.node_count
+        self.engine.start_node = <_AcoraBytesNodeStruct*> cpython.mem.PyMem_Malloc(self._arena_size)
+        if self.engine.start_node is NULL:
+            raise MemoryError()
+        _init_nodes_from_image(self.engine.start_node, image, header)
+
+        if header.flags & IMAGE_FLAG_DENSE:
+            _init_byte_classes(&self.engine, self.node_count)
+            _init_dense_transitions(&self.engine, self.node_count)
+        _init_prefilter(&self.engine)
 
     def __reduce__(self):
         """pickle"""
         cdef _AcoraBytesNodeStruct* c_node
-        cdef _AcoraBytesNodeStruct* c_child
-        cdef _AcoraBytesNodeStruct* c_start_node = self.start_node
+        cdef _AcoraBytesNodeStruct* c_start_node = self.engine.start_node
         cdef Py_ssize_t state_id, i
+        cdef unsigned char ch
         cdef bint ignore_case
 
         states = {}
@@ -567,12 +2195,12 @@ cdef class BytesAcora:
             state = states[state_id] = {'id': state_id}
             states_list.append(state)
             c_node = c_start_node + state_id
-            if c_node.matches:
+            if c_node.match_ids is not NULL:
                 state['m'] = matches = []
-                match = c_node.matches
-                while match[0]:
-                    matches.append(<unicode>match[0])
-                    match += 1
+                i = 0
+                while c_node.match_ids[i] != MATCH_END:
+                    matches.append(self._keywords[c_node.match_ids[i]])
+                    i += 1
 
         # create child links
         ignore_case = self._ignore_case
@@ -584,31 +2212,333 @@ cdef class BytesAcora:
             state['c'] = children = []
             for i in range(c_node.char_count):
                 ch = c_node.characters[i]
-                if ignore_case and ch.isupper():
+                if ignore_case and c'A' <= ch <= c'Z':
                     # ignore upper case characters, assuming that lower case exists as well
                     continue
-                c_child = c_node.targets[i]
-                child_id = c_child - c_start_node
-                children.append((ch, child_id))
+                children.append((ch, c_node.targets[i]))
 
-        return _unpickle, (self.__class__, states_list, self._ignore_case,)
+        return _unpickle, (self.__class__, states_list, self._ignore_case, self.layout,
+                           self._values_dict(), self._report, self._encoding, self.offsets)
 
-    cpdef finditer(self, bytes data):
-        """Iterate over all occurrences of any keyword in the string.
+    cdef dict _values_dict(self):
+        return dict(zip(self._text_keywords, self._values)) if self._values is not None else None
+
+    cpdef finditer(self, data, mode='overlapping'):
+        """Iterate over all occurrences of any keyword in the data.
+
+        The data can be a bytes object or any other object that supports
+        the buffer protocol with a C contiguous memory layout, such as
+        a bytearray, memoryview or mmap.  Offsets are relative to the
+        start of the buffer, and count characters instead of bytes for
+        engines that were built with ``offsets="characters"``.
+
+        The ``mode`` selects the reported matches.  "overlapping" reports
+        all of them.  The other modes report non-overlapping matches and
+        continue searching behind each reported match: "leftmost_longest"
+        picks the longest keyword at the leftmost match position,
+        "leftmost_shortest" the shortest one, and
+        "non_overlapping" the longest keyword of the match that ends first.
+        These modes search the whole buffer up front.
 
         Returns (keyword, offset) pairs.
         """
-        if self.start_node.char_count == 0:
+        if _match_mode(mode) != MODE_OVERLAPPING:
+            return iter(self.findall(data, mode))
+        if self.engine.start_node.char_count == 0:
+            _check_buffer(data)
             return iter(())
         return _BytesAcoraIter(self, data)
 
-    def findall(self, bytes data):
-        """Find all occurrences of any keyword in the string.
+    def findall(self, data, mode='overlapping'):
+        """Find all occurrences of any keyword in the data.
+
+        See ``finditer()`` for the available match modes.
 
         Returns a list of (keyword, offset) pairs.
         """
+        cdef int match_mode = _match_mode(mode)
+        if match_mode != MODE_OVERLAPPING:
+            return _matches_from_arrays(
+                self._match_objects, [self._find_without_overlaps(data, match_mode)])
         return list(self.finditer(data))
 
+    def findall_arrays(self, data, mode='overlapping'):
+        """Find all occurrences of any keyword in the data.
+
+        Returns a pair of arrays (keyword_ids, offsets) of type 'q' that
+        list the matches in the same order as ``findall()``.  The keyword
+        ids are indices into the ``keywords`` tuple.
+        """
+        cdef int match_mode = _match_mode(mode)
+        if match_mode != MODE_OVERLAPPING:
+            return self._find_without_overlaps(data, match_mode)
+        return self._find_matches(data, 0, 0, PY_SSIZE_T_MAX)
+
+    cdef tuple _find_without_overlaps(self, data, int mode):
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef Py_buffer data_buffer
+        cdef unsigned char* data_start
+        cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        try:
+            if self.engine.start_node.char_count == 0:
+                return collector.finish()
+            data_start = <unsigned char*> data_buffer.buf
+            with nogil:
+                _find_bytes_without_overlaps(
+                    &self.engine, data_start, data_start + data_buffer.len,
+                    self._keyword_lengths, self._max_keyword_length, mode, collector)
+                if self._character_lengths is not NULL:
+                    collector.to_character_offsets(
+                        0, data_start, 0, 0, self._keyword_lengths, self._character_lengths)
+        finally:
+            cpython.buffer.PyBuffer_Release(&data_buffer)
+        return collector.finish()
+
+    def contains(self, data):
+        """Check if the data contains any of the keywords.
+        """
+        return self.find_first(data) is not None
+
+    def find_first(self, data):
+        """Find the first match in the data, i.e. the first one that
+        ``finditer()`` would return.
+
+        Returns a (keyword, offset) pair or None.
+        """
+        cdef _AcoraBytesNodeStruct* current_node = self.engine.start_node
+        cdef Py_buffer data_buffer
+        cdef unsigned char* data_start
+        cdef unsigned char* data_char
+        cdef uint32_t keyword_id
+        cdef Py_ssize_t offset
+        cdef int found
+
+        cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        try:
+            if self.engine.start_node.char_count == 0:
+                return None
+            data_start = data_char = <unsigned char*> data_buffer.buf
+            with nogil:
+                found = _search_in_bytes(
+                    &self.engine, data_start + data_buffer.len, &data_char, &current_node)
+                if found:
+                    keyword_id = current_node.match_ids[0]
+                    if self._character_lengths is NULL:
+                        offset = (data_char - data_start) - self._keyword_lengths[keyword_id]
+                    else:
+                        offset = _count_characters(data_start, data_char) - self._character_lengths[keyword_id]
+        finally:
+            cpython.buffer.PyBuffer_Release(&data_buffer)
+        if not found:
+            return None
+        return self._match_objects[keyword_id], offset
+
+    def count(self, data):
+        """Count the occurrences of all keywords in the data.
+        """
+        return self._count_matches(data, NULL)
+
+    def count_by_keyword(self, data):
+        """Count the occurrences of each keyword in the data.
+
+        Returns a dict that maps the keywords that were found to their
+        number of occurrences.
+        """
+        cdef Py_ssize_t i
+        cdef Py_ssize_t* keyword_counts = <Py_ssize_t*> cpython.mem.PyMem_Malloc(
+            sizeof(Py_ssize_t) * (len(self._keywords) or 1))
+        if keyword_counts is NULL:
+            raise MemoryError()
+        try:
+            memset(keyword_counts, 0, sizeof(Py_ssize_t) * len(self._keywords))
+            self._count_matches(data, keyword_counts)
+            return _counts_by_object(self._match_objects, keyword_counts)
+        finally:
+            cpython.mem.PyMem_Free(keyword_counts)
+
+    cdef Py_ssize_t _count_matches(self, data, Py_ssize_t* keyword_counts) except -1:
+        cdef _AcoraBytesNodeStruct* current_node = self.engine.start_node
+        cdef Py_buffer data_buffer
+        cdef unsigned char* data_char
+        cdef unsigned char* data_end
+        cdef Py_ssize_t count = 0
+        cdef Py_ssize_t i
+
+        cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        try:
+            if self.engine.start_node.char_count == 0:
+                return 0
+            data_char = <unsigned char*> data_buffer.buf
+            data_end = data_char + data_buffer.len
+            with nogil:
+                while _search_in_bytes(&self.engine, data_end, &data_char, &current_node):
+                    i = 0
+                    while current_node.match_ids[i] != MATCH_END:
+                        if keyword_counts is not NULL:
+                            keyword_counts[current_node.match_ids[i]] += 1
+                        i += 1
+                    count += i
+        finally:
+            cpython.buffer.PyBuffer_Release(&data_buffer)
+        return count
+
+    def findall_parallel(self, data, workers=None):
+        """Find all occurrences of any keyword in the data, using multiple threads.
+
+        Splits the data into one chunk per worker thread (by default,
+        one per CPU core) and searches the chunks in parallel without
+        holding the GIL.  Neighbouring chunks overlap by the length of
+        the longest keyword minus one so that no match is lost.
+
+        Returns the same list of (keyword, offset) pairs as ``findall()``.
+        """
+        cdef Py_buffer data_buffer
+        cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        try:
+            if self.engine.start_node.char_count == 0:
+                return []
+            overlap = self._max_keyword_length - 1
+            chunks = _split_into_chunks(data_buffer.len, overlap, workers)
+            return _matches_from_arrays(self._match_objects, _run_in_threads(
+                self._find_matches, [(data,) + chunk for chunk in chunks]))
+        finally:
+            cpython.buffer.PyBuffer_Release(&data_buffer)
+
+    cpdef tuple _find_matches(self, data, Py_ssize_t start, Py_ssize_t report_start,
+                              Py_ssize_t end):
+        """Collect the (keyword_ids, offsets) arrays of the matches in data[start:end]
+        that end behind the report_start offset.
+        """
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef _AcoraBytesNodeStruct* current_node = self.engine.start_node
+        cdef Py_buffer data_buffer
+        cdef unsigned char* data_start
+        cdef unsigned char* data_char
+        cdef unsigned char* data_end
+        cdef uint32_t keyword_id
+        cdef Py_ssize_t i
+
+        cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        try:
+            if self.engine.start_node.char_count == 0:
+                return collector.finish()
+            data_start = <unsigned char*> data_buffer.buf
+            data_char = data_start + start
+            data_end = data_start + min(end, data_buffer.len)
+            with nogil:
+                while _search_in_bytes(&self.engine, data_end, &data_char, &current_node):
+                    if data_char - data_start <= report_start:
+                        continue
+                    i = 0
+                    while current_node.match_ids[i] != MATCH_END:
+                        keyword_id = current_node.match_ids[i]
+                        collector.append(
+                            keyword_id, (data_char - data_start) - self._keyword_lengths[keyword_id])
+                        i += 1
+                if self._character_lengths is not NULL:
+                    # the characters before the chunk are counted again by each thread
+                    collector.to_character_offsets(
+                        0, data_start + start, start, _count_characters(data_start, data_start + start),
+                        self._keyword_lengths, self._character_lengths)
+        finally:
+            cpython.buffer.PyBuffer_Release(&data_buffer)
+        return collector.finish()
+
+    def stream(self):
+        """Create a scanner for searching a sequence of data chunks.
+
+        The scanner's ``feed(chunk)`` method returns the matches that end
+        in the chunk, including those that started in preceding chunks,
+        with offsets relative to the start of the stream.
+        """
+        return _BytesAcoraStream(self)
+
+    def afind(self, source):
+        """Asynchronously iterate over all occurrences of any keyword in a data source.
+
+        The source can be an ``asyncio.StreamReader`` (or any object with
+        an async ``read(size)`` method) or an async iterable of chunks.
+        Requires Python 3.6 or later.
+
+        Use as ``async for keyword, offset in engine.afind(source)``.
+        """
+        from acora._aio import afind
+        return afind(self, source)
+
+    def findall_many(self, documents):
+        """Find all occurrences of any keyword in each buffer of an iterable.
+
+        Searches all buffers in a single run without holding the GIL.
+
+        Returns one list of (keyword, offset) pairs per buffer.
+        """
+        cdef list docs = list(documents)
+        cdef array.array match_ends = _new_index_array(len(docs))
+        matches = self._find_many(docs, match_ends)
+        return _split_matches_by_document(self._match_objects, matches, match_ends)
+
+    def search_many(self, documents):
+        """Find all occurrences of any keyword in each buffer of an iterable.
+
+        Searches all buffers in a single run without holding the GIL.
+
+        Returns three arrays (doc_indices, keyword_ids, offsets) of type 'q'
+        that list the matches of all buffers, ordered by their index in
+        the iterable.  The keyword ids are indices into the ``keywords``
+        tuple.
+        """
+        cdef list docs = list(documents)
+        cdef array.array match_ends = _new_index_array(len(docs))
+        matches = self._find_many(docs, match_ends)
+        return _add_document_indices(matches, match_ends)
+
+    cdef tuple _find_many(self, list documents, array.array match_ends):
+        """Collect the matches of all documents and store the number of
+        matches up to the end of each document in match_ends.
+        """
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef _AcoraBytesNodeStruct* current_node
+        cdef Py_buffer* data_buffers
+        cdef Py_ssize_t doc_count = len(documents), doc_index, acquired = 0, first_match
+        cdef unsigned char* data_start
+        cdef unsigned char* data_char
+        cdef unsigned char* data_end
+        cdef uint32_t keyword_id
+        cdef Py_ssize_t i
+
+        data_buffers = <Py_buffer*> cpython.mem.PyMem_Malloc(sizeof(Py_buffer) * (doc_count or 1))
+        if data_buffers is NULL:
+            raise MemoryError()
+        try:
+            for document in documents:
+                cpython.buffer.PyObject_GetBuffer(
+                    document, data_buffers + acquired, cpython.buffer.PyBUF_SIMPLE)
+                acquired += 1
+
+            with nogil:
+                for doc_index in range(doc_count):
+                    current_node = self.engine.start_node
+                    data_start = data_char = <unsigned char*> data_buffers[doc_index].buf
+                    data_end = data_start + data_buffers[doc_index].len
+                    first_match = collector.count
+                    while self.engine.start_node.char_count and _search_in_bytes(
+                            &self.engine, data_end, &data_char, &current_node):
+                        i = 0
+                        while current_node.match_ids[i] != MATCH_END:
+                            keyword_id = current_node.match_ids[i]
+                            collector.append(
+                                keyword_id, (data_char - data_start) - self._keyword_lengths[keyword_id])
+                            i += 1
+                    if self._character_lengths is not NULL:
+                        collector.to_character_offsets(
+                            first_match, data_start, 0, 0, self._keyword_lengths, self._character_lengths)
+                    match_ends.data.as_longlongs[doc_index] = collector.count
+        finally:
+            for doc_index in range(acquired):
+                cpython.buffer.PyBuffer_Release(data_buffers + doc_index)
+            cpython.mem.PyMem_Free(data_buffers)
+        return collector.finish()
+
     def filefind(self, f):
         """Iterate over all occurrences of any keyword in a file.
 
@@ -617,7 +2547,7 @@ cdef class BytesAcora:
 
         Returns (keyword, offset) pairs.
         """
-        if self.start_node.char_count == 0:
+        if self.engine.start_node.char_count == 0:
             return iter(())
         close_file = False
         if not hasattr(f, 'read'):
@@ -633,82 +2563,662 @@ cdef class BytesAcora:
         return list(self.filefind(f))
 
 
+cdef class SkipBytesAcora(BytesAcora):
+    """Acora search engine for byte data that skips ahead over the input.
+
+    A shift table over the blocks of the keywords (as in the Wu-Manber
+    algorithm) looks at the end of a window of the length of the shortest
+    keyword, starting where the earliest match in progress would start,
+    and skips the positions at which no keyword can start.  The matches
+    are the same as for ``BytesAcora``, but long keywords make the search
+    read only a fraction of the input bytes.  Engines with keywords
+    shorter than 4 bytes search like ``BytesAcora``.
+    """
+    def __cinit__(self, start_state, *args, **kwargs):
+        if start_state is _FROM_IMAGE:
+            return  # initialised by _init_from_image()
+        _init_shift_table(&self.engine, self.node_count, self._keywords, self._ignore_case)
+
+    cdef int _init_from_image(self, data) except -1:
+        BytesAcora._init_from_image(self, data)
+        _init_shift_table(&self.engine, self.node_count, self._keywords, self._ignore_case)
+
+    @property
+    def window(self):
+        """The number of bytes that the shift table looks ahead, 0 if it is not used.
+        """
+        return self.engine.shift_window if self.engine.shifts is not NULL else 0
+
+
 cdef class _BytesAcoraIter:
     cdef _AcoraBytesNodeStruct* current_node
-    cdef _AcoraBytesNodeStruct* start_node
+    cdef _AcoraBytesEngine* engine
     cdef Py_ssize_t match_index
-    cdef bytes data
+    cdef object data
+    cdef Py_buffer data_buffer
     cdef BytesAcora acora
     cdef unsigned char* data_char
     cdef unsigned char* data_end
     cdef unsigned char* data_start
+    # character offsets are counted lazily up to the last reported match
+    cdef unsigned char* counted_char
+    cdef Py_ssize_t character_count
 
-    def __cinit__(self, BytesAcora acora not None, bytes data):
-        assert acora.start_node is not NULL
-        assert acora.start_node.matches is NULL
+    def __cinit__(self, BytesAcora acora not None, data):
+        assert acora.engine.start_node is not NULL
+        assert acora.engine.start_node.match_ids is NULL
         self.acora = acora
-        self.start_node = self.current_node = acora.start_node
+        self.engine = &acora.engine
+        self.current_node = acora.engine.start_node
         self.match_index = 0
-        self.data_char = self.data_start = self.data = data
-        self.data_end = self.data_char + len(data)
+        # keep the buffer exported while iterating
+        cpython.buffer.PyObject_GetBuffer(data, &self.data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        self.data = data
+        self.data_char = self.data_start = self.counted_char = <unsigned char*> self.data_buffer.buf
+        self.data_end = self.data_char + self.data_buffer.len
+        self.character_count = 0
 
-        if not acora.start_node.char_count:
+        if not acora.engine.start_node.char_count:
             raise ValueError("Non-empty engine required")
 
+    def __dealloc__(self):
+        if self.data is not None:
+            cpython.buffer.PyBuffer_Release(&self.data_buffer)
+
     def __iter__(self):
         return self
 
     def __next__(self):
-        cdef unsigned char* data_char = self.data_char
         cdef unsigned char* data_end = self.data_end
-        cdef unsigned char* test_chars
-        cdef unsigned char current_char
-        cdef int i, found = 0
-        if self.current_node.matches is not NULL:
-            if self.current_node.matches[self.match_index] is not NULL:
+        cdef int found = 0
+        if self.current_node.match_ids is not NULL:
+            if self.current_node.match_ids[self.match_index] != MATCH_END:
                 return self._build_next_match()
             self.match_index = 0
         with nogil:
-            found = _search_in_bytes(self.start_node, data_end,
+            found = _search_in_bytes(self.engine, data_end,
                                      &self.data_char, &self.current_node)
         if found:
             return self._build_next_match()
         raise StopIteration
 
     cdef _build_next_match(self):
-        match = <bytes> self.current_node.matches[self.match_index]
+        keyword_id = self.current_node.match_ids[self.match_index]
         self.match_index += 1
-        return (match, <Py_ssize_t>(self.data_char - self.data_start) - len(match))
+        if self.acora._character_lengths is not NULL:
+            self.character_count += _count_characters(self.counted_char, self.data_char)
+            self.counted_char = self.data_char
+            return (self.acora._match_objects[keyword_id],
+                    self.character_count - self.acora._character_lengths[keyword_id])
+        return (self.acora._match_objects[keyword_id],
+                <Py_ssize_t>(self.data_char - self.data_start) - self.acora._keyword_lengths[keyword_id])
+
+
+cdef class _BytesAcoraStream:
+    """Incremental search over a sequence of data chunks.
+    """
+    cdef BytesAcora acora
+    cdef _AcoraBytesNodeStruct* current_node
+    cdef Py_ssize_t _position
+    cdef Py_ssize_t _character_position
+
+    def __cinit__(self, BytesAcora acora not None):
+        self.acora = acora
+        self.reset()
+
+    @property
+    def position(self):
+        """The number of bytes fed into the scanner since the last reset.
+        """
+        return self._position
+
+    def reset(self):
+        """Restart the search at the beginning of a new stream.
+        """
+        self.current_node = self.acora.engine.start_node
+        self._position = 0
+        self._character_position = 0
+
+    def feed(self, data):
+        """Search the next chunk of the stream.
+
+        The chunk can be any C contiguous buffer, which is searched
+        without copying it.
+
+        Returns a list of (keyword, offset) pairs.
+        """
+        cdef _MatchCollector collector = _MatchCollector()
+        cdef const _AcoraBytesEngine* engine = &self.acora.engine
+        cdef _AcoraBytesNodeStruct* current_node = self.current_node
+        cdef Py_ssize_t* keyword_lengths = self.acora._keyword_lengths
+        cdef Py_ssize_t position = self._position
+        cdef Py_buffer data_buffer
+        cdef unsigned char* data_start
+        cdef unsigned char* data_char
+        cdef unsigned char* data_end
+        cdef uint32_t keyword_id
+        cdef Py_ssize_t i
+
+        cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+        try:
+            data_start = data_char = <unsigned char*> data_buffer.buf
+            data_end = data_start + data_buffer.len
+            if engine.start_node.char_count:
+                with nogil:
+                    while _search_in_bytes(engine, data_end, &data_char, &current_node):
+                        i = 0
+                        while current_node.match_ids[i] != MATCH_END:
+                            keyword_id = current_node.match_ids[i]
+                            collector.append(
+                                keyword_id, position + (data_char - data_start) - keyword_lengths[keyword_id])
+                            i += 1
+            if self.acora._character_lengths is not NULL:
+                with nogil:
+                    collector.to_character_offsets(
+                        0, data_start, position, self._character_position,
+                        keyword_lengths, self.acora._character_lengths)
+                    self._character_position += _count_characters(data_start, data_end)
+            self.current_node = current_node
+            self._position += data_buffer.len
+        finally:
+            cpython.buffer.PyBuffer_Release(&data_buffer)
+        return _matches_from_arrays(self.acora._match_objects, [collector.finish()])
+
 
+cdef int _check_buffer(data) except -1:
+    cdef Py_buffer data_buffer
+    cpython.buffer.PyObject_GetBuffer(data, &data_buffer, cpython.buffer.PyBUF_SIMPLE)
+    cpython.buffer.PyBuffer_Release(&data_buffer)
 
-cdef int _search_in_bytes(_AcoraBytesNodeStruct* start_node,
+
+@cython.cdivision(True)
+cdef int _search_in_bytes(const _AcoraBytesEngine* engine,
                           unsigned char* data_end,
                           unsigned char** _data_char,
-                          _AcoraBytesNodeStruct** _current_node) nogil:
+                          _AcoraBytesNodeStruct** _current_node) noexcept nogil:
     cdef unsigned char* data_char = _data_char[0]
+    cdef _AcoraBytesNodeStruct* start_node = engine.start_node
     cdef _AcoraBytesNodeStruct* current_node = _current_node[0]
+    cdef const uint32_t* transitions = engine.transitions
+    cdef const unsigned char* byte_classes = engine.byte_classes
+    cdef uint32_t state, class_count = engine.class_count
+    cdef bint prefilter = engine.first_byte_count != 0
+    cdef Py_ssize_t prefilter_credit = PREFILTER_INITIAL_CREDIT
     cdef unsigned char current_char
     cdef int found = 0
 
+    if engine.shifts is not NULL:
+        return _search_in_bytes_skipping(engine, data_end, _data_char, _current_node)
+
+    if transitions is not NULL:
+        # dense layout: a single table lookup per input byte
+        state = <uint32_t>(current_node - start_node) * class_count
+        while data_char < data_end:
+            if prefilter and state == 0:
+                prefilter = _prefilter(engine, &data_char, data_end, &prefilter_credit)
+                if data_char == data_end:
+                    break
+            state = transitions[state + byte_classes[data_char[0]]]
+            data_char += 1
+            if state & DENSE_MATCH_FLAG:
+                found = 1
+                break
+        current_node = start_node + ((state & ~DENSE_MATCH_FLAG) // class_count)
+    else:
+        while data_char < data_end:
+            if prefilter and current_node is start_node:
+                prefilter = _prefilter(engine, &data_char, data_end, &prefilter_credit)
+                if data_char == data_end:
+                    break
+            current_char = data_char[0]
+            data_char += 1
+            current_node = _step_to_next_node(start_node, current_node, current_char)
+            if current_node.match_ids is not NULL:
+                found = 1
+                break
+    _data_char[0] = data_char
+    _current_node[0] = current_node
+    return found
+
+
+cdef int _find_bytes_without_overlaps(
+        const _AcoraBytesEngine* engine, unsigned char* data_start, unsigned char* data_end,
+        const Py_ssize_t* keyword_lengths, Py_ssize_t max_keyword_length, int mode,
+        _MatchCollector collector) except -1 nogil:
+    # keep in sync with _find_unicode_without_overlaps()
+    cdef _AcoraBytesNodeStruct* current_node = engine.start_node
+    cdef unsigned char* data_char = data_start
+    cdef unsigned char* search_end = data_end
+    cdef Py_ssize_t keyword_id, start, candidate_id = -1, candidate_start = 0
+
+    while True:
+        if _search_in_bytes(engine, search_end, &data_char, &current_node):
+            # the longest match comes first and starts furthest left
+            keyword_id = current_node.match_ids[0]
+            start = (data_char - data_start) - keyword_lengths[keyword_id]
+            if mode == MODE_NON_OVERLAPPING:
+                collector.append(keyword_id, start)
+                current_node = engine.start_node
+            elif candidate_id == -1 or start < candidate_start or (
+                    start == candidate_start and mode == MODE_LEFTMOST_LONGEST):
+                candidate_id, candidate_start = keyword_id, start
+                # no match that starts at or before the candidate can end after this point
+                search_end = data_start + min(data_end - data_start, start + max_keyword_length)
+        elif candidate_id == -1:
+            break
+        else:
+            # report the candidate and continue from its end
+            collector.append(candidate_id, candidate_start)
+            data_char = data_start + candidate_start + keyword_lengths[candidate_id]
+            current_node = engine.start_node
+            candidate_id = -1
+            search_end = data_end
+    return 0
+
+
+# first byte prefilter
+
+cdef inline uint64_t _has_byte(uint64_t word, uint64_t pattern) noexcept nogil:
+    # non-zero if any byte in the word equals the byte repeated in the pattern
+    word ^= pattern
+    return (word - 0x0101010101010101ULL) & ~word & 0x8080808080808080ULL
+
+
+cdef inline bint _prefilter(const _AcoraBytesEngine* engine,
+                            unsigned char** _data_char, unsigned char* data_end,
+                            Py_ssize_t* _credit) noexcept nogil:
+    """Skip ahead to the next byte that can start a match.
+
+    Returns false if the prefilter skipped too few bytes on average to be
+    worth its overhead, e.g. because the input is dense with candidates.
+    """
+    cdef unsigned char* data_char = _data_char[0]
+    cdef Py_ssize_t credit = _credit[0]
+    _data_char[0] = _skip_to_first_byte(engine, data_char, data_end)
+    credit += (_data_char[0] - data_char) - PREFILTER_BREAK_EVEN_SKIP
+    _credit[0] = credit if credit < PREFILTER_MAX_CREDIT else PREFILTER_MAX_CREDIT
+    return credit >= 0
+
+
+cdef unsigned char* _skip_to_first_byte(const _AcoraBytesEngine* engine,
+                                        unsigned char* data_char,
+                                        unsigned char* data_end) noexcept nogil:
+    """Return a pointer to the next byte that can start a match, or the data end.
+    """
+    cdef const uint64_t* first_byte_map = engine.first_byte_map
+    cdef uint64_t word, pattern1, pattern2, pattern3
+    cdef unsigned char current_char
+
+    if engine.first_byte_count == 1:
+        data_char = <unsigned char*> memchr(data_char, engine.first_bytes[0], data_end - data_char)
+        return data_end if data_char is NULL else data_char
+
+    if engine.first_byte_count <= 3:
+        # compare a machine word at a time, then find the exact position bytewise below
+        pattern1 = engine.first_bytes[0] * 0x0101010101010101ULL
+        pattern2 = engine.first_bytes[1] * 0x0101010101010101ULL
+        pattern3 = engine.first_bytes[2] * 0x0101010101010101ULL
+        while data_end - data_char >= 8:
+            memcpy(&word, data_char, 8)
+            if _has_byte(word, pattern1) | _has_byte(word, pattern2) | _has_byte(word, pattern3):
+                break
+            data_char += 8
+
     while data_char < data_end:
         current_char = data_char[0]
-        data_char += 1
-        current_node = _step_to_next_node(start_node, current_node, current_char)
-        if current_node.matches is not NULL:
-            found = 1
+        if (first_byte_map[current_char >> 6] >> (current_char & 63)) & 1:
             break
+        data_char += 1
+    return data_char
+
+
+cdef int _init_prefilter(_AcoraBytesEngine* engine) except -1:
+    """Collect the bytes that lead away from the start node.
+    """
+    cdef _AcoraBytesNodeStruct* start_node = engine.start_node
+    cdef unsigned char current_char
+    cdef int i
+
+    memset(engine.first_byte_map, 0, sizeof(engine.first_byte_map))
+    engine.first_byte_count = 0
+    if not start_node.char_count:
+        return 0
+    for i in range(start_node.char_count):
+        current_char = start_node.characters[i]
+        engine.first_byte_map[current_char >> 6] |= (<uint64_t>1) << (current_char & 63)
+        if i < 3:
+            engine.first_bytes[i] = current_char
+    for i in range(start_node.char_count, 3):
+        # repeat the last byte to fill up the word-wise comparison patterns
+        engine.first_bytes[i] = engine.first_bytes[i-1]
+
+    # only worth it if most input bytes can be skipped
+    engine.first_byte_count = (
+        start_node.char_count if start_node.char_count <= PREFILTER_MAX_FIRST_BYTES else 0)
+
+
+# shift table for skipping ahead (SkipBytesAcora)
+
+cdef inline uint32_t _block_index(const unsigned char* block, int block_size, int shift_bits) noexcept nogil:
+    if block_size == 2:
+        return (<uint32_t> block[0] << 8) | block[1]
+    # multiplicative hashing of longer blocks into the table index
+    if block_size == 3:
+        return (((<uint32_t> block[0] << 16) | (<uint32_t> block[1] << 8) | block[2])
+                * 2654435761U) >> (32 - shift_bits)
+    return (((<uint32_t> block[0] << 24) | (<uint32_t> block[1] << 16) |
+             (<uint32_t> block[2] << 8) | block[3]) * 2654435761U) >> (32 - shift_bits)
+
+
+@cython.cdivision(True)
+cdef int _search_in_bytes_skipping(const _AcoraBytesEngine* engine,
+                                   unsigned char* data_end,
+                                   unsigned char** _data_char,
+                                   _AcoraBytesNodeStruct** _current_node) noexcept nogil:
+    """Search like _search_in_bytes(), but skip ahead using the shift table.
+
+    The current state of depth d matches the text from d bytes back, which is
+    where the earliest match can start that is still in progress.  If the
+    shift table moves the window at that position by more than d bytes, no
+    match can start in between, so the search restarts from the start node
+    at the new position.  This only requires the window to be inside of the
+    data, so that the automaton always ends up in the right state.
+    """
+    cdef unsigned char* data_char = _data_char[0]
+    cdef _AcoraBytesNodeStruct* start_node = engine.start_node
+    cdef _AcoraBytesNodeStruct* current_node = _current_node[0]
+    cdef const uint32_t* transitions = engine.transitions
+    cdef const unsigned char* byte_classes = engine.byte_classes
+    cdef const uint8_t* shifts = engine.shifts
+    cdef const uint8_t* node_depths = engine.node_depths
+    cdef const uint8_t* transition_depths = engine.transition_depths
+    cdef Py_ssize_t window = engine.shift_window
+    cdef int block_size = engine.shift_block, shift_bits = engine.shift_bits
+    # blocks of windows that start further back than this can be before the data start
+    cdef int max_depth = window - block_size
+    cdef uint32_t index, state, class_count = engine.class_count
+    cdef int depth, shift
+    cdef unsigned char* window_start
+    cdef unsigned char* checked_start = NULL
+    cdef bint skip = True, prefilter = engine.first_byte_count != 0
+    cdef bint prefilter_first = engine.first_byte_count == 1
+    cdef Py_ssize_t skip_credit = PREFILTER_INITIAL_CREDIT
+    cdef Py_ssize_t prefilter_credit = PREFILTER_INITIAL_CREDIT
+    cdef int found = 0
+
+    state = <uint32_t>(current_node - start_node) * class_count
+    depth = node_depths[current_node - start_node]
+    while data_char < data_end:
+        if prefilter and depth == 0 and (prefilter_first or data_char == checked_start):
+            # memchr() for a single first byte is usually faster than the shift table,
+            # the other prefilters only run where the shift table gets stuck
+            prefilter = _prefilter(engine, &data_char, data_end, &prefilter_credit)
+            if data_char == data_end:
+                break
+        window_start = data_char - depth
+        if skip and window_start != checked_start and depth <= max_depth:
+            # look at each window once, i.e. after following a failure link
+            checked_start = window_start
+            if data_end - window_start < window:
+                skip = False
+            else:
+                shift = shifts[_block_index(window_start + max_depth, block_size, shift_bits)]
+                if shift > depth:
+                    skip_credit += shift - depth
+                    data_char = window_start + shift
+                    state = depth = 0
+                    current_node = start_node
+                    continue
+                skip_credit -= SHIFT_BREAK_EVEN_SKIP
+                if skip_credit < 0:
+                    skip = False
+                elif skip_credit > PREFILTER_MAX_CREDIT:
+                    skip_credit = PREFILTER_MAX_CREDIT
+            if prefilter and depth == 0 and not prefilter_first:
+                continue
+        if transitions is not NULL:
+            index = state + byte_classes[data_char[0]]
+            state = transitions[index]
+            depth = transition_depths[index]
+            data_char += 1
+            if state & DENSE_MATCH_FLAG:
+                found = 1
+                break
+        else:
+            current_node = _step_to_next_node(start_node, current_node, data_char[0])
+            depth = node_depths[current_node - start_node]
+            data_char += 1
+            if current_node.match_ids is not NULL:
+                found = 1
+                break
+    if transitions is not NULL:
+        current_node = start_node + ((state & ~DENSE_MATCH_FLAG) // class_count)
     _data_char[0] = data_char
     _current_node[0] = current_node
     return found
 
 
-ctypedef fused _AcoraNodeStruct:
-    _AcoraBytesNodeStruct
-    _AcoraUnicodeNodeStruct
+cdef int _init_shift_table(_AcoraBytesEngine* engine, Py_ssize_t node_count,
+                           tuple keywords, bint ignore_case) except -1:
+    """Build the shift table from the blocks in the first window of each keyword.
 
-ctypedef fused _inputCharType:
-    unsigned char
-    Py_UCS4
+    A block at the end of a window shifts it to the right until the last
+    occurrence of the block in a keyword lines up with it, or past the block
+    if it does not occur at all.  Larger keyword sets use longer blocks and
+    a larger hash table to keep the shifts long.  Case insensitive engines
+    enter the blocks in all combinations of ASCII upper and lower case letters.
+    """
+    cdef Py_ssize_t window, block_count, table_size, i
+    cdef int block_size, shift_bits = 16, end, variant, variant_count, letter_count
+    cdef uint32_t index
+    cdef uint8_t shift
+    cdef const unsigned char* keyword_data
+    cdef unsigned char block[4]
+    cdef unsigned char ch
+    cdef uint8_t* shifts
+
+    if not keywords:
+        return 0
+    window = min([len(keyword) for keyword in keywords])
+    if window < SHIFT_MIN_WINDOW:
+        return 0
+    if window > SHIFT_MAX_WINDOW:
+        window = SHIFT_MAX_WINDOW
+    block_count = len(keywords) * (window - 1)
+    if block_count <= SHIFT_MAX_2_BYTE_BLOCKS:
+        block_size = 2
+    else:
+        block_size = 3 if block_count <= SHIFT_MAX_3_BYTE_BLOCKS else 4
+        while shift_bits < SHIFT_MAX_TABLE_BITS and (1 << shift_bits) < block_count * SHIFT_TABLE_LOAD:
+            shift_bits += 1
+    table_size = 1 << shift_bits
+
+    shifts = <uint8_t*> cpython.mem.PyMem_Malloc(table_size)
+    if shifts is NULL:
+        raise MemoryError()
+    memset(shifts, window - block_size + 1, table_size)
+    for keyword in keywords:
+        keyword_data = <bytes> keyword
+        for end in range(block_size, window + 1):
+            shift = window - end
+            letter_count = 0
+            if ignore_case:
+                for i in range(end - block_size, end):
+                    if c'a' <= keyword_data[i] | 0x20 <= c'z':
+                        letter_count += 1
+            variant_count = 1 << letter_count
+            for variant in range(variant_count):
+                # flip the case of the letters that are selected by the bits of the variant
+                letter_count = 0
+                for i in range(block_size):
+                    ch = keyword_data[end - block_size + i]
+                    if ignore_case and (c'a' <= ch | 0x20 <= c'z'):
+                        if (variant >> letter_count) & 1:
+                            ch ^= 0x20
+                        letter_count += 1
+                    block[i] = ch
+                index = _block_index(block, block_size, shift_bits)
+                if shifts[index] > shift:
+                    shifts[index] = shift
+    engine.shifts = shifts
+    engine.shift_window = window
+    engine.shift_block = block_size
+    engine.shift_bits = shift_bits
+    _init_depths(engine, node_count)
+
+
+cdef int _init_depths(_AcoraBytesEngine* engine, Py_ssize_t node_count) except -1:
+    """Find the depth of all nodes by a breadth-first search from the start node.
+
+    No input of fewer characters than its keyword prefix can lead to a node,
+    so that the first visit of each node happens at its depth.
+    """
+    cdef _AcoraBytesNodeStruct* start_node = engine.start_node
+    cdef _AcoraBytesNodeStruct* c_node
+    cdef Py_ssize_t* queue
+    cdef Py_ssize_t* depths
+    cdef Py_ssize_t i, j, count = 1, node_index, target
+    cdef uint32_t entry, class_count = engine.class_count
+
+    engine.node_depths = <uint8_t*> cpython.mem.PyMem_Malloc(node_count)
+    queue = <Py_ssize_t*> cpython.mem.PyMem_Malloc(2 * sizeof(Py_ssize_t) * node_count)
+    if engine.node_depths is NULL or queue is NULL:
+        cpython.mem.PyMem_Free(queue)
+        raise MemoryError()
+    depths = queue + node_count
+    for i in range(node_count):
+        depths[i] = -1
+    queue[0] = 0
+    depths[0] = 0
+    for i in range(node_count):
+        if i == count:
+            break
+        node_index = queue[i]
+        c_node = start_node + node_index
+        for j in range(c_node.char_count):
+            target = c_node.targets[j]
+            if depths[target] == -1:
+                depths[target] = depths[node_index] + 1
+                queue[count] = target
+                count += 1
+    for i in range(node_count):
+        engine.node_depths[i] = depths[i] if depths[i] < 255 else 255
+    cpython.mem.PyMem_Free(queue)
+
+    if engine.transitions is NULL:
+        return 0
+    engine.transition_depths = <uint8_t*> cpython.mem.PyMem_Malloc(node_count * class_count)
+    if engine.transition_depths is NULL:
+        raise MemoryError()
+    for i in range(node_count * class_count):
+        entry = engine.transitions[i] & ~DENSE_MATCH_FLAG
+        engine.transition_depths[i] = engine.node_depths[entry // class_count]
+
+
+cdef int _init_byte_classes(_AcoraBytesEngine* engine, Py_ssize_t node_count) except -1:
+    """Partition the byte values into classes that lead to the same target in every state.
+
+    Bytes that do not appear in any keyword always lead back to the start node
+    and thus end up in a shared class, so that the number of classes is usually
+    much smaller than 256.
+    """
+    cdef _AcoraBytesNodeStruct* start_node = engine.start_node
+    cdef _AcoraBytesNodeStruct* c_node
+    cdef uint32_t target
+    cdef Py_ssize_t i, j, k
+    cdef int byte_value, class_id, class_count = 1, split_count
+    # the bytes of a class that take the same transition in a node stay together,
+    # each node splits off new classes, chained per previous class of their bytes
+    cdef int byte_class[256]
+    cdef int split_head[512]
+    cdef int split_next[256]
+    cdef uint32_t split_target[256]
+    cdef int renumbered[512]
+
+    memset(byte_class, 0, sizeof(byte_class))
+    for class_id in range(512):
+        split_head[class_id] = -1
+    for i in range(node_count):
+        c_node = start_node + i
+        if not c_node.char_count:
+            continue
+        split_count = 0
+        for j in range(c_node.char_count):
+            byte_value = c_node.characters[j]
+            target = c_node.targets[j]
+            class_id = byte_class[byte_value]
+            k = split_head[class_id]
+            while k != -1 and split_target[k] != target:
+                k = split_next[k]
+            if k == -1:
+                k = split_count
+                split_count += 1
+                split_target[k] = target
+                split_next[k] = split_head[class_id]
+                split_head[class_id] = k
+            byte_class[byte_value] = class_count + k
+
+        # renumber the classes in the order of their first byte value
+        for class_id in range(class_count + split_count):
+            renumbered[class_id] = -1
+            split_head[class_id] = -1
+        class_count = 0
+        for byte_value in range(256):
+            class_id = byte_class[byte_value]
+            if renumbered[class_id] == -1:
+                renumbered[class_id] = class_count
+                class_count += 1
+            byte_class[byte_value] = renumbered[class_id]
+
+    for byte_value in range(256):
+        engine.byte_classes[byte_value] = byte_class[byte_value]
+    engine.class_count = class_count
+
+
+cdef int _init_layout(_AcoraBytesEngine* engine, Py_ssize_t node_count, layout) except -1:
+    """Set up the next-state table of the dense layout and the prefilter.
+
+    The "auto" layout selects the dense layout if its table stays reasonably small.
+    """
+    if layout == 'auto' and node_count * 2 * sizeof(uint32_t) > DENSE_LAYOUT_MAX_SIZE:
+        # even a table with only two byte classes would be too large
+        layout = 'sparse'
+    if layout != 'sparse':
+        _init_byte_classes(engine, node_count)
+    if layout == 'auto':
+        layout = 'dense' if (
+            node_count * engine.class_count * sizeof(uint32_t) <= DENSE_LAYOUT_MAX_SIZE) else 'sparse'
+    if layout == 'dense':
+        _init_dense_transitions(engine, node_count)
+    _init_prefilter(engine)
+
+
+cdef int _init_dense_transitions(_AcoraBytesEngine* engine, Py_ssize_t node_count) except -1:
+    """Expand the sparse transitions of all nodes into a flat next-state table.
+    """
+    cdef _AcoraBytesNodeStruct* start_node = engine.start_node
+    cdef _AcoraBytesNodeStruct* c_node
+    cdef uint32_t* row
+    cdef uint32_t entry, class_count = engine.class_count
+    cdef Py_ssize_t i, j
+
+    if node_count > (DENSE_MATCH_FLAG // class_count):
+        raise ValueError("Too many states for a dense automaton layout: %d" % node_count)
+    engine.transitions = <uint32_t*> cpython.mem.PyMem_Malloc(
+        sizeof(uint32_t) * class_count * node_count)
+    if engine.transitions is NULL:
+        raise MemoryError()
+
+    # the merged targets of a node cover all transitions that do not lead back to the start node
+    memset(engine.transitions, 0, sizeof(uint32_t) * class_count * node_count)
+    for i in range(node_count):
+        c_node = start_node + i
+        row = engine.transitions + i * class_count
+        for j in range(c_node.char_count):
+            entry = c_node.targets[j] * class_count
+            if start_node[c_node.targets[j]].match_ids is not NULL:
+                entry |= DENSE_MATCH_FLAG
+            row[engine.byte_classes[c_node.characters[j]]] = entry
 
 
 @cython.cdivision(True)
@@ -722,10 +3232,10 @@ cdef inline _AcoraNodeStruct* _step_to_next_node(
 
     end = current_node.char_count
     if current_char <= test_chars[0]:
-        return current_node.targets[0] if current_char == test_chars[0] else start_node
+        return start_node + current_node.targets[0] if current_char == test_chars[0] else start_node
 
     if current_char >= test_chars[end-1]:
-        return current_node.targets[end-1] if current_char == test_chars[end-1] else start_node
+        return start_node + current_node.targets[end-1] if current_char == test_chars[end-1] else start_node
 
     # bisect into larger character maps (> 8 seems to perform best for me)
     start = 0
@@ -734,56 +3244,319 @@ cdef inline _AcoraNodeStruct* _step_to_next_node(
         if current_char < test_chars[mid]:
             end = mid
         elif current_char == test_chars[mid]:
-            return current_node.targets[mid]
+            return start_node + current_node.targets[mid]
         else:
             start = mid
 
     # sequentially run through small character maps
     for i in range(start, end):
         if current_char <= test_chars[i]:
-            return current_node.targets[i] if current_char == test_chars[i] else start_node
+            return start_node + current_node.targets[i] if current_char == test_chars[i] else start_node
 
     return start_node
 
 
+# binary engine images for save() and load()
+
+cdef bytes _IMAGE_MAGIC = b"\x89ACORA\r\n"
+
+# unique marker for creating engines that are initialised from an image
+cdef object _FROM_IMAGE = object()
+
+
+cdef uint32_t _image_report_flag(str report) except? 0:
+    if report == 'value':
+        raise ValueError("Search engines that report keyword values cannot be saved")
+    return IMAGE_FLAG_REPORT_IDS if report == 'id' else 0
+
+
+cdef inline size_t _image_aligned(size_t size) noexcept:
+    return (size + 7) & ~(<size_t> 7)
+
+
+cdef bytearray _build_image(_AcoraNodeStruct* nodes, Py_ssize_t node_count,
+                            tuple keywords, uint32_t flags):
+    """Write the nodes and keywords of an engine into a flat, position independent image.
+    """
+    cdef Py_ssize_t i, j, match_id_count = 0
+    cdef _AcoraNodeStruct* c_node
+    cdef _ImageHeader* header
+    cdef _ImageNode* image_node
+    cdef unsigned char* buf
+    cdef uint32_t* match_ids
+    cdef uint64_t* keyword_offsets
+    cdef size_t offset, char_size = 4 if _AcoraNodeStruct is _AcoraUnicodeNodeStruct else 1
+    cdef size_t transitions_size = 0, block_size, match_offset
+    cdef size_t nodes_offset, transitions_offset, match_ids_offset
+    cdef size_t keyword_offsets_offset, keyword_data_offset, keyword_data_size
+
+    # nodes that have no own matches share the match list of their failure node
+    match_offsets = {}
+    for i in range(node_count):
+        c_node = nodes + i
+        transitions_size += _transition_block_size(c_node.char_count, char_size)
+        if c_node.match_ids is not NULL and <size_t> c_node.match_ids not in match_offsets:
+            match_offsets[<size_t> c_node.match_ids] = match_id_count
+            j = 0
+            while c_node.match_ids[j] != MATCH_END:
+                j += 1
+            match_id_count += j + 1
+
+    if flags & IMAGE_FLAG_UNICODE:
+        keyword_data = [keyword.encode('utf-8', 'surrogatepass') for keyword in keywords]
+    else:
+        keyword_data = list(keywords)
+
+    header = NULL
+    offset = sizeof(_ImageHeader)
+    nodes_offset = offset
+    offset = _image_aligned(offset + sizeof(_ImageNode) * node_count)
+    transitions_offset = offset
+    offset = _image_aligned(offset + transitions_size)
+    match_ids_offset = offset
+    offset = _image_aligned(offset + sizeof(uint32_t) * match_id_count)
+    keyword_offsets_offset = offset
+    offset = _image_aligned(offset + sizeof(uint64_t) * (len(keywords) + 1))
+    keyword_data_offset = offset
+    keyword_data_size = sum([len(data) for data in keyword_data])
+    offset = _image_aligned(offset + keyword_data_size)
+
+    image = bytearray(offset)
+    buf = image
+    header = <_ImageHeader*> buf
+    memcpy(header.magic, <char*> _IMAGE_MAGIC, sizeof(header.magic))
+    header.version = IMAGE_VERSION
+    header.byte_order = IMAGE_BYTE_ORDER
+    header.flags = flags
+    header.char_size = char_size
+    header.node_count = node_count
+    header.transitions_size = transitions_size
+    header.match_id_count = match_id_count
+    header.keyword_count = len(keywords)
+    header.keyword_data_size = keyword_data_size
+    header.nodes_offset = nodes_offset
+    header.transitions_offset = transitions_offset
+    header.match_ids_offset = match_ids_offset
+    header.keyword_offsets_offset = keyword_offsets_offset
+    header.keyword_data_offset = keyword_data_offset
+    header.size = offset
+
+    match_ids = <uint32_t*> (buf + match_ids_offset)
+    written = set()
+    offset = transitions_offset
+    for i in range(node_count):
+        c_node = nodes + i
+        image_node = <_ImageNode*> (buf + nodes_offset) + i
+        image_node.transitions = offset - transitions_offset
+        image_node.char_count = c_node.char_count
+        block_size = sizeof(uint32_t) * c_node.char_count
+        memcpy(buf + offset, c_node.targets, block_size)
+        memcpy(buf + offset + block_size, c_node.characters, char_size * c_node.char_count)
+        offset += _transition_block_size(c_node.char_count, char_size)
+
+        if c_node.match_ids is NULL:
+            image_node.matches = UINT64_MAX
+            continue
+        match_offset = match_offsets[<size_t> c_node.match_ids]
+        image_node.matches = match_offset
+        if match_offset not in written:
+            written.add(match_offset)
+            j = 0
+            while c_node.match_ids[j] != MATCH_END:
+                match_ids[match_offset + j] = c_node.match_ids[j]
+                j += 1
+            match_ids[match_offset + j] = MATCH_END
+
+    keyword_offsets = <uint64_t*> (buf + keyword_offsets_offset)
+    offset = 0
+    for i, data in enumerate(keyword_data):
+        keyword_offsets[i] = offset
+        memcpy(buf + keyword_data_offset + offset, <char*> data, len(data))
+        offset += len(data)
+    keyword_offsets[len(keyword_data)] = offset
+    return image
+
+
+cdef const _ImageHeader* _check_image(const unsigned char* image, Py_ssize_t size,
+                                      uint32_t unicode_flag) except NULL:
+    """Validate the header of an image and the bounds of its sections.
+    """
+    cdef const _ImageHeader* header = <const _ImageHeader*> image
+    if <size_t> size < sizeof(_ImageHeader) or memcmp(
+            header.magic, <char*> _IMAGE_MAGIC, sizeof(header.magic)) != 0:
+        raise ValueError("Not an acora engine image")
+    if header.version != IMAGE_VERSION:
+        raise ValueError("Unsupported acora engine image version %d" % header.version)
+    if header.byte_order != IMAGE_BYTE_ORDER:
+        raise ValueError("Acora engine image was written on a platform with different byte order")
+    if (header.flags & IMAGE_FLAG_UNICODE) != unicode_flag:
+        raise ValueError("Acora engine image contains a %s engine" % (
+            'unicode' if header.flags & IMAGE_FLAG_UNICODE else 'bytes'))
+    if (<uintptr_t> image) % 8:
+        raise ValueError("Acora engine image data must be 8-byte aligned")
+    if (header.size > <size_t> size or header.char_size != (4 if unicode_flag else 1)
+            or not 1 <= header.node_count <= UINT32_MAX
+            or not _image_section_fits(header, header.nodes_offset, header.node_count, sizeof(_ImageNode))
+            or not _image_section_fits(header, header.transitions_offset, header.transitions_size, 1)
+            or not _image_section_fits(header, header.match_ids_offset, header.match_id_count, sizeof(uint32_t))
+            or not _image_section_fits(header, header.keyword_offsets_offset, header.keyword_count + 1, sizeof(uint64_t))
+            or not _image_section_fits(header, header.keyword_data_offset, header.keyword_data_size, 1)):
+        raise ValueError("Corrupted acora engine image")
+    _check_match_ids(image, header)
+    return header
+
+
+cdef bint _image_section_fits(const _ImageHeader* header, uint64_t offset,
+                              uint64_t count, uint64_t item_size) noexcept:
+    return offset % 8 == 0 and offset <= header.size and count <= (header.size - offset) // item_size
+
+
+cdef tuple _image_keywords(const unsigned char* image, const _ImageHeader* header):
+    cdef const uint64_t* keyword_offsets = <const uint64_t*> (image + header.keyword_offsets_offset)
+    cdef const char* keyword_data = <const char*> (image + header.keyword_data_offset)
+    cdef uint64_t i, start, end
+    keywords = []
+    for i in range(header.keyword_count):
+        start, end = keyword_offsets[i], keyword_offsets[i+1]
+        if not start <= end <= header.keyword_data_size:
+            raise ValueError("Corrupted acora engine image")
+        if header.flags & IMAGE_FLAG_UNICODE:
+            keywords.append(keyword_data[start:end].decode('utf-8', 'surrogatepass'))
+        else:
+            keywords.append(keyword_data[start:end])
+    return tuple(keywords)
+
+
+cdef int _check_match_ids(const unsigned char* image, const _ImageHeader* header) except -1:
+    cdef const uint32_t* match_ids = <const uint32_t*> (image + header.match_ids_offset)
+    cdef uint64_t i
+    if header.match_id_count and match_ids[header.match_id_count - 1] != MATCH_END:
+        raise ValueError("Corrupted acora engine image")
+    for i in range(header.match_id_count):
+        if match_ids[i] >= header.keyword_count and match_ids[i] != MATCH_END:
+            raise ValueError("Corrupted acora engine image")
+
+
+cdef int _init_nodes_from_image(_AcoraNodeStruct* nodes, const unsigned char* image,
+                                const _ImageHeader* header) except -1:
+    """Point the nodes to their transitions and match ids in the image.
+    """
+    cdef const _ImageNode* image_node
+    cdef uint32_t* targets
+    cdef uint64_t i, j
+    for i in range(header.node_count):
+        image_node = <const _ImageNode*> (image + header.nodes_offset) + i
+        if (image_node.char_count > INT_MAX or image_node.transitions % 4
+                or image_node.transitions > header.transitions_size
+                or _transition_block_size(image_node.char_count, header.char_size)
+                    > header.transitions_size - image_node.transitions):
+            raise ValueError("Corrupted acora engine image")
+        targets = <uint32_t*> (image + header.transitions_offset + image_node.transitions)
+        for j in range(image_node.char_count):
+            if targets[j] >= header.node_count:
+                raise ValueError("Corrupted acora engine image")
+        nodes[i].char_count = image_node.char_count
+        nodes[i].targets = targets
+        if _AcoraNodeStruct is _AcoraUnicodeNodeStruct:
+            nodes[i].characters = <Py_UCS4*> (targets + image_node.char_count)
+        else:
+            nodes[i].characters = <unsigned char*> (targets + image_node.char_count)
+
+        if image_node.matches == UINT64_MAX:
+            nodes[i].match_ids = NULL
+        elif i and image_node.matches < header.match_id_count:
+            nodes[i].match_ids = <uint32_t*> (image + header.match_ids_offset) + image_node.matches
+        else:
+            raise ValueError("Corrupted acora engine image")
+
+
+cdef _read_image(path, bint use_mmap):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size:
+            import mmap
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # unlike bytes objects, bytearrays have aligned (malloc-ed) buffers
+        image = bytearray(size)
+        if f.readinto(image) != size:
+            raise IOError("Failed to read %s" % path)
+        return image
+
+
+cdef _write_image(f, bytearray image):
+    if hasattr(f, 'write'):
+        f.write(image)
+    else:
+        with open(f, 'wb') as f:
+            f.write(image)
+
+
 # file data handling
 
 cdef class _FileAcoraIter:
     cdef _AcoraBytesNodeStruct* current_node
-    cdef _AcoraBytesNodeStruct* start_node
+    cdef _AcoraBytesEngine* engine
     cdef Py_ssize_t match_index, read_size, buffer_offset_count
+    # character offsets are counted up to the last reported match or the end of each buffer
+    cdef Py_ssize_t character_count
+    cdef unsigned char* counted_char
     cdef bytes buffer
+    cdef unsigned char* c_buffer_start
     cdef unsigned char* c_buffer_pos
     cdef unsigned char* c_buffer_end
     cdef object f
+    cdef object mapping
+    cdef Py_buffer mapping_buffer
     cdef bint close_file
     cdef int c_file
     cdef BytesAcora acora
 
     def __cinit__(self, BytesAcora acora not None, f, bint close=False, Py_ssize_t buffer_size=FILE_BUFFER_SIZE):
-        assert acora.start_node is not NULL
-        assert acora.start_node.matches is NULL
+        assert acora.engine.start_node is not NULL
+        assert acora.engine.start_node.match_ids is NULL
         self.acora = acora
-        self.start_node = self.current_node = acora.start_node
+        self.engine = &acora.engine
+        self.current_node = acora.engine.start_node
         self.match_index = 0
-        self.buffer_offset_count = 0
+        self.buffer_offset_count = self.character_count = 0
         self.f = f
         self.close_file = close
+        self.c_file = -1
+        self.read_size = buffer_size
+        self.buffer = b''
+        self.c_buffer_start = self.c_buffer_pos = self.c_buffer_end = <unsigned char*> self.buffer
+        self.counted_char = self.c_buffer_start
+
+        if not acora.engine.start_node.char_count:
+            raise ValueError("Non-empty engine required")
+
         try:
-            self.c_file = f.fileno() if f.tell() == 0 else -1
+            c_file = f.fileno()
+            position = f.tell()
         except:
-            # maybe not a C file?
-            self.c_file = -1
-        self.read_size = buffer_size
-        if self.c_file == -1:
-            self.buffer = b''
+            # maybe not a C file, or not seekable (e.g. a pipe or socket)
+            return
+
+        mapping = _map_file(c_file, position)
+        if mapping is not None:
+            # search the memory mapped file in one go, starting at the current file position
+            cpython.buffer.PyObject_GetBuffer(
+                mapping, &self.mapping_buffer, cpython.buffer.PyBUF_SIMPLE)
+            self.mapping = mapping
+            self.c_buffer_start = self.c_buffer_pos = self.counted_char = (
+                <unsigned char*> self.mapping_buffer.buf + <Py_ssize_t> position)
+            self.c_buffer_end = <unsigned char*> self.mapping_buffer.buf + self.mapping_buffer.len
         else:
-            # use a statically allocated, fixed-size C buffer
+            # read from the current file position into a statically allocated, fixed-size C buffer
+            os.lseek(c_file, position, os.SEEK_SET)
+            self.c_file = c_file
             self.buffer = b'\0' * buffer_size
-        self.c_buffer_pos = self.c_buffer_end = <unsigned char*> self.buffer
+            self.c_buffer_start = self.c_buffer_pos = self.c_buffer_end = <unsigned char*> self.buffer
+            self.counted_char = self.c_buffer_start
 
-        if not acora.start_node.char_count:
-            raise ValueError("Non-empty engine required")
+    def __dealloc__(self):
+        if self.mapping is not None:
+            cpython.buffer.PyBuffer_Release(&self.mapping_buffer)
 
     def __iter__(self):
         return self
@@ -796,19 +3569,28 @@ cdef class _FileAcoraIter:
         cdef Py_ssize_t buffer_size, bytes_read = 0
         if self.c_buffer_pos is NULL:
             raise StopIteration
-        if self.current_node.matches is not NULL:
-            if self.current_node.matches[self.match_index] is not NULL:
+        if self.current_node.match_ids is not NULL:
+            if self.current_node.match_ids[self.match_index] != MATCH_END:
                 return self._build_next_match()
             self.match_index = 0
 
         buffer_size = len(self.buffer)
         c_buffer = <unsigned char*> self.buffer
-        if self.c_file != -1:
+        if self.mapping is not None:
+            with nogil:
+                found = _search_in_bytes(
+                    self.engine, self.c_buffer_end,
+                    &self.c_buffer_pos, &self.current_node)
+            if not found:
+                self.c_buffer_pos = NULL
+        elif self.c_file != -1:
             with nogil:
                 found = _find_next_match_in_cfile(
-                    self.c_file, c_buffer, buffer_size, self.start_node,
+                    self.c_file, c_buffer, buffer_size, self.engine,
                     &self.c_buffer_pos, &self.c_buffer_end,
-                    &self.buffer_offset_count, &self.current_node, &error)
+                    &self.buffer_offset_count, &self.current_node,
+                    &self.counted_char if self.acora._character_lengths is not NULL else NULL,
+                    &self.character_count, &error)
             if error:
                 cpython.exc.PyErr_SetFromErrno(IOError)
         else:
@@ -821,38 +3603,83 @@ cdef class _FileAcoraIter:
             data_end = c_buffer + buffer_size
             while not found:
                 if self.c_buffer_pos >= data_end:
+                    if self.acora._character_lengths is not NULL:
+                        self.character_count += _count_characters(self.counted_char, data_end)
                     self.buffer_offset_count += buffer_size
                     self.buffer = self.f.read(self.read_size)
                     buffer_size = len(self.buffer)
                     if buffer_size == 0:
                         self.c_buffer_pos = NULL
                         break
-                    c_buffer = self.c_buffer_pos = <unsigned char*> self.buffer
+                    c_buffer = self.c_buffer_start = self.c_buffer_pos = <unsigned char*> self.buffer
+                    self.counted_char = c_buffer
                     data_end = c_buffer + buffer_size
                 with nogil:
                     found = _search_in_bytes(
-                        self.start_node, data_end,
+                        self.engine, data_end,
                         &self.c_buffer_pos, &self.current_node)
         if self.c_buffer_pos is NULL:
-            if self.close_file:
-                self.f.close()
+            self._finish()
         elif found:
             return self._build_next_match()
         raise StopIteration
 
+    cdef _finish(self):
+        cdef bint bypassed_file_object = self.c_file != -1
+        if self.mapping is not None:
+            bypassed_file_object = True
+            cpython.buffer.PyBuffer_Release(&self.mapping_buffer)
+            mapping, self.mapping = self.mapping, None
+            mapping.close()
+        if bypassed_file_object:
+            # move the file object to the end of the data that we read
+            self.f.seek(0, os.SEEK_END)
+        if self.close_file:
+            self.f.close()
+
     cdef _build_next_match(self):
-        match = <bytes> self.current_node.matches[self.match_index]
+        keyword_id = self.current_node.match_ids[self.match_index]
         self.match_index += 1
-        return (match, self.buffer_offset_count + (
-                self.c_buffer_pos - (<unsigned char*> self.buffer)) - len(match))
+        if self.acora._character_lengths is not NULL:
+            self.character_count += _count_characters(self.counted_char, self.c_buffer_pos)
+            self.counted_char = self.c_buffer_pos
+            return (self.acora._match_objects[keyword_id],
+                    self.character_count - self.acora._character_lengths[keyword_id])
+        return (self.acora._match_objects[keyword_id], self.buffer_offset_count + (
+                self.c_buffer_pos - self.c_buffer_start) - self.acora._keyword_lengths[keyword_id])
+
+
+cdef _map_file(int c_file, position):
+    """Memory map a regular file for reading, or return None if that is not possible.
+    """
+    try:
+        import mmap
+        file_stat = os.fstat(c_file)
+        if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size <= position:
+            return None
+        mapping = mmap.mmap(c_file, 0, access=mmap.ACCESS_READ)
+    except (ImportError, EnvironmentError, ValueError, OverflowError):
+        return None
+    try:
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    except (AttributeError, EnvironmentError):
+        # not available on this platform or Python version
+        pass
+    return mapping
 
 
 cdef int _find_next_match_in_cfile(int c_file, unsigned char* c_buffer, size_t buffer_size,
-                                   _AcoraBytesNodeStruct* start_node,
+                                   const _AcoraBytesEngine* engine,
                                    unsigned char** _buffer_pos, unsigned char** _buffer_end,
                                    Py_ssize_t* _buffer_offset_count,
                                    _AcoraBytesNodeStruct** _current_node,
+                                   unsigned char** _counted_char, Py_ssize_t* _character_count,
                                    int* error) nogil:
+    """Read and search the file until the next match.
+
+    Counts the characters of each buffer before reading the next one,
+    starting at _counted_char, unless that is NULL.
+    """
     cdef unsigned char* buffer_pos = _buffer_pos[0]
     cdef unsigned char* buffer_end = _buffer_end[0]
     cdef unsigned char* data_end = c_buffer + buffer_size
@@ -863,6 +3690,9 @@ cdef int _find_next_match_in_cfile(int c_file, unsigned char* c_buffer, size_t b
 
     while not found:
         if buffer_pos >= buffer_end:
+            if _counted_char is not NULL:
+                _character_count[0] += _count_characters(_counted_char[0], buffer_end)
+                _counted_char[0] = c_buffer
             buffer_offset_count += buffer_end - c_buffer
             bytes_read = read(c_file, c_buffer, buffer_size)
             if bytes_read <= 0:
@@ -874,7 +3704,7 @@ cdef int _find_next_match_in_cfile(int c_file, unsigned char* c_buffer, size_t b
             buffer_end = c_buffer + bytes_read
 
         found = _search_in_bytes(
-            start_node, buffer_end, &buffer_pos, &current_node)
+            engine, buffer_end, &buffer_pos, &current_node)
 
     _current_node[0] = current_node
     _buffer_offset_count[0] = buffer_offset_count
@@ -0,0 +1,55 @@
+"""
+Support for sharing search engines between processes through shared memory.
+
+Requires Python 3.8 or later.
+"""
+
+import os
+import sys
+from multiprocessing import shared_memory
+
+
+def image_to_shared_memory(image, name=None):
+    """Copy an engine image into a new shared memory segment.
+    """
+    shm = shared_memory.SharedMemory(name=name, create=True, size=len(image))
+    try:
+        shm.buf[:len(image)] = image
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm
+
+
+def attach_shared_memory(name):
+    """Map an existing shared memory segment for reading.
+
+    Returns the buffer and an object that must be kept alive while it is in use.
+    """
+    if sys.version_info >= (3, 13):
+        # Python 3.13+: do not register the segment with the resource
+        # tracker, which would unlink it when this process exits
+        shm = shared_memory.SharedMemory(name=name, track=False)
+        return shm.buf.toreadonly(), shm
+    if os.name != 'posix':
+        # Windows: there is no resource tracker for shared memory
+        shm = shared_memory.SharedMemory(name=name)
+        return shm.buf.toreadonly(), shm
+    if os.path.isdir('/dev/shm'):
+        # Linux: map the file of the segment read-only, which keeps it
+        # away from the resource tracker
+        import mmap
+        fd = os.open('/dev/shm/' + name.lstrip('/'), os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            return mmap.mmap(fd, size, prot=mmap.PROT_READ), None
+        finally:
+            os.close(fd)
+
+    # macOS and other POSIX systems: POSIX shared memory has no file system
+    # path, so attach the segment and take it back from the resource tracker
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm.buf.toreadonly(), shm
@@ -135,6 +135,60 @@ def run_benchmark(search_string, all_keywords):
                     assert_equal(results, result, bytes_search_string_lower, keywords_lower)
 
 
+def prepare_prefilter_benchmark_data(hit_rate):
+    """Generate log-like data in which roughly 'hit_rate' of all bytes can start a keyword.
+    """
+    import random
+    rng = random.Random(42)
+    letters = 'abcdefghijklmnopqrstuvwxyz   '
+    starts = 'ABCDEFGH'
+    data = ''.join(
+        rng.choice(starts) if rng.random() < hit_rate else rng.choice(letters)
+        for _ in range(1000000))
+    keywords = [
+        start + ''.join(rng.choice(letters) for _ in range(rng.randint(3, 8)))
+        for start in starts for _ in range(50)]
+    return data.encode('ASCII'), [keyword.encode('ASCII') for keyword in keywords]
+
+
+def run_prefilter_benchmark():
+    for hit_rate in (0.001, 0.3):
+        search_string, keywords = prepare_prefilter_benchmark_data(hit_rate)
+        for first_bytes in (1, 3, 8):
+            kwds = [kw for kw in keywords if kw[:1] in b'ABCDEFGH'[:first_bytes]]
+            builder = AcoraBuilder(kwds)
+            print("##Hit rate %.3f, %d first bytes, %d keywords" % (
+                hit_rate, first_bytes, len(kwds)))
+            for layout in ('sparse', 'dense'):
+                c_acora = builder.build(layout=layout)
+                timings = timeit.Timer(partial(c_acora.findall, search_string)).repeat(number=REPEAT_COUNT)
+                print("TIME(ca-%s): %.3f" % (layout, min(timings)))
+
+
+def prepare_build_benchmark_data(keyword_count):
+    """Generate a dictionary of distinct random words.
+    """
+    import random
+    rng = random.Random(42)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    keywords = set()
+    while len(keywords) < keyword_count:
+        keywords.add(''.join(rng.choice(letters) for _ in range(rng.randint(4, 12))))
+    return sorted(keywords)
+
+
+def run_build_benchmark(max_keyword_count=10**6):
+    keyword_count = 10**4
+    while keyword_count <= max_keyword_count:
+        keywords = prepare_build_benchmark_data(keyword_count)
+        print("##Building from %d keywords" % keyword_count)
+        for name, kwds in (('unicode', keywords), ('bytes', [kw.encode('ASCII') for kw in keywords])):
+            t = time()
+            AcoraBuilder(kwds).build()
+            print("TIME(ca-%s): %.3f" % (name, time() - t))
+        keyword_count *= 10
+
+
 def assert_equal(results, result, search_string, keywords):
     if result is None:
         return
@@ -146,4 +200,9 @@ def assert_equal(results, result, search_string, keywords):
 
 
 if __name__ == '__main__':
-    run_benchmark(*prepare_benchmark_data())
+    if 'prefilter' in sys.argv[1:]:
+        run_prefilter_benchmark()
+    elif 'build' in sys.argv[1:]:
+        run_build_benchmark()
+    else:
+        run_benchmark(*prepare_benchmark_data())
@@ -59,6 +59,58 @@ def unescape_unicode(s):
     return unicode_unescaper.decode(s)[0]
 
 
+def run_async_iterator(async_iterator, loop=None):
+    # drive an async iterator without requiring the async/await syntax in this module
+    import asyncio
+    event_loop = loop or asyncio.new_event_loop()
+    try:
+        results = []
+        while True:
+            try:
+                results.append(event_loop.run_until_complete(async_iterator.__anext__()))
+            except StopAsyncIteration:
+                return results
+    finally:
+        if loop is None:
+            event_loop.close()
+
+
+class AsyncChunks(object):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        import asyncio
+        for chunk in self.chunks:
+            return asyncio.sleep(0, result=chunk)
+        raise StopAsyncIteration
+
+
+def find_without_overlaps(data, keywords, mode):
+    # straight forward reference implementation of the non-overlapping match modes
+    matches = []
+    pos = 0
+    while True:
+        found = [(start, end, keyword)
+                 for keyword in keywords
+                 for start in range(pos, len(data) - len(keyword) + 1)
+                 for end in [start + len(keyword)]
+                 if data[start:end] == keyword]
+        if not found:
+            return matches
+        if mode == 'leftmost_longest':
+            start, end, keyword = min(found, key=lambda m: (m[0], -m[1]))
+        elif mode == 'leftmost_shortest':
+            start, end, keyword = min(found, key=lambda m: (m[0], m[1]))
+        else:
+            start, end, keyword = min(found, key=lambda m: (m[1], m[0]))
+        matches.append((keyword, start))
+        pos = end
+
+
 def prepare_test_data():
     s = ('bdfdaskdjfhaslkdhfsadhfklashdflabcasdabcdJAKHDBVDFLNFCBLSADHFCALKSJ'
         'jklhcnajskbhfasjhancfksjdfhbvaliuradefhzcbdegnashdgfbcjaabesdhgkfcnash'
@@ -82,6 +134,7 @@ def prepare_test_data():
 
 class AcoraTest(object):
     search_string, all_keywords = prepare_test_data()
+    build_options = {}
 
     def _build(self, *keywords):
         keywords = list(map(self._swrap, keywords))
@@ -89,7 +142,7 @@ class AcoraTest(object):
         if DOTDEBUG:
             print('Initial tree:')
             tree_to_dot(builder.tree)
-        machine = builder.build(acora=self.acora)
+        machine = builder.build(acora=self.acora, **self.build_options)
         if DOTDEBUG:
             print('\nProcessed tree:')
             tree_to_dot(builder.tree)
@@ -104,7 +157,7 @@ class AcoraTest(object):
         if DOTDEBUG:
             print('Initial tree:')
             tree_to_dot(builder.tree)
-        machine = builder.build(acora=self.acora)
+        machine = builder.build(acora=self.acora, **self.build_options)
         if DOTDEBUG:
             print('\nProcessed tree:')
             tree_to_dot(builder.tree)
@@ -173,6 +226,340 @@ class AcoraTest(object):
             sorted(finditer(s('abcd'))),
             self._result([('abcd', 0), ('bcd', 1), ('cd', 2), ('d', 3)]))
 
+    def test_findall_arrays(self):
+        s = self._swrap
+        ac = self._build(*self.all_keywords)
+        data = s(self.search_string[:5000])
+        keyword_ids, offsets = ac.findall_arrays(data)
+        self.assertEqual(sorted(ac.keywords), sorted(map(s, self.all_keywords)))
+        self.assertEqual(memoryview(keyword_ids).format, 'q')
+        self.assertEqual(memoryview(offsets).format, 'q')
+        self.assertEqual(
+            [(ac.keywords[keyword_id], offset) for keyword_id, offset in zip(keyword_ids, offsets)],
+            ac.findall(data))
+
+    def test_findall_arrays_empty(self):
+        s = self._swrap
+        self.assertEqual(self._build().keywords, ())
+        keyword_ids, offsets = self._build().findall_arrays(s('abc'))
+        self.assertEqual((len(keyword_ids), len(offsets)), (0, 0))
+        keyword_ids, offsets = self._build('x').findall_arrays(s('abc'))
+        self.assertEqual((len(keyword_ids), len(offsets)), (0, 0))
+
+    def test_findall_parallel(self):
+        s = self._swrap
+        ac = self._build('abcd', 'bc', 'cdab', 'dabcdabc', 'x')
+        data = s('abcd' * 70000 + 'xx')
+        expected = ac.findall(data)
+        for workers in (None, 1, 3, 7):
+            self.assertEqual(ac.findall_parallel(data, workers=workers), expected)
+
+        data = s(self.search_string[:200000])
+        ac = self._build(*self.all_keywords)
+        self.assertEqual(ac.findall_parallel(data, 5), ac.findall(data))
+
+    def test_findall_parallel_small(self):
+        s = self._swrap
+        self.assertEqual(self._build().findall_parallel(s('abc'), 4), [])
+        self.assertEqual(self._build('a').findall_parallel(s(''), 4), [])
+        self.assertEqual(
+            self._build('a', 'bc').findall_parallel(s('abca'), 4),
+            self._result([('a', 0), ('bc', 1), ('a', 3)]))
+        self.assertRaises(ValueError, self._build('a').findall_parallel, s('abc'), 0)
+
+    def test_findall_many(self):
+        s = self._swrap
+        ac = self._build(*self.all_keywords)
+        documents = [s(self.search_string[i:i + 100]) for i in range(0, 5000, 100)]
+        documents.insert(3, s(''))
+        self.assertEqual(
+            ac.findall_many(iter(documents)),
+            [ac.findall(document) for document in documents])
+        self.assertEqual(ac.findall_many([]), [])
+        self.assertEqual(self._build().findall_many([s('abc'), s('')]), [[], []])
+
+    def test_search_many(self):
+        s = self._swrap
+        ac = self._build('a', 'bc', 'abc')
+        doc_indices, keyword_ids, offsets = ac.search_many([s('xabc'), s(''), s('x'), s('bca')])
+        self.assertEqual(memoryview(doc_indices).format, 'q')
+        self.assertEqual(
+            [(doc_index, ac.keywords[keyword_id], offset)
+             for doc_index, keyword_id, offset in zip(doc_indices, keyword_ids, offsets)],
+            [(0, s('a'), 1), (0, s('abc'), 1), (0, s('bc'), 2), (3, s('bc'), 0), (3, s('a'), 2)])
+        doc_indices, keyword_ids, offsets = ac.search_many([])
+        self.assertEqual((len(doc_indices), len(keyword_ids), len(offsets)), (0, 0, 0))
+
+    def test_stream(self):
+        s = self._swrap
+        ac = self._build(*self.all_keywords)
+        data = s(self.search_string[:5000])
+        expected = ac.findall(data)
+        for chunk_size in (1, 2, 7, 100, 6000):
+            scanner = ac.stream()
+            found = []
+            for i in range(0, len(data), chunk_size):
+                found.extend(scanner.feed(data[i:i + chunk_size]))
+            self.assertEqual(found, expected)
+            self.assertEqual(scanner.position, len(data))
+
+    def test_stream_reset(self):
+        s = self._swrap
+        scanner = self._build('abc', 'bc').stream()
+        self.assertEqual(scanner.feed(s('xa')), [])
+        self.assertEqual(scanner.feed(s('b')), [])
+        self.assertEqual(scanner.feed(s('')), [])
+        self.assertEqual(scanner.feed(s('cx')), self._result([('abc', 1), ('bc', 2)]))
+        self.assertEqual(scanner.feed(s('ab')), [])
+        scanner.reset()
+        self.assertEqual(scanner.position, 0)
+        self.assertEqual(scanner.feed(s('c')), [])
+        self.assertEqual(scanner.feed(s('bc')), self._result([('bc', 1)]))
+        self.assertEqual(self._build().stream().feed(s('abc')), [])
+
+    @unittest.skipIf(sys.version_info < (3, 6), "requires async generators")
+    def test_afind(self):
+        s = self._swrap
+        ac = self._build(*self.all_keywords)
+        data = s(self.search_string[:5000])
+        chunks = [data[i:i + 300] for i in range(0, len(data), 300)]
+        self.assertEqual(run_async_iterator(ac.afind(AsyncChunks(chunks))), ac.findall(data))
+        self.assertEqual(run_async_iterator(ac.afind(AsyncChunks([]))), [])
+
+    def test_match_modes(self):
+        s = self._swrap
+        ac = self._build('a', 'ab', 'abc', 'b', 'bcd', 'c', 'xyz', 'y')
+        data = s('abcdxyzxy')
+        self.assertEqual(
+            ac.findall(data, mode='overlapping'), ac.findall(data))
+        self.assertEqual(
+            ac.findall(data, mode='leftmost_longest'),
+            self._result([('abc', 0), ('xyz', 4), ('y', 8)]))
+        self.assertEqual(
+            ac.findall(data, mode='leftmost_shortest'),
+            self._result([('a', 0), ('b', 1), ('c', 2), ('xyz', 4), ('y', 8)]))
+        self.assertEqual(
+            ac.findall(data, mode='non_overlapping'),
+            self._result([('a', 0), ('b', 1), ('c', 2), ('y', 5), ('y', 8)]))
+        self.assertEqual(
+            list(ac.finditer(data, mode='leftmost_longest')),
+            ac.findall(data, mode='leftmost_longest'))
+
+        # inner overlaps
+        ac = self._build('abcd', 'bc', 'cdef', 'ab')
+        data = s('abcdefabcde')
+        self.assertEqual(
+            ac.findall(data, mode='leftmost_longest'),
+            self._result([('abcd', 0), ('abcd', 6)]))
+        self.assertEqual(
+            ac.findall(data, mode='leftmost_shortest'),
+            self._result([('ab', 0), ('cdef', 2), ('ab', 6)]))
+        self.assertEqual(
+            ac.findall(data, mode='non_overlapping'),
+            self._result([('ab', 0), ('cdef', 2), ('ab', 6)]))
+
+        keyword_ids, offsets = ac.findall_arrays(data, mode='leftmost_longest')
+        self.assertEqual(
+            [(ac.keywords[keyword_id], offset) for keyword_id, offset in zip(keyword_ids, offsets)],
+            self._result([('abcd', 0), ('abcd', 6)]))
+        self.assertRaises(ValueError, ac.findall, data, mode='longest')
+        # the shortest keyword wins, not the first added one, so there is no 'leftmost_first'
+        self.assertRaises(ValueError, ac.findall, data, mode='leftmost_first')
+        self.assertEqual(self._build().findall(data, mode='leftmost_longest'), [])
+
+    def test_match_modes_random(self):
+        import random
+        s = self._swrap
+        rand = random.Random(42)
+        for _ in range(20):
+            keywords = set(
+                ''.join(rand.choice('abc') for _ in range(rand.randint(1, 6)))
+                for _ in range(rand.randint(1, 8)))
+            ac = self._build(*keywords)
+            data = ''.join(rand.choice('abcd') for _ in range(200))
+            for mode in ('leftmost_longest', 'leftmost_shortest', 'non_overlapping'):
+                self.assertEqual(
+                    ac.findall(s(data), mode=mode),
+                    self._result(find_without_overlaps(data, keywords, mode)),
+                    (mode, sorted(keywords), data))
+
+    def test_contains_and_find_first(self):
+        s = self._swrap
+        ac = self._build(*self.all_keywords)
+        data = s(self.search_string[:5000])
+        self.assertTrue(ac.contains(data))
+        self.assertEqual(ac.find_first(data), ac.findall(data)[0])
+        self.assertFalse(ac.contains(s('xyz')))
+        self.assertEqual(ac.find_first(s('xyz')), None)
+        self.assertEqual(ac.find_first(s('xyzabcd')), (s('ab'), 3))
+        self.assertFalse(self._build().contains(s('abc')))
+        self.assertEqual(self._build().find_first(s('abc')), None)
+
+    def test_count(self):
+        s = self._swrap
+        ac = self._build(*self.all_keywords)
+        data = s(self.search_string[:5000])
+        matches = ac.findall(data)
+        self.assertEqual(ac.count(data), len(matches))
+        expected = {}
+        for keyword, _ in matches:
+            expected[keyword] = expected.get(keyword, 0) + 1
+        self.assertEqual(ac.count_by_keyword(data), expected)
+        self.assertEqual(ac.count(s('xyz')), 0)
+        self.assertEqual(ac.count_by_keyword(s('xyz')), {})
+        self.assertEqual(self._build().count(data), 0)
+        self.assertEqual(self._build().count_by_keyword(data), {})
+
+    def test_stats(self):
+        s = self._swrap
+        ac = self._build('ab', 'bc')
+        stats = ac.stats()
+        # states: start, a, ab, b, bc; each one inherits the transitions of its failure state
+        self.assertEqual(stats['state_count'], 5)
+        self.assertEqual(stats['transition_count'], 12)
+        self.assertEqual(stats['fanout'], {2: 3, 3: 2})
+        self.assertEqual(stats['keyword_count'], 2)
+        self.assertEqual(stats['max_keyword_length'], 2)
+        self.assertEqual(stats['image_size'], 0)
+        self.assertTrue(stats['python_size'] >= sys.getsizeof(s('ab')) * 2)
+
+        empty_stats = self._build().stats()
+        self.assertEqual(empty_stats['state_count'], 1)
+        self.assertEqual(empty_stats['transition_count'], 0)
+        self.assertEqual(empty_stats['keyword_count'], 0)
+        self.assertEqual(empty_stats['max_keyword_length'], 0)
+
+    def test_sizeof(self):
+        s = self._swrap
+        small = self._build('ab', 'bc')
+        large = self._build(*[s('%05d' % i) for i in range(1000)])
+        self.assertTrue(sys.getsizeof(large) > sys.getsizeof(small) + 1000)
+        self.assertTrue(sys.getsizeof(large) >= large.stats()['native_size'])
+
+    def test_random_keywords(self):
+        import random
+        s = self._swrap
+        rand = random.Random(7)
+        keywords = set(
+            ''.join(rand.choice('abcdAB') for _ in range(rand.randint(1, 7)))
+            for _ in range(300))
+        data = ''.join(rand.choice('abcdeAB') for _ in range(3000))
+        ac = self._build(*keywords)
+        expected = [
+            (keyword, start) for keyword in keywords
+            for start in range(len(data)) if data.startswith(keyword, start)]
+        self.assertEqual(sorted(ac.findall(s(data))), sorted(self._result(expected)))
+
+    def test_report_ids(self):
+        import pickle
+        s = self._swrap
+        data = s('abcdeabxcabca')
+        ac = self._build('ab', 'bc', 'cde')
+        builder = acora.AcoraBuilder(*list(map(s, ['ab', 'bc', 'cde'])))
+        ids = builder.build(acora=self.acora, report='id', **self.build_options)
+        self.assertEqual(ids.report, 'id')
+        self.assertEqual(ids.values, None)
+        expected = [(ac.keywords.index(keyword), pos) for keyword, pos in ac.findall(data)]
+        self.assertEqual(ids.findall(data), expected)
+        self.assertEqual(list(ids.finditer(data)), expected)
+        self.assertEqual(ids.find_first(data), expected[0])
+        self.assertEqual(ids.stream().feed(data), expected)
+        self.assertEqual(ids.count_by_keyword(data), {0: 3, 1: 2, 2: 1})
+        self.assertEqual(ids.findall_arrays(data), ac.findall_arrays(data))
+        self.assertEqual(pickle.loads(pickle.dumps(ids)).findall(data), expected)
+        self.assertEqual(
+            ids.findall(data, mode='leftmost_longest'),
+            [(ac.keywords.index(keyword), pos) for keyword, pos in ac.findall(data, mode='leftmost_longest')])
+
+        self.assertRaises(ValueError, builder.build, acora=self.acora, report='keywords')
+
+    def test_report_values(self):
+        import pickle
+        s = self._swrap
+        data = s('abcdeabxcabca')
+        builder = acora.AcoraBuilder()
+        builder.add(s('ab'), s('bc'), value='rule1')
+        builder.add_items({s('cde'): ('rule', 2)})
+        builder.add_items([(s('ca'), None)])
+        builder.add(s('x'))
+        self.assertRaises(TypeError, builder.add, s('y'), ignore_case=True)
+        self.assertRaises(TypeError, builder.add, s('y'), value=1, values=2)
+        ac = builder.build(acora=self.acora, report='value', **self.build_options)
+        self.assertEqual(ac.report, 'value')
+        self.assertEqual(ac.keywords, tuple(map(s, ['ab', 'bc', 'ca', 'cde', 'x'])))
+        self.assertEqual(ac.values, ('rule1', 'rule1', None, ('rule', 2), None))
+        self.assertEqual(ac.findall(data), [
+            ('rule1', 0), ('rule1', 1), (('rule', 2), 2), ('rule1', 5), (None, 7),
+            (None, 8), ('rule1', 9), ('rule1', 10), (None, 11)])
+        self.assertEqual(ac.find_first(data), ('rule1', 0))
+        self.assertEqual(ac.count_by_keyword(data), {'rule1': 5, ('rule', 2): 1, None: 3})
+        self.assertEqual(pickle.loads(pickle.dumps(ac)).findall(data), ac.findall(data))
+        self.assertRaises(ValueError, ac.save, _BytesIO())
+
+        # the values are kept when reporting keywords
+        keywords = builder.build(acora=self.acora, **self.build_options)
+        self.assertEqual(keywords.values, ac.values)
+        self.assertEqual(keywords.find_first(data), (s('ab'), 0))
+
+    def test_updatable(self):
+        s = self._swrap
+        data = s('abcdeabxcabca')
+        ac = acora.UpdatableAcora(
+            list(map(s, ['ab', 'bc', 'cde'])), acora=self.acora, max_delta=None, **self.build_options)
+        self.assertEqual(ac.findall(data), self._build('ab', 'bc', 'cde').findall(data))
+
+        ac.add(s('a'), s('ca'))
+        ac.remove(s('bc'), s('xyz'))
+        self.assertEqual(ac.keywords, tuple(map(s, ['a', 'ab', 'ca', 'cde'])))
+        expected = self._build('a', 'ab', 'ca', 'cde')
+        for mode in ('overlapping', 'leftmost_longest', 'non_overlapping'):
+            self.assertEqual(ac.findall(data, mode), expected.findall(data, mode))
+            self.assertEqual(list(ac.finditer(data, mode)), expected.findall(data, mode))
+        self.assertEqual(ac.find_first(data), expected.find_first(data))
+        self.assertEqual(ac.count(data), expected.count(data))
+        self.assertEqual(ac.count_by_keyword(data), expected.count_by_keyword(data))
+        self.assertTrue(ac.contains(data))
+        self.assertFalse(ac.contains(s('bxb')))
+
+        old_findall = ac.findall
+        ac.merge()
+        self.assertEqual(ac.findall(data), expected.findall(data))
+        self.assertEqual(old_findall(data), expected.findall(data))
+
+        ac.remove(*ac.keywords)
+        self.assertEqual(ac.findall(data), [])
+        self.assertEqual(ac.find_first(data), None)
+        self.assertFalse(ac.contains(data))
+        ac.merge()
+        self.assertEqual(ac.count(data), 0)
+
+    def test_updatable_ignore_case(self):
+        s = self._swrap
+        data = s('baab Baa BAb')
+        for base_keywords, added in [(['bAA', 'B'], ['BaA', 'Baa']),
+                                     (['ba', 'aB'], ['B', 'Ba'])]:
+            ac = acora.UpdatableAcora(
+                list(map(s, base_keywords)), ignore_case=True,
+                acora=self.acora, max_delta=None, **self.build_options)
+            ac.add(*list(map(s, added)))
+            expected = acora.AcoraBuilder(*ac.keywords).build(
+                ignore_case=True, acora=self.acora, **self.build_options)
+            for mode in ('overlapping', 'leftmost_longest', 'leftmost_shortest', 'non_overlapping'):
+                self.assertEqual(ac.findall(data, mode), expected.findall(data, mode))
+            self.assertEqual(ac.find_first(data), expected.find_first(data))
+
+    def test_updatable_background_merge(self):
+        s = self._swrap
+        data = s('abcdeabxcabca')
+        ac = acora.UpdatableAcora(acora=self.acora, max_delta=2, **self.build_options)
+        ac.add(s('ab'))
+        ac.add(s('bc'), s('cde'))
+        thread = ac._merge_thread
+        if thread is not None:
+            thread.join()
+        self.assertEqual(ac._engines[2], None)
+        self.assertEqual(ac.findall(data), self._build('ab', 'bc', 'cde').findall(data))
+
     def test_deepcopy_builder(self):
         from copy import deepcopy
         s = self._swrap
@@ -192,12 +579,76 @@ class AcoraTest(object):
             sorted(finditer2(s('abcd'))),
             self._result([('a', 0), ('ab', 0), ('b', 1), ('bc', 1), ('c', 2)]))
 
+    def test_builder_add_iter(self):
+        s = self._swrap
+        builder = acora.AcoraBuilder()
+        builder.add_iter(s(keyword) for keyword in ['ab', 'bc', 'de'])
+        builder.update(s(keyword) for keyword in ['a', 'b'])
+        self.assertEqual(builder.keywords, set(map(s, ['a', 'ab', 'b', 'bc', 'de'])))
+        ac = builder.build(acora=self.acora, **self.build_options)
+        self.assertEqual(
+            ac.findall(s('abde')),
+            self._result([('a', 0), ('ab', 0), ('b', 1), ('de', 2)]))
+
+    def test_builder_add_iter_mixed_types(self):
+        s = self._swrap
+        other = b'b' if isinstance(s('a'), unicode) else u'b'
+        builder = acora.AcoraBuilder()
+        self.assertRaises(TypeError, builder.add_iter, iter([s('a'), other]))
+        # the builder remains usable after rejecting a keyword
+        builder.add(s('bc'))
+        ac = builder.build(acora=self.acora, **self.build_options)
+        self.assertEqual(ac.findall(s('abc')), self._result([('a', 0), ('bc', 1)]))
+
+    def test_builder_without_keyword_set(self):
+        s = self._swrap
+        builder = acora.AcoraBuilder(s('ab'), s('Bc'), ignore_case=True, keep_keywords=False)
+        self.assertEqual(builder.keywords, None)
+        # changing the case sensitivity rebuilds the trie from its own keywords
+        ac = builder.build(ignore_case=False, acora=self.acora, **self.build_options)
+        self.assertEqual(ac.findall(s('abc')), self._result([('ab', 0)]))
+        self.assertEqual(ac.findall(s('aBc')), self._result([('Bc', 1)]))
+
+    def test_builder_from_file(self):
+        import os
+        import tempfile
+        s = self._swrap
+        encoding = 'utf-8' if isinstance(s('a'), unicode) else None
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'ab\r\nbc\n\nde\na\nb')
+            builder = acora.AcoraBuilder.from_file(filename, encoding=encoding)
+            self.assertEqual(builder.keywords, None)
+            ac = builder.build(acora=self.acora, **self.build_options)
+            self.assertEqual(
+                ac.findall(s('abde')),
+                self._result([('a', 0), ('ab', 0), ('b', 1), ('de', 2)]))
+
+            builder = acora.AcoraBuilder.from_file(
+                filename, encoding=encoding, delimiter=b'b', keep_keywords=True)
+            self.assertEqual(
+                builder.keywords, set(map(s, ['a', '\r\n', 'c\n\nde\na\n'])))
+        finally:
+            os.remove(filename)
+
+    def test_builder_from_empty_file(self):
+        import os
+        import tempfile
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.close(fd)
+            builder = acora.AcoraBuilder.from_file(filename)
+            self.assertEqual(builder.for_unicode, None)
+        finally:
+            os.remove(filename)
+
     def test_deepcopy_machine(self):
         from copy import deepcopy
         s = self._swrap
 
         builder = acora.AcoraBuilder(*list(map(s, ['a', 'b', 'c'])))
-        ac1 = builder.build(acora=self.acora)
+        ac1 = builder.build(acora=self.acora, **self.build_options)
         ac2 = deepcopy(ac1)
 
         self.assertEqual(
@@ -213,7 +664,7 @@ class AcoraTest(object):
         s = self._swrap
 
         builder = acora.AcoraBuilder(*list(map(s, ['a', 'b', 'c'])))
-        ac1 = builder.build(acora=self.acora)
+        ac1 = builder.build(acora=self.acora, **self.build_options)
         #if not isinstance(ac1, acora.PyAcora):
         #    machine_to_dot(ac1)
         ac2 = pickle.loads(pickle.dumps(ac1))
@@ -233,7 +684,7 @@ class AcoraTest(object):
         s = self._swrap
 
         builder = acora.AcoraBuilder(*list(map(s, ['a', 'b', 'c'])))
-        ac1 = builder.build(acora=self.acora)
+        ac1 = builder.build(acora=self.acora, **self.build_options)
         #if not isinstance(ac1, acora.PyAcora):
         #    machine_to_dot(ac1)
         ac2 = pickle.loads(pickle.dumps(ac1, protocol=pickle.HIGHEST_PROTOCOL))
@@ -252,7 +703,7 @@ class AcoraTest(object):
         s = self._swrap
 
         builder = acora.AcoraBuilder(*list(map(s, ['a', 'bc', 'c'])))
-        ac = builder.build(acora=self.acora)
+        ac = builder.build(acora=self.acora, **self.build_options)
         #if not isinstance(ac, acora.PyAcora):
         #    machine_to_dot(ac)
 
@@ -271,6 +722,113 @@ class AcoraTest(object):
             self._result([('a', 0), ('bc', 1), ('c', 2)]))
 
 
+    def test_save_load(self):
+        import os
+        import pickle
+        import tempfile
+        s = self._swrap
+        keywords = list(map(s, ['a', 'ab', 'abc', 'bc', 'c', 'cde', 'ca']))
+        data = s('abcdeabxcabca')
+        ac = self._build(*keywords)
+        expected = ac.findall(data)
+
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.close(fd)
+            ac.save(filename)
+            for use_mmap in (True, False):
+                loaded = self.acora.load(filename, mmap=use_mmap)
+                self.assertEqual(loaded.keywords, ac.keywords)
+                self.assertEqual(loaded.stats()['fanout'], ac.stats()['fanout'])
+                self.assertEqual(loaded.findall(data), expected)
+                self.assertEqual(sorted(loaded.findall(data, mode='leftmost_longest')),
+                                 sorted(ac.findall(data, mode='leftmost_longest')))
+                self.assertEqual(loaded.stream().feed(data), expected)
+                if hasattr(ac, 'layout'):
+                    self.assertEqual(loaded.layout, ac.layout)
+                # loaded engines can be pickled and saved again
+                self.assertEqual(pickle.loads(pickle.dumps(loaded)).findall(data), expected)
+                f = tempfile.TemporaryFile()
+                try:
+                    loaded.save(f)
+                    f.seek(0)
+                    self.assertEqual(len(f.read()), os.path.getsize(filename))
+                finally:
+                    f.close()
+        finally:
+            os.remove(filename)
+
+    def test_save_load_random_keywords(self):
+        import os
+        import random
+        import tempfile
+        s = self._swrap
+        rand = random.Random(11)
+        keywords = set(
+            ''.join(rand.choice('abcdeAB') for _ in range(rand.randint(1, 9)))
+            for _ in range(500))
+        data = s(''.join(rand.choice('abcdefAB') for _ in range(3000)))
+        ac = self._build(*keywords)
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.close(fd)
+            ac.save(filename)
+            for use_mmap in (True, False):
+                loaded = self.acora.load(filename, mmap=use_mmap)
+                self.assertEqual(loaded.findall(data), ac.findall(data))
+            del loaded
+        finally:
+            os.remove(filename)
+
+    def test_save_load_python_engine(self):
+        import os
+        import tempfile
+        s = self._swrap
+        data = s('abcdeabxcabca')
+        ac = acora.AcoraBuilder(*list(map(s, ['ab', 'bc', 'cde', 'ca']))).build(acora=acora.PyAcora)
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.close(fd)
+            ac.save(filename)
+            loaded = self.acora.load(filename)
+            self.assertEqual(loaded.keywords, ac.keywords)
+            self.assertEqual(loaded.findall(data), ac.findall(data))
+        finally:
+            os.remove(filename)
+
+    def test_shared_memory(self):
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            return  # Python < 3.8
+        s = self._swrap
+        data = s('abcdeabxcabca')
+        ac = self._build(*list(map(s, ['ab', 'bc', 'cde', 'ca'])))
+        shm = ac.to_shared_memory()
+        try:
+            attached = self.acora.from_shared_memory(shm.name)
+            self.assertEqual(attached.keywords, ac.keywords)
+            self.assertEqual(attached.findall(data), ac.findall(data))
+            if hasattr(ac, 'layout'):
+                self.assertEqual(attached.layout, ac.layout)
+            del attached
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_load_invalid(self):
+        import os
+        import tempfile
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'not an acora engine' * 10)
+            self.assertRaises(ValueError, self.acora.load, filename)
+            self.assertRaises(ValueError, self.acora.load, filename, mmap=False)
+        finally:
+            os.remove(filename)
+
+
 class UnicodeAcoraTest(unittest.TestCase, AcoraTest):
     # only unicode data tests
     from acora import UnicodeAcora as acora
@@ -344,6 +902,127 @@ class UnicodeAcoraTest(unittest.TestCase, AcoraTest):
             self._result([('A', 0), ('A', 1), ('B', 2), ('B', 3),
                           ('a', 0), ('a', 1), ('b', 2), ('b', 3)]))
 
+    def test_finditer_ignore_case_random_keywords(self):
+        import random
+        s = self._swrap
+        rand = random.Random(7)
+        letters = ['a', 'b', 'c', 'd', 'A', 'B', '\\xe4', '\\xc4']
+        keywords = set(
+            ''.join(rand.choice(letters) for _ in range(rand.randint(1, 7)))
+            for _ in range(300))
+        data = s(''.join(rand.choice(letters + ['e']) for _ in range(3000)))
+        ac = self._build_ignore_case(*keywords)
+        expected = [
+            (keyword, start) for keyword in map(s, keywords)
+            for start in range(len(data)) if data.lower().startswith(keyword.lower(), start)]
+        self.assertEqual(sorted(ac.findall(data)), sorted(expected))
+
+    def test_finditer_ignore_case_shared_upper_case(self):
+        # 's' and the long s share the upper case 'S', the Kelvin sign is not the upper case of 'k'
+        s = self._swrap
+        ac = self._build_ignore_case('as', 'b\\u017f', 'k')
+        self.assertEqual(
+            sorted(ac.findall(s('aS bS as b\\u017f a\\u017f K \\u212a'))),
+            self._result([('as', 0), ('as', 6), ('b\\u017f', 3), ('b\\u017f', 9), ('k', 15)]))
+
+    def test_finditer_ignore_case_shared_upper_case_failure(self):
+        # states that fail over to a state with children 's' and the long s (or the
+        # micro sign and mu) take the transition to the first one for their upper case
+        s = self._swrap
+        ac = self._build_ignore_case('aA\\xc9s', 's', '\\u017f\\u017f')
+        self.assertEqual(ac.findall(s('aS')), self._result([('s', 1)]))
+        ac = self._build_ignore_case('\\xb5', '\\u03bc\\xff')
+        self.assertEqual(ac.findall(s('\\u039c\\u039c')), self._result([('\\xb5', 1)]))
+
+    def test_finditer_ignore_case_shared_upper_case_random(self):
+        import random
+        s = self._swrap
+        rand = random.Random(13)
+        letters = ['a', 's', 'S', '\\u017f', '\\xb5', '\\u03bc', '\\u039c',
+                   'k', 'K', '\\u212a', '\\u03c3', '\\u03c2', '\\u03a3', '\\xff', '\\u0178']
+        for _ in range(200):
+            keywords = set(
+                ''.join(rand.choice(letters) for _ in range(rand.randint(1, 4)))
+                for _ in range(rand.randint(1, 8)))
+            data = s(''.join(rand.choice(letters) for _ in range(30)))
+            builder = acora.AcoraBuilder(*map(s, keywords), ignore_case=True)
+            self.assertEqual(
+                sorted(builder.build(acora=self.acora).findall(data)),
+                sorted(builder.build(acora=acora.PyAcora).findall(data)))
+
+    def test_stats_ignore_case(self):
+        if self.acora is acora.PyAcora:
+            return
+        # case insensitive engines fold the input instead of adding upper case transitions
+        keywords = ('ab', 'b\\xe4', '\\u03b1\\u03b2')
+        self.assertEqual(
+            self._build_ignore_case(*keywords).stats()['transition_count'],
+            self._build(*keywords).stats()['transition_count'])
+
+    def test_save_load_ignore_case(self):
+        import os
+        import tempfile
+        s = self._swrap
+        ac = self._build_ignore_case('ab', '\\xe4b')
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                ac.save(f)
+            loaded = self.acora.load(filename)
+            self.assertEqual(
+                loaded.findall(s('AB \\xc4B')), self._result([('ab', 0), ('\\xe4b', 3)]))
+        finally:
+            os.remove(filename)
+
+    def test_save_load_ignore_case_python_engine(self):
+        import os
+        import tempfile
+        s = self._swrap
+        data = s('eE\\xe9\\xc9 sS\\u017f ab AB')
+        ac = self._build_ignore_case('E', '\\xe9', 's', '\\u017f', 'aB')
+        fd, filename = tempfile.mkstemp()
+        try:
+            os.close(fd)
+            ac.save(filename)
+            for engine in (self.acora, acora.PyAcora):
+                loaded = engine.load(filename)
+                self.assertEqual(loaded.findall(data), ac.findall(data))
+        finally:
+            os.remove(filename)
+
+    def test_latin1_same_result_as_wide(self):
+        # 1-byte strings are searched with a byte-width copy of the automaton,
+        # wider strings with the character automaton
+        import random
+        s = self._swrap
+        rand = random.Random(11)
+        letters = ['a', 'b', 'A', 'B', '\\xe0', '\\xc0', '\\xb5', '\\xff', 'k']
+        keywords = set(
+            ''.join(rand.choice(letters) for _ in range(rand.randint(1, 4)))
+            for _ in range(50))
+        keywords.update(['\\u0178', '\\u039c', '\\u212a'])
+        data = s(''.join(rand.choice(letters + ['x']) for _ in range(1000)))
+        for ac in (self._build(*keywords), self._build_ignore_case(*keywords)):
+            self.assertEqual(
+                ac.findall(data),
+                [(kw, pos) for kw, pos in ac.findall(data + s('\\u0100'))
+                 if pos + len(kw) <= len(data)])
+
+    def test_layout(self):
+        import pickle
+        if self.acora is acora.PyAcora:
+            return
+        s = self._swrap
+        builder = acora.AcoraBuilder(s('ab'), s('b\\xe4'))
+        data = s('abb\\xe4 ab')
+        self.assertEqual(builder.build(acora=self.acora).layout, 'dense')
+        for layout in ('dense', 'sparse'):
+            ac = builder.build(acora=self.acora, layout=layout)
+            self.assertEqual(ac.layout, layout)
+            self.assertEqual(ac.findall(data), self._result([('ab', 0), ('b\\xe4', 2), ('ab', 5)]))
+            self.assertEqual(pickle.loads(pickle.dumps(ac)).layout, layout)
+        self.assertRaises(ValueError, builder.build, acora=self.acora, layout='unknown')
+
 
 class BytesAcoraTest(unittest.TestCase, AcoraTest):
     # only byte data tests
@@ -372,6 +1051,152 @@ class BytesAcoraTest(unittest.TestCase, AcoraTest):
         finally:
             tmp.close()
 
+    def test_finditer_ignore_case_ascii(self):
+        import pickle
+        s = self._swrap
+        # only ASCII letters are case folded in byte data
+        ac = self._build_ignore_case('ab', 'Cd', '\xe9x')
+        data = s('AB aB cD \xc9X \xe9X')
+        expected = self._result([('ab', 0), ('ab', 3), ('Cd', 6), ('\xe9x', 12)])
+        self.assertEqual(ac.findall(data), expected)
+        self.assertEqual(list(ac.finditer(bytearray(data))), expected)
+        self.assertEqual(ac.filefindall(_BytesIO(data)), expected)
+        self.assertEqual(ac.count(data), 4)
+        self.assertEqual(pickle.loads(pickle.dumps(ac)).findall(data), expected)
+
+        builder = acora.AcoraBuilder(s('ab'), s('Cd'), s('\xe9x'))
+        ac = builder.build(ignore_case=True, acora=self.acora, **self.build_options)
+        self.assertEqual(ac.findall(data), expected)
+
+    def test_finditer_ignore_case_random_keywords(self):
+        import random
+        s = self._swrap
+        rand = random.Random(7)
+        letters = ['a', 'b', 'c', 'A', 'B', '\xe4', '\xc4', '@', '`']
+        keywords = set(
+            ''.join(rand.choice(letters) for _ in range(rand.randint(1, 7)))
+            for _ in range(300))
+        data = s(''.join(rand.choice(letters + ['e']) for _ in range(3000)))
+        ac = self._build_ignore_case(*keywords)
+        # bytes.lower() only changes ASCII letters
+        expected = [
+            (keyword, start) for keyword in map(s, keywords)
+            for start in range(len(data)) if data.lower().startswith(keyword.lower(), start)]
+        self.assertEqual(sorted(ac.findall(data)), sorted(expected))
+
+    def _build_encoded(self, keywords, **kwargs):
+        builder = acora.AcoraBuilder(list(keywords))
+        kwargs.update(self.build_options)
+        return builder.build(acora=self.acora, encoding='utf-8', **kwargs)
+
+    def test_finditer_encoded_text_keywords(self):
+        keywords = [unescape_unicode(k) for k in [
+            'Gr\\u00fc\\u00dfe', 'K\\u00f6ln', 'Gr', '\\u03ba\\u03cc\\u03c3\\u03bc\\u03b5', '\\U0001d11e!']]
+        text = unescape_unicode(
+            'Gr\\u00fc\\u00dfe aus K\\u00f6ln, \\U0001d11e! \\u03ba\\u03cc\\u03c3\\u03bc\\u03b5 Gr\\u00fc\\u00dfe')
+        data = text.encode('utf-8')
+        expected_chars = acora.AcoraBuilder(keywords).build().findall(text)
+        expected_bytes = [
+            (keyword, len(text[:pos].encode('utf-8'))) for keyword, pos in expected_chars]
+
+        for offsets, expected in [('bytes', expected_bytes), ('characters', expected_chars)]:
+            ac = self._build_encoded(keywords, offsets=offsets)
+            self.assertEqual(ac.keywords, tuple(sorted(keywords)))
+            self.assertEqual(ac.findall(data), expected)
+            self.assertEqual(list(ac.finditer(bytearray(data))), expected)
+            self.assertEqual(ac.find_first(data), expected[0])
+            self.assertEqual(ac.filefindall(_BytesIO(data)), expected)
+            self.assertEqual(ac.findall_parallel(data), expected)
+            self.assertEqual(ac.findall_many([data, b'', data]), [expected, [], expected])
+            keyword_ids, positions = ac.findall_arrays(data)
+            self.assertEqual([(ac.keywords[i], pos) for i, pos in zip(keyword_ids, positions)], expected)
+            found_keywords = [keyword for keyword, _ in expected]
+            self.assertEqual(ac.count_by_keyword(data),
+                             dict((keyword, found_keywords.count(keyword)) for keyword in found_keywords))
+            self.assertEqual(ac.count(data), len(expected))
+
+            stream = ac.stream()
+            found = []
+            for i in range(len(data)):
+                found.extend(stream.feed(data[i:i+1]))
+            self.assertEqual(found, expected)
+
+            longest = [match for match in expected if match[0] != 'Gr']
+            self.assertEqual(ac.findall(data, mode='leftmost_longest'), longest)
+
+    def test_finditer_encoded_text_keywords_random(self):
+        import random
+        rand = random.Random(5)
+        letters = [unescape_unicode(c) for c in ['a', 'b', '\\u00e4', '\\u20ac', '\\U0001d11e']]
+        keywords = set(
+            ''.join(rand.choice(letters) for _ in range(rand.randint(1, 4)))
+            for _ in range(100))
+        text = ''.join(rand.choice(letters + ['c']) for _ in range(20000))
+        data = text.encode('utf-8')
+        expected = acora.AcoraBuilder(list(keywords)).build().findall(text)
+        ac = self._build_encoded(keywords, offsets='characters')
+        self.assertEqual(ac.findall(data), expected)
+        self.assertEqual(ac.filefindall(_BytesIO(data)), expected)
+        self.assertEqual(ac.findall_parallel(data, workers=3), expected)
+        stream = ac.stream()
+        found = []
+        for i in range(0, len(data), 1000):
+            found.extend(stream.feed(data[i:i+1000]))
+        self.assertEqual(found, expected)
+
+    def test_encoded_text_keywords_report(self):
+        builder = acora.AcoraBuilder()
+        builder.add(unescape_unicode('\\u00e4'), value=1)
+        builder.add('b', value=2)
+        data = unescape_unicode('\\u00e4b\\u00e4').encode('utf-8')
+        ac = builder.build(acora=self.acora, encoding='utf-8', report='value', offsets='characters')
+        self.assertEqual(ac.findall(data), [(1, 0), (2, 1), (1, 2)])
+        self.assertEqual(ac.count_by_keyword(data), {1: 2, 2: 1})
+        ac = builder.build(acora=self.acora, encoding='utf-8', report='id')
+        self.assertEqual(ac.keywords, ('b', unescape_unicode('\\u00e4')))
+        self.assertEqual(ac.values, (2, 1))
+        self.assertEqual(ac.findall(data), [(1, 0), (0, 2), (1, 3)])
+
+    def test_encoded_text_keywords_ignore_case(self):
+        keywords = ['abc', unescape_unicode('\\u20acx')]
+        data = unescape_unicode('x\\u20acX ABC aBc').encode('utf-8')
+        builder = acora.AcoraBuilder(*keywords)
+        ac = builder.build(ignore_case=True, acora=self.acora, encoding='utf-8', offsets='characters')
+        self.assertEqual(ac.findall(data), [(keywords[1], 1), ('abc', 4), ('abc', 8)])
+        # only ASCII letters are case folded in byte data
+        builder = acora.AcoraBuilder(unescape_unicode('\\u00e4b'), ignore_case=True)
+        self.assertRaises(ValueError, builder.build, acora=self.acora, encoding='utf-8')
+
+    def test_encoded_text_keywords_invalid_options(self):
+        builder = acora.AcoraBuilder('abc')
+        self.assertRaises(ValueError, builder.build, acora=self.acora, encoding='latin-1')
+        self.assertRaises(ValueError, builder.build, acora=self.acora, offsets='characters')
+        self.assertRaises(ValueError, builder.build, acora=self.acora, encoding='utf-8', offsets='words')
+        builder = acora.AcoraBuilder(b'abc')
+        self.assertRaises(ValueError, builder.build, acora=self.acora, encoding='utf-8')
+
+    def test_save_load_encoded_text_keywords(self):
+        import os
+        import pickle
+        import tempfile
+        keywords = [unescape_unicode(k) for k in ['\\u00e4b', 'b', '\\u20ac']]
+        data = unescape_unicode('x\\u00e4b\\u20ac').encode('utf-8')
+        for offsets, expected in [('bytes', [(keywords[0], 1), ('b', 3), (keywords[2], 4)]),
+                                  ('characters', [(keywords[0], 1), ('b', 2), (keywords[2], 3)])]:
+            ac = self._build_encoded(keywords, offsets=offsets)
+            self.assertEqual(ac.findall(data), expected)
+            self.assertEqual(pickle.loads(pickle.dumps(ac)).findall(data), expected)
+            fd, filename = tempfile.mkstemp()
+            try:
+                os.close(fd)
+                ac.save(filename)
+                loaded = self.acora.load(filename)
+                self.assertEqual(loaded.keywords, ac.keywords)
+                self.assertEqual(loaded.findall(data), expected)
+                del loaded
+            finally:
+                os.unlink(filename)
+
     def test_filefind_empty(self):
         filefind= self._build().filefind
         data = BytesIO(self.search_string)
@@ -407,6 +1232,114 @@ class BytesAcoraTest(unittest.TestCase, AcoraTest):
         result = self._search_in_file(ac, self.simple_data)
         self.assertEqual(result, self.expected_result)
 
+    def test_findall_buffers(self):
+        from array import array
+        ac = self._build(*self.simple_kwds)
+        data = self.simple_data.encode('ASCII')
+        self.assertEqual(ac.findall(bytearray(data)), self.expected_result)
+        self.assertEqual(ac.findall(memoryview(data)), self.expected_result)
+        self.assertEqual(ac.findall(array('B', data)), self.expected_result)
+        keyword_ids, offsets = ac.findall_arrays(bytearray(data))
+        self.assertEqual(list(offsets), [pos for _, pos in self.expected_result])
+        scanner = ac.stream()
+        found = scanner.feed(bytearray(data[:10])) + scanner.feed(memoryview(data)[10:])
+        self.assertEqual(found, self.expected_result)
+
+    @unittest.skipIf(sys.version_info < (3, 6), "requires async generators")
+    def test_afind_stream_reader(self):
+        import asyncio
+        from acora import _aio
+        ac = self._build(*self.all_keywords)
+        data = self.search_string[:100000].encode('ASCII')
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            reader = asyncio.StreamReader(limit=1000)
+            reader.feed_data(data)
+            reader.feed_eof()
+            # search large chunks in a thread
+            found = run_async_iterator(
+                _aio.afind(ac, reader, read_size=50000, thread_chunk_size=10000), loop)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual(found, ac.findall(data))
+
+    def test_findall_memoryview_slice(self):
+        ac = self._build(*self.simple_kwds)
+        data = memoryview(self.simple_data.encode('ASCII'))[1:]
+        self.assertEqual(
+            ac.findall(data), [(kw, pos - 1) for kw, pos in self.expected_result[1:]])
+
+    def test_finditer_mmap(self):
+        import mmap
+        import tempfile
+        ac = self._build(*self.simple_kwds)
+        with tempfile.TemporaryFile() as f:
+            f.write(self.simple_data.encode('ASCII'))
+            f.flush()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                result = list(ac.finditer(mapped))
+            finally:
+                mapped.close()
+        self.assertEqual(result, self.expected_result)
+
+    def test_findall_non_contiguous_buffer(self):
+        ac = self._build(*self.simple_kwds)
+        data = memoryview(self.simple_data.encode('ASCII'))[::2]
+        self.assertRaises((BufferError, TypeError, ValueError), ac.findall, data)
+
+    def test_file_searching_from_position(self):
+        import tempfile
+        ac = self._build(*self.simple_kwds)
+        data = self.simple_data.encode('ASCII')
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(0)
+            self.assertEqual(f.read(2), data[:2])
+            result = list(ac.filefind(f))
+            self.assertEqual(f.read(), b'')
+        self.assertEqual(result, [(kw, pos - 2) for kw, pos in self.expected_result[1:]])
+
+    def test_file_searching_by_name(self):
+        import os
+        import tempfile
+        ac = self._build(*self.simple_kwds)
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.simple_data.encode('ASCII'))
+            self.assertEqual(ac.filefindall(filename), self.expected_result)
+        finally:
+            os.remove(filename)
+
+    def test_empty_file_searching(self):
+        import tempfile
+        ac = self._build(*self.simple_kwds)
+        with tempfile.TemporaryFile() as f:
+            self.assertEqual(ac.filefindall(f), [])
+
+    def test_pipe_searching(self):
+        import os
+        import threading
+        ac = self._build(*self.simple_kwds)
+        read_fd, write_fd = os.pipe()
+        data = self.simple_data.encode('ASCII')
+
+        def write_data():
+            with os.fdopen(write_fd, 'wb') as f:
+                f.write(data)
+
+        writer = threading.Thread(target=write_data)
+        writer.start()
+        try:
+            with os.fdopen(read_fd, 'rb') as f:
+                result = ac.filefindall(f)
+        finally:
+            writer.join()
+        self.assertEqual(result, self.expected_result)
+
     def test_binary_data_search(self):
         pattern = self._swrap('\xa5\x66\x80')
         ac = self._build(pattern)
@@ -421,6 +1354,26 @@ class BytesAcoraTest(unittest.TestCase, AcoraTest):
         result = ac.findall(mainString)
         self.assertEqual(result, [(pattern, 0)])
 
+    def test_all_byte_values(self):
+        all_bytes = bytes(bytearray(range(256)))
+        keywords = [all_bytes[i:i+1] for i in range(256)] + [all_bytes[i:i+3] for i in range(0, 256, 7)]
+        ac = self._build(*keywords)
+        result = ac.findall(all_bytes[::-1] + all_bytes)
+        self.assertEqual(len(result), 512 + len(keywords) - 256)
+        self.assertEqual(result[:2], [(all_bytes[255:], 0), (all_bytes[254:255], 1)])
+
+    def test_prefilter_first_bytes(self):
+        s = self._swrap
+        for keywords in (['xy'], ['xy', 'zx'], ['xy', 'zx', 'qz'], ['xy', 'zx', 'qz', 'a', 'rq']):
+            ac = self._build(*keywords)
+            for filler_length in range(0, 20):
+                filler = '.' * filler_length
+                data = s(filler + 'zxy' + filler + 'qzxyrq' + filler + 'xy')
+                expected = sorted(
+                    (s(kw), pos) for kw in keywords
+                    for pos in range(len(data)) if data.startswith(s(kw), pos))
+                self.assertEqual(sorted(ac.findall(data)), expected)
+
     def test_binary_data_search_end(self):
         pattern = self._swrap('\xa5\x66\x80')
         ac = self._build(pattern)
@@ -429,6 +1382,115 @@ class BytesAcoraTest(unittest.TestCase, AcoraTest):
         self.assertEqual(result, [(pattern, 10)])
 
 
+class SparseBytesAcoraTest(BytesAcoraTest):
+    build_options = {'layout': 'sparse'}
+
+    def test_layout(self):
+        ac = self._build('abc', 'bcd')
+        if not isinstance(ac, acora.PyAcora):
+            self.assertEqual(ac.layout, 'sparse')
+
+
+class DenseBytesAcoraTest(BytesAcoraTest):
+    build_options = {'layout': 'dense'}
+
+    def test_layout(self):
+        ac = self._build('abc', 'bcd')
+        if not isinstance(ac, acora.PyAcora):
+            self.assertEqual(ac.layout, 'dense')
+
+    def test_layout_auto(self):
+        builder = acora.AcoraBuilder([self._swrap(s) for s in self.all_keywords])
+        ac = builder.build(acora=self.acora)
+        if not isinstance(ac, acora.PyAcora):
+            self.assertEqual(ac.layout, 'dense')
+
+    def test_same_result_as_sparse(self):
+        keywords = [self._swrap(s) for s in self.all_keywords]
+        data = self._swrap(self.search_string)
+        builder = acora.AcoraBuilder(*keywords)
+        self.assertEqual(
+            builder.build(acora=self.acora, layout='dense').findall(data),
+            builder.build(acora=self.acora, layout='sparse').findall(data))
+
+    def test_pickle_layout(self):
+        import pickle
+        ac = self._build('abc', 'bcd')
+        ac2 = pickle.loads(pickle.dumps(ac))
+        if not isinstance(ac, acora.PyAcora):
+            self.assertEqual(ac2.layout, 'dense')
+        self.assertEqual(ac2.findall(self._swrap('abcd')), ac.findall(self._swrap('abcd')))
+
+    def test_invalid_layout(self):
+        builder = acora.AcoraBuilder(self._swrap('abc'))
+        if self.acora is not acora.PyAcora:
+            self.assertRaises(ValueError, builder.build, acora=self.acora, layout='unknown')
+
+
+class SkipBytesAcoraTest(BytesAcoraTest):
+    from acora import SkipBytesAcora as acora
+
+    def _random_long_keywords(self, seed, ignore_case=False):
+        import random
+        rand = random.Random(seed)
+        letters = b'abcdAB' if ignore_case else b'abcd'
+        keywords = set(
+            bytes(bytearray(rand.choice(letters) for _ in range(rand.randint(6, 12))))
+            for _ in range(50))
+        data = bytearray(rand.choice(letters + b'xyz') for _ in range(5000))
+        for keyword in rand.sample(sorted(keywords), 20):
+            position = rand.randint(0, len(data))
+            data[position:position] = keyword
+        return keywords, bytes(data)
+
+    def test_window(self):
+        if self.acora is acora.PyAcora:
+            return
+        self.assertEqual(self._build('abcdef', 'bcdefgh').window, 6)
+        self.assertEqual(self._build('abcdef', 'bcd').window, 0)
+
+    def test_same_result_as_bytes_acora(self):
+        for ignore_case in (False, True):
+            keywords, data = self._random_long_keywords(3, ignore_case)
+            builder = acora.AcoraBuilder(*keywords, ignore_case=ignore_case)
+            for layout in ('dense', 'sparse'):
+                expected = builder.build(acora=acora.BytesAcora, layout=layout)
+                ac = builder.build(acora=self.acora, layout=layout)
+                for mode in ('overlapping', 'leftmost_longest', 'non_overlapping'):
+                    self.assertEqual(ac.findall(data, mode), expected.findall(data, mode))
+                self.assertEqual(
+                    ac.filefindall(BytesIO(data)), expected.filefindall(BytesIO(data)))
+
+    def test_stream_same_result_as_bytes_acora(self):
+        keywords, data = self._random_long_keywords(5)
+        builder = acora.AcoraBuilder(*keywords)
+        expected = builder.build(acora=acora.BytesAcora).findall(data)
+        stream = builder.build(acora=self.acora).stream()
+        matches = []
+        for start in range(0, len(data), 7):
+            matches.extend(stream.feed(data[start:start + 7]))
+        self.assertEqual(matches, expected)
+
+    def test_pickle_load_class(self):
+        import os
+        import pickle
+        import tempfile
+        if self.acora is acora.PyAcora:
+            return
+        ac = self._build('abcdef', 'bcdefgh')
+        self.assertEqual(type(pickle.loads(pickle.dumps(ac))), self.acora)
+        fd, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                ac.save(f)
+            loaded = self.acora.load(filename, mmap=False)
+            self.assertEqual(loaded.window, 6)
+            self.assertEqual(
+                loaded.findall(b'xabcdefgh'), [(b'abcdef', 1), (b'bcdefgh', 2)])
+        finally:
+            os.remove(filename)
+
+
 class PyUnicodeAcoraTest(UnicodeAcoraTest):
     from acora import PyAcora as acora
 
@@ -443,6 +1505,9 @@ def suite():
         unittest.defaultTestLoader.loadTestsFromTestCase(UnicodeAcoraTest),
         unittest.defaultTestLoader.loadTestsFromTestCase(PyUnicodeAcoraTest),
         unittest.defaultTestLoader.loadTestsFromTestCase(BytesAcoraTest),
+        unittest.defaultTestLoader.loadTestsFromTestCase(SparseBytesAcoraTest),
+        unittest.defaultTestLoader.loadTestsFromTestCase(DenseBytesAcoraTest),
+        unittest.defaultTestLoader.loadTestsFromTestCase(SkipBytesAcoraTest),
         unittest.defaultTestLoader.loadTestsFromTestCase(PyBytesAcoraTest),
         doctest.DocTestSuite(),
         doctest.DocFileSuite('README.rst'),